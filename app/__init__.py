@@ -1,10 +1,11 @@
 import os
 import sqlite3
-from flask import Flask, render_template, session
-from config import Config
+from flask import Flask, render_template
+from config import Config, secreto_local
+from . import migraciones
 
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     app.config.from_object(Config)
 
@@ -16,18 +17,23 @@ def create_app():
 
     # ✅ Esto es CLAVE: routes.py usa current_app.config["DATABASE"]
     app.config["DATABASE"] = db_path
+    app.config["STAFF_DATABASE"] = os.path.join(base_dir, "database", "empleados.db")
+
+    # ✅ Overrides (bench/ apunta a una gadget.db de pruebas)
+    if config:
+        app.config.update(config)
+        db_path = app.config["DATABASE"]
+
+    # ✅ SECRET_KEY del entorno o, si no hay, una aleatoria de esta instalación (fuera de git)
+    if not app.config["SECRET_KEY"]:
+        app.config["SECRET_KEY"] = secreto_local(os.path.dirname(db_path), "secret-key")
 
     # ✅ contador de carrito global para base.html
+    # (lee carritos.piezas una vez por request, ver app/carrito_store.py)
     @app.context_processor
     def inject_cart_count():
-        carrito = session.get("carrito", [])
-        cart_count = 0
-        for i in carrito:
-            try:
-                cart_count += int(i.get("cantidad", 1))
-            except:
-                cart_count += 1
-        return dict(cart_count=cart_count)
+        from .carrito_store import contar_piezas
+        return dict(cart_count=contar_piezas())
 
     def init_db():
         if not os.path.exists(db_path):
@@ -46,7 +52,78 @@ def create_app():
             conn.close()
             print("✔ Base de datos creada exitosamente.")
 
+        # ✅ Migraciones pendientes (índices, tablas nuevas...) vía PRAGMA user_version
+        migraciones.aplicar_migraciones(db_path)
+
     init_db()
+    migraciones.init_app(app)
+
+    # ✅ Pool de conexiones (una por request, se libera en teardown)
+    from . import db
+    db.init_app(app)
+
+    # ✅ Métricas por endpoint (/metrics en formato Prometheus)
+    from . import metricas
+    metricas.init_app(app)
+
+    # ✅ Perfilador de SQL (PERFILADOR=1): N+1, consultas lentas, X-Consultas
+    from . import perfilador
+    perfilador.init_app(app)
+
+    # ✅ Cache del catálogo (snapshot + LRU ligado a catalogo_version)
+    from . import catalogo
+    catalogo.init_app(app)
+
+    # ✅ Carrito del lado del servidor (la cookie solo lleva carrito_id)
+    from . import carrito_store
+    carrito_store.init_app(app)
+
+    # ✅ KPIs del dashboard (tablas resumen_* + cache corta)
+    from . import resumenes
+    resumenes.init_app(app)
+
+    # ✅ Inventario por sucursal: stock por sucursal, ajustes y traspasos
+    from . import inventario
+    inventario.init_app(app)
+
+    # ✅ Agenda de citas (/probar-producto): turnos, disponibilidad y reservas
+    from . import agenda
+    agenda.init_app(app)
+
+    # ✅ Login del staff (pool de hash acotado + límite de intentos)
+    from . import auth
+    auth.init_app(app)
+
+    # ✅ CLI: importar/exportar y sincronizar el catálogo
+    from . import importacion
+    importacion.init_app(app)
+
+    from . import sincronizacion
+    sincronizacion.init_app(app)
+
+    # ✅ Miniaturas WebP/JPEG de productos (flask procesar-imagenes)
+    from . import imagenes
+    imagenes.init_app(app)
+
+    # ✅ Proxy con cache en disco para url_imagen remotas (/img/r/...)
+    from . import proxy_imagenes
+    proxy_imagenes.init_app(app)
+
+    # ✅ CSS/JS con huella + .gz/.br (manifest de flask compilar-estaticos)
+    from . import estaticos
+    estaticos.init_app(app)
+
+    # ✅ ETag/Last-Modified y 304 en / y /productos (versión del catálogo + carrito)
+    from . import condicional
+    condicional.init_app(app)
+
+    # ✅ Cache de fragmentos renderizados ({% cache %} en tarjetas y resultados)
+    from . import fragmentos
+    fragmentos.init_app(app)
+
+    # ✅ Producción: gunicorn con preload (gunicorn.conf.py) + flask recargar-servidor
+    from . import arranque
+    arranque.init_app(app)
 
     from .routes import main
     app.register_blueprint(main)
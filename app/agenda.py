@@ -0,0 +1,415 @@
+import bisect
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from itertools import accumulate
+
+import click
+from flask import current_app
+
+from .catalogo import obtener_snapshot
+from .checkout import CLIENTE_PUBLICO_ID, _es_busy
+from .db import get_conn, get_staff_conn
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # pragma: no cover - Python < 3.9
+    ZoneInfo = None
+
+# =========================================================
+# AGENDA DE CITAS PARA PROBAR PRODUCTOS (/probar-producto)
+# - Turnos por empleado, sucursal y día de la semana en
+#   horarios_empleado (migración 9, hora local de la tienda). Sin turnos
+#   cargados se usa el horario de la tienda (CITAS_HORARIO_TIENDA) con
+#   los empleados de CITAS_ROLES repartidos entre sucursales;
+#   flask sembrar-horarios los deja en la tabla para editarlos.
+# - citas.fecha_hora / fin en UTC. Disponibilidad de un día: las citas
+#   del día salen de un rango sobre idx_citas_fecha (no se recorre la
+#   tabla) y por empleado quedan en un IndiceIntervalos (bisect), así
+#   cada horario candidato se revisa en O(log n).
+# - El resultado por (sucursal, día) se cachea ligado a agenda_version
+#   (la suben triggers en citas y horarios_empleado).
+# - Reservar corre en BEGIN IMMEDIATE: se vuelve a revisar el empalme
+#   con el índice (empleado_id, fecha_hora) dentro de la transacción,
+#   así dos visitantes nunca se quedan con el mismo empleado y horario.
+# =========================================================
+
+
+class CitaInvalida(ValueError):
+    pass
+
+
+class CitaNoDisponible(Exception):
+    def __init__(self, sucursal, fecha, hora):
+        super().__init__(f"Ya no hay lugar en {sucursal} el {fecha} a las {hora}")
+        self.sucursal = sucursal
+        self.fecha = fecha
+        self.hora = hora
+
+
+_HORA = re.compile(r"^([01]\d|2[0-3]):([0-5]\d)$")
+_FORMATO_BD = "%Y-%m-%d %H:%M:%S"
+
+
+def _minutos(hora):
+    """'HH:MM' -> minutos desde medianoche."""
+    m = _HORA.match(hora or "")
+    if not m:
+        raise CitaInvalida(f"Hora inválida: {hora!r}")
+    return int(m.group(1)) * 60 + int(m.group(2))
+
+
+def _hora(minutos):
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+def _a_bd(dt):
+    return dt.astimezone(timezone.utc).strftime(_FORMATO_BD)
+
+
+def _de_bd(texto):
+    return datetime.strptime(texto[:19], _FORMATO_BD).replace(tzinfo=timezone.utc)
+
+
+class IndiceIntervalos:
+    """Intervalos [inicio, fin) ordenados por inicio; ¿está libre [a, b)? con bisect.
+
+    Con el máximo acumulado de los fines basta revisar los que empiezan
+    antes de `b` (aunque alguno viejo se enciman con otro).
+    """
+
+    __slots__ = ("inicios", "max_fin")
+
+    def __init__(self, intervalos=()):
+        orden = sorted(intervalos)
+        self.inicios = [a for a, _ in orden]
+        self.max_fin = list(accumulate((b for _, b in orden), max))
+
+    def libre(self, inicio, fin):
+        i = bisect.bisect_left(self.inicios, fin)  # los que empiezan antes de `fin`
+        return i == 0 or self.max_fin[i - 1] <= inicio
+
+    def __len__(self):
+        return len(self.inicios)
+
+
+class Agenda:
+    def __init__(self, sucursales, zona="America/Mexico_City", duracion=60, intervalo=60,
+                 anticipacion=60, dias_max=30, max_productos=3, horario_tienda=None,
+                 roles=("empleado",), cache_max=256):
+        self.sucursales = tuple(sucursales)
+        self.zona = _zona(zona)
+        self.duracion = int(duracion)
+        self.intervalo = int(intervalo)
+        self.anticipacion = int(anticipacion)
+        self.dias_max = int(dias_max)
+        self.max_productos = int(max_productos)
+        self.horario_tienda = dict(horario_tienda or {})
+        self.roles = tuple(roles)
+        self.cache_max = int(cache_max)
+
+        self._lock = threading.Lock()
+        self._dias = OrderedDict()  # (sucursal, fecha) -> {hora: (empleado_id, ...)}
+        self._version = None
+        self._por_defecto = None    # (version, turnos) cuando horarios_empleado está vacía
+
+        self.hits = 0
+        self.misses = 0
+        self.reservas = 0
+        self.rechazos = 0
+
+    # ---------- fechas ----------
+    def ahora(self):
+        return datetime.now(self.zona)
+
+    def local(self, texto_bd):
+        """TIMESTAMP UTC de la BD -> datetime en la zona de la tienda."""
+        return _de_bd(texto_bd).astimezone(self.zona)
+
+    def _inicio(self, fecha, minutos):
+        return datetime.combine(fecha, datetime.min.time(), self.zona) + timedelta(minutes=minutos)
+
+    def rango_bd(self, desde, hasta):
+        """Días locales [desde, hasta) -> (inicio, fin) en UTC, comparables con los TIMESTAMP de la BD."""
+        return _a_bd(self._inicio(desde, 0)), _a_bd(self._inicio(hasta, 0))
+
+    def validar_fecha(self, fecha):
+        if isinstance(fecha, str):
+            try:
+                fecha = date.fromisoformat(fecha)
+            except ValueError:
+                raise CitaInvalida(f"Fecha inválida: {fecha!r}") from None
+        hoy = self.ahora().date()
+        if not hoy <= fecha <= hoy + timedelta(days=self.dias_max):
+            raise CitaInvalida(f"Solo se agenda de hoy a {self.dias_max} días")
+        return fecha
+
+    def validar_sucursal(self, sucursal):
+        if sucursal not in self.sucursales:
+            raise CitaInvalida(f"Sucursal desconocida: {sucursal!r}")
+        return sucursal
+
+    # ---------- versión + cache por día ----------
+    def version(self, conn):
+        row = conn.execute("SELECT version FROM agenda_version WHERE id = 1").fetchone()
+        version = int(row[0]) if row else 0
+        with self._lock:
+            if version != self._version:
+                self._dias.clear()
+                self._version = version
+        return version
+
+    # ---------- turnos ----------
+    def _turnos_por_defecto(self, version):
+        """Horario de la tienda para los empleados de `roles`, repartidos entre sucursales."""
+        with self._lock:
+            if self._por_defecto and self._por_defecto[0] == version:
+                return self._por_defecto[1]
+        marcas = ",".join("?" * len(self.roles))
+        empleados = [
+            int(r[0]) for r in get_staff_conn().execute(
+                f"SELECT id FROM empleados WHERE rol IN ({marcas}) ORDER BY id", self.roles
+            )
+        ]
+        turnos = [
+            (empleado_id, self.sucursales[i % len(self.sucursales)], int(dia), inicio, fin)
+            for i, empleado_id in enumerate(empleados)
+            for dia, (inicio, fin) in sorted(self.horario_tienda.items())
+        ]
+        with self._lock:
+            self._por_defecto = (version, turnos)
+        return turnos
+
+    def turnos(self, conn, sucursal, dia_semana, version):
+        """[(empleado_id, inicio_min, fin_min)] de la sucursal ese día de la semana."""
+        filas = conn.execute("""
+            SELECT empleado_id, inicio, fin FROM horarios_empleado
+            WHERE sucursal = ? AND dia_semana = ?
+            ORDER BY empleado_id, inicio
+        """, (sucursal, dia_semana)).fetchall()
+        if not filas and conn.execute("SELECT 1 FROM horarios_empleado LIMIT 1").fetchone() is None:
+            filas = [(e, i, f) for e, s, d, i, f in self._turnos_por_defecto(version)
+                     if s == sucursal and d == dia_semana]
+        return [(int(e), _minutos(i), _minutos(f)) for e, i, f in filas]
+
+    # ---------- disponibilidad ----------
+    def _ocupados(self, conn, fecha):
+        """{empleado_id: IndiceIntervalos} con las citas vivas que tocan ese día (minutos locales)."""
+        inicio_dia = self._inicio(fecha, 0)
+        desde = _a_bd(inicio_dia - timedelta(days=1))  # una cita de ayer que cruce la medianoche
+        hasta = _a_bd(inicio_dia + timedelta(days=1))
+        por_empleado = {}
+        for r in conn.execute("""
+            SELECT empleado_id, fecha_hora, fin FROM citas
+            WHERE fecha_hora >= ? AND fecha_hora < ? AND estado != 'cancelada' AND empleado_id IS NOT NULL
+        """, (desde, hasta)):
+            a = (_de_bd(r[1]) - inicio_dia).total_seconds() // 60
+            b = (_de_bd(r[2]) - inicio_dia).total_seconds() // 60 if r[2] else a + self.duracion
+            por_empleado.setdefault(int(r[0]), []).append((int(a), int(b)))
+        return {e: IndiceIntervalos(v) for e, v in por_empleado.items()}
+
+    def _calcular_dia(self, conn, sucursal, fecha, version):
+        ocupados = self._ocupados(conn, fecha)
+        vacio = IndiceIntervalos()
+        horarios = {}
+        for empleado_id, inicio, fin in self.turnos(conn, sucursal, fecha.weekday(), version):
+            indice = ocupados.get(empleado_id, vacio)
+            for t in range(inicio, fin - self.duracion + 1, self.intervalo):
+                if indice.libre(t, t + self.duracion):
+                    horarios.setdefault(t, []).append(empleado_id)
+        return {_hora(t): tuple(horarios[t]) for t in sorted(horarios)}
+
+    def dia(self, conn, sucursal, fecha):
+        """{'HH:MM': (empleado_id libres...)} de la sucursal en ese día (cacheado por versión)."""
+        version = self.version(conn)
+        clave = (sucursal, fecha)
+        with self._lock:
+            valor = self._dias.get(clave)
+            if valor is not None:
+                self._dias.move_to_end(clave)
+                self.hits += 1
+                return valor
+            self.misses += 1
+        valor = self._calcular_dia(conn, sucursal, fecha, version)
+        with self._lock:
+            if version == self._version:
+                self._dias[clave] = valor
+                while len(self._dias) > self.cache_max:
+                    self._dias.popitem(last=False)
+        return valor
+
+    def disponibilidad(self, conn, sucursal, fecha):
+        """[{'hora', 'libres'}] aún reservables (quita lo que ya pasó o está muy cerca)."""
+        fecha = self.validar_fecha(fecha)
+        limite = self.ahora() + timedelta(minutes=self.anticipacion)
+        return [
+            {"hora": hora, "libres": len(empleados)}
+            for hora, empleados in self.dia(conn, self.validar_sucursal(sucursal), fecha).items()
+            if self._inicio(fecha, _minutos(hora)) >= limite
+        ]
+
+    # ---------- reservar ----------
+    def productos_de(self, texto):
+        """Ids del catálogo a partir de "iPhone 15, Galaxy S24" (máximo max_productos)."""
+        piezas = [p.strip() for p in re.split(r"[,\n;]+", texto or "") if p.strip()]
+        if len(piezas) > self.max_productos:
+            raise CitaInvalida(f"Máximo {self.max_productos} productos por cita")
+        productos = obtener_snapshot().productos
+        ids = []
+        for pieza in piezas:
+            buscado = pieza.lower()
+            encontrado = next((p for p in productos if p["nombre"].lower() == buscado), None)
+            if encontrado is None and len(buscado) >= 3:
+                encontrado = next((p for p in productos if buscado in p["nombre"].lower()), None)
+            if encontrado is not None and encontrado["id"] not in ids:
+                ids.append(int(encontrado["id"]))
+        return ids
+
+    def _reservar(self, conn, sucursal, fecha, minutos, cliente, productos, notas):
+        inicio = self._inicio(fecha, minutos)
+        fin = inicio + timedelta(minutes=self.duracion)
+        inicio_bd, fin_bd = _a_bd(inicio), _a_bd(fin)
+
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            version = int(cur.execute("SELECT version FROM agenda_version WHERE id = 1").fetchone()[0])
+            candidatos = [
+                e for e, a, b in self.turnos(conn, sucursal, fecha.weekday(), version)
+                if a <= minutos and minutos + self.duracion <= b and (minutos - a) % self.intervalo == 0
+            ]
+            if not candidatos:
+                raise CitaInvalida(f"{sucursal} no atiende el {fecha} a las {_hora(minutos)}")
+
+            # el que tiene menos citas ese día primero: reparte la carga
+            carga = dict(cur.execute("""
+                SELECT empleado_id, COUNT(*) FROM citas
+                WHERE fecha_hora >= ? AND fecha_hora < ? AND estado != 'cancelada'
+                GROUP BY empleado_id
+            """, (_a_bd(self._inicio(fecha, 0)), _a_bd(self._inicio(fecha, 24 * 60)))).fetchall())
+            empleado_id = None
+            for e in sorted(set(candidatos), key=lambda e: (carga.get(e, 0), e)):
+                empalme = cur.execute("""
+                    SELECT 1 FROM citas
+                    WHERE empleado_id = ? AND estado != 'cancelada'
+                      AND fecha_hora >= datetime(?, '-1 day') AND fecha_hora < ? AND fin > ?
+                    LIMIT 1
+                """, (e, inicio_bd, fin_bd, inicio_bd)).fetchone()
+                if empalme is None:
+                    empleado_id = e
+                    break
+            if empleado_id is None:
+                raise CitaNoDisponible(sucursal, fecha.isoformat(), _hora(minutos))
+
+            cur.execute("""
+                INSERT INTO citas (usuario_id, empleado_id, fecha_hora, fin, estado, sucursal,
+                                   nombre_cliente, correo, telefono, notas)
+                VALUES (?, ?, ?, ?, 'pendiente', ?, ?, ?, ?, ?)
+            """, (cliente.get("usuario_id", CLIENTE_PUBLICO_ID), empleado_id, inicio_bd, fin_bd, sucursal,
+                  cliente.get("nombre"), cliente.get("correo"), cliente.get("telefono"), notas))
+            cita_id = cur.lastrowid
+            cur.executemany(
+                "INSERT INTO cita_productos (cita_id, producto_id) VALUES (?, ?)",
+                [(cita_id, p) for p in productos],
+            )
+            conn.commit()
+            return cita_id
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def reservar(self, conn, sucursal, fecha, hora, cliente, productos=(), notas=None,
+                 reintentos=5, espera_base=0.02):
+        """Agenda la cita con el primer empleado libre. Regresa el id de la cita.
+
+        Lanza CitaInvalida (datos, fuera de horario) o CitaNoDisponible
+        (alguien ganó el horario) sin modificar nada.
+        """
+        sucursal = self.validar_sucursal(sucursal)
+        fecha = self.validar_fecha(fecha)
+        minutos = _minutos(hora)
+        if self._inicio(fecha, minutos) < self.ahora() + timedelta(minutes=self.anticipacion):
+            raise CitaInvalida(f"Las citas se agendan con al menos {self.anticipacion} minutos de anticipación")
+        if len(productos) > self.max_productos:
+            raise CitaInvalida(f"Máximo {self.max_productos} productos por cita")
+
+        for intento in range(reintentos + 1):
+            try:
+                cita_id = self._reservar(conn, sucursal, fecha, minutos, cliente, productos, notas)
+                with self._lock:
+                    self.reservas += 1
+                return cita_id
+            except CitaNoDisponible:
+                with self._lock:
+                    self.rechazos += 1
+                raise
+            except sqlite3.OperationalError as e:
+                if not _es_busy(e) or intento == reintentos:
+                    raise
+                time.sleep(espera_base * (2 ** intento) * (1 + random.random()))
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "version": self._version,
+                "dias_cacheados": len(self._dias),
+                "hits": self.hits,
+                "misses": self.misses,
+                "reservas": self.reservas,
+                "rechazos": self.rechazos,
+            }
+
+
+def _zona(nombre):
+    if ZoneInfo is not None:
+        try:
+            return ZoneInfo(nombre)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    return timezone(timedelta(hours=-6), nombre)  # CDMX sin horario de verano desde 2022
+
+
+def agenda():
+    return current_app.extensions["agenda"]
+
+
+def estadisticas_agenda():
+    return agenda().estadisticas()
+
+
+def init_app(app):
+    app.extensions["agenda"] = Agenda(
+        app.config["CITAS_SUCURSALES"],
+        zona=app.config["CITAS_ZONA_HORARIA"],
+        duracion=app.config["CITAS_DURACION_MIN"],
+        intervalo=app.config["CITAS_INTERVALO_MIN"],
+        anticipacion=app.config["CITAS_ANTICIPACION_MIN"],
+        dias_max=app.config["CITAS_DIAS_MAX"],
+        max_productos=app.config["CITAS_MAX_PRODUCTOS"],
+        horario_tienda=app.config["CITAS_HORARIO_TIENDA"],
+        roles=app.config["CITAS_ROLES"],
+        cache_max=app.config["CITAS_CACHE_MAX"],
+    )
+
+    @app.cli.command("sembrar-horarios")
+    @click.option("--reemplazar", is_flag=True, help="Borra los turnos actuales antes de sembrar.")
+    def sembrar_horarios(reemplazar):
+        """Carga en horarios_empleado el horario de la tienda para los empleados de CITAS_ROLES."""
+        conn = get_conn()
+        a = app.extensions["agenda"]
+        if reemplazar:
+            conn.execute("DELETE FROM horarios_empleado")
+        elif conn.execute("SELECT 1 FROM horarios_empleado LIMIT 1").fetchone():
+            raise click.ClickException("horarios_empleado ya tiene turnos (usa --reemplazar)")
+        turnos = a._turnos_por_defecto(version=None)
+        conn.executemany("""
+            INSERT OR REPLACE INTO horarios_empleado (empleado_id, sucursal, dia_semana, inicio, fin)
+            VALUES (?, ?, ?, ?, ?)
+        """, turnos)
+        conn.commit()
+        click.echo(f"✔ {len(turnos)} turnos para {len({t[0] for t in turnos})} empleados "
+                   f"en {', '.join(a.sucursales)}")
@@ -0,0 +1,202 @@
+import gc
+import importlib.util
+import os
+import shutil
+import signal
+import sys
+import sysconfig
+import time
+
+import click
+
+from .catalogo import obtener_snapshot
+from .db import get_conn
+
+# =========================================================
+# ARRANQUE EN PRODUCCIÓN
+#   python run.py                       (= gunicorn -c gunicorn.conf.py)
+#   python run.py --dev                 (servidor de desarrollo, debug + reloader)
+# - preload_app: create_app() corre UNA vez en el maestro (init_db,
+#   migraciones, manifest de estáticos, versión del deploy) y los workers
+#   salen de un fork, compartiendo esa memoria.
+# - preparar_maestro() calienta en el maestro lo que todos los workers
+#   van a pedir (snapshot del catálogo, PRAGMA optimize), cierra las
+#   conexiones SQLite (una conexión no debe cruzar un fork) y congela el
+#   GC para que los workers no copien páginas que solo leen.
+# - Workers = CPUs disponibles (WEB_CONCURRENCY para fijarlo). Cada uno
+#   se recicla tras SERVIDOR_MAX_REQUESTS (+ jitter) para contener el
+#   crecimiento de memoria; antes de salir vuelca sus métricas.
+# - Recargas sin tirar conexiones (el socket nunca se cierra):
+#     kill -HUP <maestro>       workers nuevos, mismo código (con preload
+#                               el código no se relee)
+#     flask recargar-servidor   código nuevo: USR2 levanta un maestro con
+#                               lo que hay en disco; cuando tiene workers,
+#                               TERM al viejo, que termina lo que atiende
+#                               (SERVIDOR_GRACEFUL_TIMEOUT).
+# - Sin gunicorn (Windows) cae a un servidor con hilos de werkzeug, de
+#   un solo proceso y sin reloader.
+# =========================================================
+
+
+def cpus():
+    """CPUs que este proceso puede usar (respeta cgroups/afinidad en Linux)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def num_workers(configurado=0):
+    return int(configurado) if configurado and int(configurado) > 0 else cpus()
+
+
+def gunicorn_disponible():
+    return os.name == "posix" and importlib.util.find_spec("gunicorn") is not None
+
+
+def _comando_gunicorn():
+    # el script y no "python -m gunicorn": en USR2 gunicorn se re-ejecuta con
+    # el mismo argv y con -m el paquete gunicorn/http tapaba al http de la stdlib
+    script = os.path.join(sysconfig.get_path("scripts"), "gunicorn")
+    if not os.path.exists(script):
+        script = shutil.which("gunicorn")
+    return [script] if script else [sys.executable, "-m", "gunicorn"]
+
+
+def preparar_maestro(app, log=print):
+    """Trabajo de una sola vez antes de crear los workers."""
+    inicio = time.perf_counter()
+    productos = 0
+    if app.config["SERVIDOR_CALENTAR"]:
+        with app.app_context():
+            productos = len(obtener_snapshot().por_id)
+            get_conn().execute("PRAGMA optimize")
+    # al salir del app_context las conexiones regresaron al pool: se cierran
+    for pool in app.extensions.get("sqlite_pools", {}).values():
+        pool.cerrar()
+    gc.collect()
+    gc.freeze()
+    log(f"✔ Maestro listo en {(time.perf_counter() - inicio) * 1000:.0f} ms "
+        f"({productos} productos en el snapshot)")
+
+
+def al_salir_worker(app):
+    """Worker que se recicla o se retira: sus métricas no se pierden."""
+    almacen = app.extensions.get("metricas")
+    if almacen is not None:
+        almacen.volcar()
+
+
+def _host_puerto(bind):
+    host, _, puerto = bind.rpartition(":")
+    return host or "0.0.0.0", int(puerto)
+
+
+def servir_con_hilos(app, bind):
+    """Servidor WSGI con hilos de werkzeug (un proceso). Para donde no hay gunicorn."""
+    from werkzeug.serving import make_server
+
+    host, puerto = _host_puerto(bind)
+    servidor = make_server(host, puerto, app, threaded=True)
+    print(f"➡ Servidor con hilos en http://{host}:{puerto} (sin gunicorn: un solo proceso)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+def lanzar(argumentos=()):
+    """Entrada de `python run.py`."""
+    from . import create_app
+
+    argumentos = list(argumentos)
+    if "--dev" in argumentos:
+        create_app().run(debug=True, port=5000)
+        return
+
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if gunicorn_disponible():
+        # el proceso se reemplaza: create_app() corre una vez, en el maestro de gunicorn
+        comando = _comando_gunicorn()
+        os.execv(comando[0], comando + ["--chdir", raiz, "-c", os.path.join(raiz, "gunicorn.conf.py"), *argumentos])
+
+    app = create_app()
+    preparar_maestro(app)
+    servir_con_hilos(app, app.config["SERVIDOR_BIND"])
+
+
+# =========================================================
+# DESPLIEGUE SIN CORTE (flask recargar-servidor)
+# =========================================================
+
+def _leer_pid(ruta):
+    try:
+        with open(ruta) as f:
+            pid = int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+    return pid if _vivo(pid) else None
+
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _tiene_workers(pid):
+    """¿El maestro ya tiene hijos? Sin /proc (no Linux) se asume que sí."""
+    ruta = f"/proc/{pid}/task/{pid}/children"
+    if not os.path.exists(ruta):
+        return True
+    with open(ruta) as f:
+        return bool(f.read().split())
+
+
+def _esperar(condicion, segundos, paso=0.1):
+    limite = time.monotonic() + segundos
+    while time.monotonic() < limite:
+        if condicion():
+            return True
+        time.sleep(paso)
+    return condicion()
+
+
+def recargar(pidfile, espera=60.0, log=print):
+    """USR2 al maestro actual, espera al nuevo y retira al viejo. Regresa el pid nuevo."""
+    viejo = _leer_pid(pidfile)
+    if viejo is None:
+        raise click.ClickException(f"No hay un maestro de gunicorn vivo en {pidfile}")
+
+    os.kill(viejo, signal.SIGUSR2)
+    log(f"➡ USR2 a {viejo}: levantando un maestro con el código nuevo ...")
+
+    nuevo_pidfile = pidfile + ".2"
+    if not _esperar(lambda: _leer_pid(nuevo_pidfile) is not None, espera):
+        raise click.ClickException(
+            f"El maestro nuevo no levantó en {espera:.0f}s (revisa el log); {viejo} sigue atendiendo"
+        )
+    nuevo = _leer_pid(nuevo_pidfile)
+    if not _esperar(lambda: _tiene_workers(nuevo), espera):
+        raise click.ClickException(f"El maestro {nuevo} no creó workers; {viejo} sigue atendiendo")
+
+    os.kill(viejo, signal.SIGTERM)
+    log(f"➡ TERM a {viejo}: sus workers terminan lo que atienden y salen")
+    if not _esperar(lambda: not _vivo(viejo), espera):
+        log(f"⚠ {viejo} sigue vivo después de {espera:.0f}s")
+    log(f"✔ Atendiendo con el maestro {nuevo}")
+    return nuevo
+
+
+def init_app(app):
+    @app.cli.command("recargar-servidor")
+    @click.option("--espera", default=60.0, show_default=True, help="Segundos máximos por paso.")
+    def recargar_servidor(espera):
+        """Despliega el código del disco sin cortar conexiones (gunicorn USR2 + TERM)."""
+        recargar(app.config["SERVIDOR_PIDFILE"], espera, log=click.echo)
@@ -0,0 +1,286 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
+
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from .db import get_staff_conn
+
+# =========================================================
+# AUTENTICACIÓN DEL STAFF (empleados.db)
+# - El hash (scrypt/pbkdf2) corre en un pool de hilos acotado: como
+#   máximo AUTH_HASH_HILOS logins calculan a la vez y hasta
+#   AUTH_HASH_COLA esperan turno; si la cola está llena se responde
+#   "ocupado" en lugar de acaparar workers del catálogo.
+#   (hashlib suelta el GIL durante scrypt/pbkdf2)
+# - El costo del hash sale de AUTH_HASH_METODO; si un hash guardado usa
+#   otros parámetros se vuelve a generar al iniciar sesión con éxito.
+# - Intentos fallidos limitados por usuario y por IP con ventana
+#   deslizante en memoria (por worker).
+# =========================================================
+
+
+class ColaHashLlena(Exception):
+    pass
+
+
+class DemasiadosIntentos(Exception):
+    def __init__(self, reintentar_en):
+        super().__init__(f"Demasiados intentos, reintentar en {reintentar_en:.0f}s")
+        self.reintentar_en = reintentar_en
+
+
+class EjecutorHash:
+    """Pool de hilos acotado para verificar/generar hashes, con métricas de cola."""
+
+    def __init__(self, hilos=2, cola_max=16, timeout=10.0):
+        self.hilos = max(1, int(hilos))
+        self.cola_max = max(0, int(cola_max))
+        self.timeout = float(timeout)
+
+        self._lock = threading.Lock()
+        self._cupo = threading.BoundedSemaphore(self.hilos + self.cola_max)
+        self._pool = None
+        self._pid = None
+
+        self.pendientes = 0
+        self.max_pendientes = 0
+        self.completados = 0
+        self.rechazados = 0
+        self.espera_total_ms = 0.0
+        self.hash_total_ms = 0.0
+
+    def _executor(self):
+        # después de un fork (gunicorn --preload) los hilos del padre no existen
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(self.hilos, thread_name_prefix="hash")
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _medido(self, encolado, fn, *args):
+        inicio = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            fin = time.perf_counter()
+            with self._lock:
+                self.espera_total_ms += (inicio - encolado) * 1000
+                self.hash_total_ms += (fin - inicio) * 1000
+
+    def _terminado(self, _futuro):
+        with self._lock:
+            self.pendientes -= 1
+            self.completados += 1
+        # el cupo se libera cuando el hash termina, aunque el request ya
+        # se haya rendido por timeout: la cota es real
+        self._cupo.release()
+
+    def ejecutar(self, fn, *args):
+        if not self._cupo.acquire(blocking=False):
+            with self._lock:
+                self.rechazados += 1
+            raise ColaHashLlena()
+
+        with self._lock:
+            self.pendientes += 1
+            self.max_pendientes = max(self.max_pendientes, self.pendientes)
+        try:
+            futuro = self._executor().submit(self._medido, time.perf_counter(), fn, *args)
+        except BaseException:
+            self._terminado(None)
+            raise
+        futuro.add_done_callback(self._terminado)
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FuturoTimeout:
+            futuro.cancel()
+            raise ColaHashLlena()
+
+    def estadisticas(self):
+        with self._lock:
+            hechos = max(1, self.completados)
+            return {
+                "hilos": self.hilos,
+                "cola_max": self.cola_max,
+                "pendientes": self.pendientes,
+                "max_pendientes": self.max_pendientes,
+                "completados": self.completados,
+                "rechazados": self.rechazados,
+                "espera_prom_ms": round(self.espera_total_ms / hechos, 2),
+                "hash_prom_ms": round(self.hash_total_ms / hechos, 2),
+            }
+
+
+class LimitadorIntentos:
+    """Ventana deslizante de intentos fallidos por clave (usuario o IP)."""
+
+    def __init__(self, max_intentos=5, ventana=300.0, max_claves=10000):
+        self.max_intentos = max(1, int(max_intentos))
+        self.ventana = float(ventana)
+        self.max_claves = int(max_claves)
+        self._lock = threading.Lock()
+        self._fallos = {}  # clave -> deque[monotonic]
+        self.bloqueos = 0
+
+    def _recortar(self, fallos, ahora):
+        while fallos and ahora - fallos[0] >= self.ventana:
+            fallos.popleft()
+
+    def espera(self, clave):
+        """Segundos que faltan para poder intentar otra vez (0 si puede)."""
+        ahora = time.monotonic()
+        with self._lock:
+            fallos = self._fallos.get(clave)
+            if not fallos:
+                return 0.0
+            self._recortar(fallos, ahora)
+            if len(fallos) < self.max_intentos:
+                return 0.0
+            return self.ventana - (ahora - fallos[0])
+
+    def fallo(self, clave):
+        ahora = time.monotonic()
+        with self._lock:
+            if len(self._fallos) >= self.max_claves:
+                self._purgar(ahora)
+            fallos = self._fallos.setdefault(clave, deque(maxlen=self.max_intentos))
+            self._recortar(fallos, ahora)
+            fallos.append(ahora)
+            if len(fallos) >= self.max_intentos:
+                self.bloqueos += 1
+
+    def limpiar(self, clave):
+        with self._lock:
+            self._fallos.pop(clave, None)
+
+    def _purgar(self, ahora):
+        for clave in [c for c, f in self._fallos.items() if not f or ahora - f[-1] >= self.ventana]:
+            del self._fallos[clave]
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "claves": len(self._fallos),
+                "max_intentos": self.max_intentos,
+                "ventana_s": self.ventana,
+                "bloqueos": self.bloqueos,
+            }
+
+
+def metodo_efectivo(metodo):
+    """Método de hash con los parámetros que werkzeug usa de verdad.
+
+    "scrypt" y "scrypt:32768:8:1" son el mismo costo, pero el prefijo que
+    werkzeug guarda siempre lleva los parámetros explícitos. Se comparan
+    normalizados para no rehashear en cada login.
+    """
+    nombre, *args = metodo.split(":")
+    if nombre == "scrypt":
+        args = args or ["32768", "8", "1"]  # 2**15, r=8, p=1 (defaults de werkzeug)
+        return ("scrypt", *(int(a) for a in args))
+    if nombre == "pbkdf2":
+        algoritmo = args[0] if args else "sha256"
+        iteraciones = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return ("pbkdf2", algoritmo, iteraciones)
+    return (nombre, *args)
+
+
+class ServicioAuth:
+    def __init__(self, metodo, ejecutor, limitador):
+        self.metodo = metodo
+        self._metodo_efectivo = metodo_efectivo(metodo)
+        self.ejecutor = ejecutor
+        self.limitador = limitador
+        self.rehashes = 0
+        self._hash_falso = None
+
+    def _hash_para_usuario_inexistente(self):
+        # mismo costo que un usuario real: no revela qué usuarios existen
+        if self._hash_falso is None:
+            self._hash_falso = self.ejecutor.ejecutar(generate_password_hash, os.urandom(16).hex(), self.metodo)
+        return self._hash_falso
+
+    def requiere_rehash(self, password_hash):
+        try:
+            guardado = metodo_efectivo(password_hash.split("$", 1)[0])
+        except ValueError:
+            return True
+        return guardado != self._metodo_efectivo
+
+    def generar_hash(self, password):
+        return self.ejecutor.ejecutar(generate_password_hash, password, self.metodo)
+
+    def autenticar(self, usuario, password, ip):
+        """Fila del empleado si las credenciales son correctas, si no None.
+
+        Lanza DemasiadosIntentos o ColaHashLlena.
+        """
+        claves = (f"u:{usuario.lower()}", f"ip:{ip}")
+        espera = max(self.limitador.espera(c) for c in claves)
+        if espera > 0:
+            raise DemasiadosIntentos(espera)
+
+        conn = get_staff_conn()
+        user = conn.execute("SELECT * FROM empleados WHERE username = ?", (usuario,)).fetchone()
+        guardado = user["password_hash"] if user else self._hash_para_usuario_inexistente()
+
+        if not self.ejecutor.ejecutar(check_password_hash, guardado, password) or not user:
+            for c in claves:
+                self.limitador.fallo(c)
+            return None
+
+        self.limitador.limpiar(claves[0])
+
+        if self.requiere_rehash(user["password_hash"]):
+            # condicional: si otro login ya lo actualizó no se pisa
+            cur = conn.execute(
+                "UPDATE empleados SET password_hash = ? WHERE id = ? AND password_hash = ?",
+                (self.generar_hash(password), user["id"], user["password_hash"]),
+            )
+            conn.commit()
+            self.rehashes += cur.rowcount
+        return user
+
+    def estadisticas(self):
+        return {
+            "metodo": self.metodo,
+            "rehashes": self.rehashes,
+            "hash": self.ejecutor.estadisticas(),
+            "intentos": self.limitador.estadisticas(),
+        }
+
+
+def _servicio():
+    return current_app.extensions["auth"]
+
+
+def autenticar(usuario, password, ip):
+    return _servicio().autenticar(usuario, password, ip)
+
+
+def generar_hash(password):
+    return _servicio().generar_hash(password)
+
+
+def estadisticas_auth():
+    return _servicio().estadisticas()
+
+
+def init_app(app):
+    app.extensions["auth"] = ServicioAuth(
+        app.config["AUTH_HASH_METODO"],
+        EjecutorHash(
+            app.config["AUTH_HASH_HILOS"],
+            app.config["AUTH_HASH_COLA"],
+            app.config["AUTH_HASH_TIMEOUT"],
+        ),
+        LimitadorIntentos(
+            app.config["AUTH_INTENTOS_MAX"],
+            app.config["AUTH_INTENTOS_VENTANA"],
+        ),
+    )
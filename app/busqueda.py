@@ -0,0 +1,59 @@
+import re
+
+from .db import get_conn
+
+# =========================================================
+# BÚSQUEDA DE TEXTO COMPLETO (FTS5)
+# - productos_fts indexa nombre, marca, tipo y descripcion (migración 3)
+#   y se mantiene sincronizada con triggers sobre productos.
+# - Tokenizer unicode61 remove_diacritics: "audifonos" encuentra "Audífonos".
+# - Cada palabra se busca como prefijo ("gal" -> Galaxy) y se ordena por
+#   bm25 con pesos nombre > marca > tipo > descripcion (rank de la tabla).
+# =========================================================
+
+MAX_TERMINOS = 8
+
+_PALABRA = re.compile(r"\w+", re.UNICODE)
+
+
+def consulta_fts(q):
+    """Convierte el texto del usuario en una consulta MATCH segura.
+
+    Regresa None si no hay ninguna palabra buscable.
+    """
+    terminos = _PALABRA.findall(q or "")[:MAX_TERMINOS]
+    if not terminos:
+        return None
+    # Entre comillas para que AND/OR/NEAR/* del usuario no sean operadores
+    return " ".join('"' + t.replace('"', '""') + '"*' for t in terminos)
+
+
+def buscar_ids(q):
+    """Ids que coinciden con `q`, del más al menos relevante.
+
+    Regresa None si `q` no tiene palabras buscables (no se filtra).
+    """
+    match = consulta_fts(q)
+    if not match:
+        return None
+    cur = get_conn().execute(
+        "SELECT rowid FROM productos_fts WHERE productos_fts MATCH ? ORDER BY rank",
+        (match,),
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+def sugerencias(q, limite=8):
+    """Autocompletado: productos disponibles que empiezan con lo escrito."""
+    match = consulta_fts(q)
+    if not match:
+        return []
+    cur = get_conn().execute("""
+        SELECT p.id, p.nombre, p.marca, p.tipo, p.precio
+        FROM (SELECT rowid, rank FROM productos_fts WHERE productos_fts MATCH ?) f
+        JOIN productos p ON p.id = f.rowid
+        WHERE p.disponible = 1
+        ORDER BY f.rank
+        LIMIT ?
+    """, (match, int(limite)))
+    return [dict(r) for r in cur.fetchall()]
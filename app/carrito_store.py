@@ -0,0 +1,156 @@
+import secrets
+
+import click
+from flask import g, session
+
+from .db import get_conn
+
+# =========================================================
+# CARRITO DEL LADO DEL SERVIDOR (gadget.db)
+# - La cookie de sesión solo guarda session["carrito_id"].
+# - Los renglones viven en carrito_items (carrito_id, producto_id, cantidad);
+#   nombre, marca, imagen y precio salen del snapshot del catálogo al mostrar.
+# - carritos.piezas es el total de piezas, mantenido por triggers
+#   (migración 4): el contador del navbar es una lectura por llave primaria.
+# - La tabla `carrito` original pide usuario_id (clientes registrados);
+#   los visitantes anónimos usan estas tablas con un id aleatorio.
+# =========================================================
+
+MAX_POR_PRODUCTO = 10
+
+
+def _nuevo_id():
+    return secrets.token_urlsafe(16)
+
+
+def _importar_carrito_cookie(carrito_id):
+    """Pasa un carrito viejo guardado en la cookie (lista de dicts) al servidor."""
+    viejo = session.pop("carrito", None)
+    if not viejo:
+        return
+    cambios = {}
+    for item in viejo:
+        try:
+            cambios[int(item["id"])] = cambios.get(int(item["id"]), 0) + int(item.get("cantidad", 1))
+        except (KeyError, TypeError, ValueError):
+            continue
+    actualizar_items(carrito_id, cambios)
+
+
+def carrito_id_actual(crear=False):
+    """Id del carrito del visitante; con crear=True lo genera si no existe."""
+    carrito_id = session.get("carrito_id")
+    legado = "carrito" in session
+    if carrito_id is None and not (crear or legado):
+        return None
+
+    if carrito_id is None:
+        carrito_id = _nuevo_id()
+        session["carrito_id"] = carrito_id
+
+    if crear or legado:
+        conn = get_conn()
+        conn.execute("INSERT OR IGNORE INTO carritos (id) VALUES (?)", (carrito_id,))
+        conn.commit()
+        if legado:
+            _importar_carrito_cookie(carrito_id)
+    return carrito_id
+
+
+def obtener_items(carrito_id):
+    """{producto_id: cantidad} en orden de llegada."""
+    if not carrito_id:
+        return {}
+    cur = get_conn().execute("""
+        SELECT producto_id, cantidad
+        FROM carrito_items
+        WHERE carrito_id = ?
+        ORDER BY agregado_en, producto_id
+    """, (carrito_id,))
+    return {int(r["producto_id"]): int(r["cantidad"]) for r in cur.fetchall()}
+
+
+def cantidad_de(carrito_id, producto_id):
+    if not carrito_id:
+        return 0
+    row = get_conn().execute(
+        "SELECT cantidad FROM carrito_items WHERE carrito_id = ? AND producto_id = ?",
+        (carrito_id, int(producto_id)),
+    ).fetchone()
+    return int(row["cantidad"]) if row else 0
+
+
+def actualizar_items(carrito_id, cambios):
+    """Aplica varias cantidades en una sola transacción.
+
+    `cambios` = {producto_id: nueva_cantidad}; cantidad <= 0 elimina el renglón.
+    """
+    poner = [(carrito_id, int(pid), int(cant)) for pid, cant in cambios.items() if int(cant) > 0]
+    quitar = [(carrito_id, int(pid)) for pid, cant in cambios.items() if int(cant) <= 0]
+
+    conn = get_conn()
+    if poner:
+        conn.executemany("""
+            INSERT INTO carrito_items (carrito_id, producto_id, cantidad)
+            VALUES (?, ?, ?)
+            ON CONFLICT (carrito_id, producto_id) DO UPDATE SET cantidad = excluded.cantidad
+        """, poner)
+    if quitar:
+        conn.executemany(
+            "DELETE FROM carrito_items WHERE carrito_id = ? AND producto_id = ?",
+            quitar,
+        )
+    conn.commit()
+    g.pop("carrito_piezas", None)
+    g.pop("carrito_actualizado", None)
+
+
+def vaciar(carrito_id):
+    if not carrito_id:
+        return
+    conn = get_conn()
+    conn.execute("DELETE FROM carrito_items WHERE carrito_id = ?", (carrito_id,))
+    conn.commit()
+    g.pop("carrito_piezas", None)
+    g.pop("carrito_actualizado", None)
+
+
+def estado_carrito():
+    """(piezas, actualizado_en) del carrito (una lectura por request, por llave primaria)."""
+    if "carrito_piezas" in g:
+        return g.carrito_piezas, g.get("carrito_actualizado")
+
+    carrito_id = carrito_id_actual()
+    piezas, actualizado = 0, None
+    if carrito_id:
+        row = get_conn().execute(
+            "SELECT piezas, actualizado_en FROM carritos WHERE id = ?", (carrito_id,)
+        ).fetchone()
+        if row:
+            piezas, actualizado = int(row["piezas"]), row["actualizado_en"]
+
+    g.carrito_piezas = piezas
+    g.carrito_actualizado = actualizado
+    return piezas, actualizado
+
+
+def contar_piezas():
+    """Total de piezas del carrito (para el contador del navbar)."""
+    return estado_carrito()[0]
+
+
+def init_app(app):
+    @app.cli.command("limpiar-carritos")
+    @click.option("--dias", default=30, show_default=True, help="Antigüedad mínima (días sin cambios).")
+    def limpiar_carritos(dias):
+        """Borra carritos anónimos abandonados."""
+        conn = get_conn()
+        viejos = f"-{int(dias)} days"
+        conn.execute("""
+            DELETE FROM carrito_items WHERE carrito_id IN (
+                SELECT id FROM carritos WHERE actualizado_en < datetime('now', ?)
+            )
+        """, (viejos,))
+        cur = conn.execute("DELETE FROM carritos WHERE actualizado_en < datetime('now', ?)", (viejos,))
+        conn.commit()
+        click.echo(f"✔ {cur.rowcount} carrito(s) eliminados.")
@@ -0,0 +1,215 @@
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+
+from flask import current_app
+
+from .db import get_conn
+
+# =========================================================
+# CACHE DEL CATÁLOGO (en memoria, por worker)
+# - Snapshot inmutable: productos disponibles + marcas + precio máximo,
+#   indexado por id y por código de barras (escáner del punto de venta),
+#   con el srcset de sus variantes de imagen ya armado.
+# - Resultados derivados (listados filtrados) en un LRU con TTL. El
+#   snapshot y las sugerencias del autocompletado van en regiones aparte
+#   para que las claves de cada tecla no expulsen al snapshot.
+# - Todo queda ligado a catalogo_version.version (gadget.db): las rutas
+#   de admin lo incrementan al escribir y cada worker lo relee como
+#   máximo cada CATALOGO_VERSION_TTL segundos, así todos los workers
+#   de gunicorn ven el cambio.
+# =========================================================
+
+
+class SnapshotCatalogo:
+    """Catálogo de productos disponibles congelado en una versión."""
+
+    __slots__ = ("version", "productos", "por_id", "por_codigo", "marcas", "max_precio")
+
+    def __init__(self, version, filas, imagenes=None):
+        imagenes = imagenes or {}
+        # "imagen": srcset de las variantes (app/imagenes.py) o None -> url_imagen
+        productos = tuple(MappingProxyType({**dict(r), "imagen": imagenes.get(r["id"])}) for r in filas)
+        self.version = version
+        self.productos = productos
+        self.por_id = MappingProxyType({int(p["id"]): p for p in productos})
+        self.por_codigo = MappingProxyType({p["codigo_barras"]: p for p in productos if p["codigo_barras"]})
+        self.marcas = tuple(sorted({p["marca"] for p in productos}))
+        try:
+            self.max_precio = int(max((float(p["precio"] or 0) for p in productos), default=0))
+        except (TypeError, ValueError):
+            self.max_precio = 0
+
+
+class CacheCatalogo:
+    """LRU con TTL ligado a catalogo_version, partido en regiones.
+
+    Cada región tiene su propio tope, así el tráfico de una (una clave por
+    tecla en el autocompletado) no expulsa las entradas de otra.
+    """
+
+    def __init__(self, max_entradas=256, ttl=300.0, version_ttl=2.0, max_sugerencias=128):
+        self.topes = {
+            "snapshot": 1,                                # fijo: nunca compite con nada
+            "general": max(1, int(max_entradas)),         # listados, facetas, órdenes
+            "sugerencias": max(1, int(max_sugerencias)),  # /productos/sugerencias
+        }
+        self.ttl = float(ttl)
+        self.version_ttl = float(version_ttl)
+
+        self._lock = threading.RLock()
+        self._regiones = {r: OrderedDict() for r in self.topes}  # clave -> (version, creado_en, valor)
+        self._version = None
+        self._actualizado_en = None
+        self._version_leida_en = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.expulsiones = {r: 0 for r in self.topes}
+        self.invalidaciones = 0
+
+    def _vaciar(self):
+        for entradas in self._regiones.values():
+            entradas.clear()
+
+    # ---------- versión ----------
+    def version(self, forzar=False):
+        ahora = time.monotonic()
+        if not forzar and self._version is not None and ahora - self._version_leida_en < self.version_ttl:
+            return self._version
+
+        row = get_conn().execute(
+            "SELECT version, actualizado_en FROM catalogo_version WHERE id = 1"
+        ).fetchone()
+        version = int(row["version"]) if row else 0
+
+        with self._lock:
+            if version != self._version:
+                self._vaciar()
+            self._version = version
+            self._actualizado_en = row["actualizado_en"] if row else None
+            self._version_leida_en = ahora
+        return version
+
+    def marca(self):
+        """(versión, actualizado_en) vigentes, con la misma relectura que version()."""
+        self.version()
+        with self._lock:
+            return self._version, self._actualizado_en
+
+    # ---------- LRU ----------
+    def obtener(self, clave, calcular, region="general"):
+        """Regresa el valor cacheado para `clave` o lo calcula con `calcular()`."""
+        version = self.version()
+        ahora = time.monotonic()
+        entradas = self._regiones[region]
+
+        with self._lock:
+            entrada = entradas.get(clave)
+            if entrada and entrada[0] == version and ahora - entrada[1] < self.ttl:
+                entradas.move_to_end(clave)
+                self.hits += 1
+                return entrada[2]
+            self.misses += 1
+
+        valor = calcular()
+
+        with self._lock:
+            entradas[clave] = (version, ahora, valor)
+            entradas.move_to_end(clave)
+            while len(entradas) > self.topes[region]:
+                entradas.popitem(last=False)
+                self.expulsiones[region] += 1
+        return valor
+
+    def limpiar(self):
+        with self._lock:
+            self._vaciar()
+            self._version = None
+            self.invalidaciones += 1
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "version": self._version,
+                "entradas": {r: len(e) for r, e in self._regiones.items()},
+                "max_entradas": dict(self.topes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expulsiones": dict(self.expulsiones),
+                "invalidaciones": self.invalidaciones,
+            }
+
+
+def init_app(app):
+    app.extensions["catalogo_cache"] = CacheCatalogo(
+        app.config["CATALOGO_CACHE_MAX"],
+        app.config["CATALOGO_CACHE_TTL"],
+        app.config["CATALOGO_VERSION_TTL"],
+        app.config["CATALOGO_SUGERENCIAS_MAX"],
+    )
+
+
+def _cache():
+    return current_app.extensions["catalogo_cache"]
+
+
+def _cargar_snapshot():
+    cache = _cache()
+    version = cache.version()
+    filas = get_conn().execute("""
+        SELECT id, nombre, marca, tipo, precio, descripcion, url_imagen, disponible, codigo_barras
+        FROM productos
+        WHERE disponible = 1
+        ORDER BY id ASC
+    """).fetchall()
+    from .imagenes import variantes_por_producto
+    imagenes = variantes_por_producto(get_conn(), current_app.static_url_path)
+    return SnapshotCatalogo(version, filas, imagenes)
+
+
+def obtener_snapshot():
+    """Snapshot inmutable del catálogo vigente."""
+    return _cache().obtener(("snapshot",), _cargar_snapshot, region="snapshot")
+
+
+def buscar_por_codigo(codigo):
+    """Producto disponible por código de barras; si es numérico y no hay
+    código registrado, se toma como id (escaneo simulado). Sin SQL."""
+    codigo = (codigo or "").strip()
+    if not codigo:
+        return None
+    snapshot = obtener_snapshot()
+    producto = snapshot.por_codigo.get(codigo)
+    if producto is None and codigo.isdigit():
+        producto = snapshot.por_id.get(int(codigo))
+    return producto
+
+
+def marca_catalogo():
+    """(versión, actualizado_en) del catálogo; para ETag/Last-Modified (app/condicional.py)."""
+    return _cache().marca()
+
+
+def consultar(clave, calcular, region="general"):
+    """Memoiza un resultado derivado del catálogo (se invalida con la versión)."""
+    return _cache().obtener(clave, calcular, region)
+
+
+def invalidar_catalogo(conn):
+    """Incrementa catalogo_version dentro de la transacción de `conn`.
+
+    Llamar ANTES del commit de cualquier escritura a productos.
+    """
+    conn.execute("""
+        UPDATE catalogo_version
+        SET version = version + 1, actualizado_en = CURRENT_TIMESTAMP
+        WHERE id = 1
+    """)
+    # fuerza a releer la versión en el siguiente acceso de este worker
+    _cache().limpiar()
+
+
+def estadisticas_cache():
+    return _cache().estadisticas()
@@ -0,0 +1,146 @@
+import random
+import sqlite3
+import time
+
+# =========================================================
+# CHECKOUT (venta web y venta física)
+# Todo en UNA transacción BEGIN IMMEDIATE:
+#   1. precios vigentes de productos
+#   2. descuento de inventario por sucursal con UPDATE ... WHERE stock >= ?
+#      (si no alcanza -> StockInsuficiente y ROLLBACK, nunca se sobrevende)
+#   3. ventas + detalle_venta (executemany)
+#   4. registro_inventario (executemany)
+# Si la BD está ocupada (SQLITE_BUSY) se reintenta con backoff acotado.
+# =========================================================
+
+# Cliente genérico para ventas sin cuenta (web anónima y mostrador)
+CLIENTE_PUBLICO_ID = 0
+
+
+class StockInsuficiente(Exception):
+    def __init__(self, producto_id, solicitado, disponible):
+        super().__init__(
+            f"Stock insuficiente para producto {producto_id}: "
+            f"solicitado {solicitado}, disponible {disponible}"
+        )
+        self.producto_id = producto_id
+        self.solicitado = solicitado
+        self.disponible = disponible
+
+
+class ProductoNoDisponible(Exception):
+    def __init__(self, producto_id):
+        super().__init__(f"Producto {producto_id} no disponible")
+        self.producto_id = producto_id
+
+
+def _es_busy(error):
+    msg = str(error).lower()
+    return "locked" in msg or "busy" in msg
+
+
+def _agrupar(lineas):
+    """[(producto_id, cantidad), ...] -> {producto_id: cantidad} (sin repetidos)."""
+    cantidades = {}
+    for producto_id, cantidad in lineas:
+        cantidad = int(cantidad)
+        if cantidad > 0:
+            cantidades[int(producto_id)] = cantidades.get(int(producto_id), 0) + cantidad
+    return cantidades
+
+
+def _repartir_stock(cur, producto_id, cantidad):
+    """Descuenta `cantidad` de las sucursales con más stock primero.
+
+    Regresa [(inventario_id, piezas)] de lo que se tomó.
+    """
+    filas = cur.execute("""
+        SELECT id, stock FROM inventario
+        WHERE producto_id = ? AND stock > 0
+        ORDER BY stock DESC, id ASC
+    """, (producto_id,)).fetchall()
+
+    disponible = sum(int(f[1]) for f in filas)
+    if disponible < cantidad:
+        raise StockInsuficiente(producto_id, cantidad, disponible)
+
+    tomado = []
+    pendiente = cantidad
+    for inventario_id, stock in filas:
+        if pendiente <= 0:
+            break
+        piezas = min(int(stock), pendiente)
+        cur.execute("""
+            UPDATE inventario
+            SET stock = stock - ?, actualizado_en = CURRENT_TIMESTAMP
+            WHERE id = ? AND stock >= ?
+        """, (piezas, inventario_id, piezas))
+        if cur.rowcount != 1:
+            raise StockInsuficiente(producto_id, cantidad, disponible - pendiente)
+        tomado.append((inventario_id, piezas))
+        pendiente -= piezas
+    return tomado
+
+
+def _registrar(conn, cantidades, usuario_id, empleado_id, metodo_pago):
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        ids = list(cantidades)
+        marcas = ",".join("?" * len(ids))
+        precios = {
+            int(r[0]): float(r[1] or 0)
+            for r in cur.execute(
+                f"SELECT id, precio FROM productos WHERE disponible = 1 AND id IN ({marcas})", ids
+            ).fetchall()
+        }
+        for producto_id in ids:
+            if producto_id not in precios:
+                raise ProductoNoDisponible(producto_id)
+
+        movimientos = []
+        for producto_id in sorted(ids):  # mismo orden siempre: menos contención
+            movimientos.extend(_repartir_stock(cur, producto_id, cantidades[producto_id]))
+
+        total = sum(precios[p] * c for p, c in cantidades.items())
+        cur.execute("""
+            INSERT INTO ventas (usuario_id, empleado_id, total, metodo_pago)
+            VALUES (?, ?, ?, ?)
+        """, (usuario_id, empleado_id, total, metodo_pago))
+        venta_id = cur.lastrowid
+
+        cur.executemany("""
+            INSERT INTO detalle_venta (venta_id, producto_id, cantidad, precio)
+            VALUES (?, ?, ?, ?)
+        """, [(venta_id, p, c, precios[p]) for p, c in cantidades.items()])
+
+        cur.executemany("""
+            INSERT INTO registro_inventario (inventario_id, cambio, motivo)
+            VALUES (?, ?, ?)
+        """, [(inv_id, -piezas, f"venta #{venta_id}") for inv_id, piezas in movimientos])
+
+        conn.commit()
+        return venta_id
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def registrar_venta(conn, lineas, usuario_id=CLIENTE_PUBLICO_ID, empleado_id=None,
+                    metodo_pago="en_linea", reintentos=5, espera_base=0.02):
+    """Registra la venta completa o nada. Regresa el id de la venta.
+
+    `lineas` = [(producto_id, cantidad), ...]. Lanza StockInsuficiente o
+    ProductoNoDisponible sin modificar nada.
+    """
+    cantidades = _agrupar(lineas)
+    if not cantidades:
+        raise ValueError("La venta no tiene productos")
+
+    for intento in range(reintentos + 1):
+        try:
+            return _registrar(conn, cantidades, usuario_id, empleado_id, metodo_pago)
+        except sqlite3.OperationalError as e:
+            if not _es_busy(e) or intento == reintentos:
+                raise
+            time.sleep(espera_base * (2 ** intento) * (1 + random.random()))
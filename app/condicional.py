@@ -0,0 +1,138 @@
+import functools
+import hashlib
+import os
+from datetime import datetime, timezone
+
+from flask import current_app, request, session
+from werkzeug.wrappers import Response
+
+from .carrito_store import estado_carrito
+from .catalogo import marca_catalogo
+
+# =========================================================
+# GET CONDICIONAL PARA PÁGINAS PÚBLICAS (/, /productos)
+# - ETag fuerte = hash de: versión del catálogo + versión del deploy
+#   (plantillas y manifest de estáticos) + parámetros de la vista
+#   normalizados + lo que cambia por visitante (piezas del carrito,
+#   staff en sesión).
+# - Last-Modified = lo más reciente entre catalogo_version.actualizado_en,
+#   el carrito del visitante y el deploy.
+# - Se calcula ANTES de la vista: con If-None-Match / If-Modified-Since
+#   vigentes se contesta 304 sin consultar productos ni renderizar. La
+#   versión del catálogo sale de la memoria del worker (se relee cada
+#   CATALOGO_VERSION_TTL); un visitante sin carrito no toca la BD y uno
+#   con carrito cuesta una lectura por llave primaria.
+# - Cache-Control: no-cache (siempre revalidar, el 304 es barato) y
+#   Vary: Cookie; con carrito o sesión de staff además "private" para
+#   que un cache compartido no le pase la página a otro visitante.
+# =========================================================
+
+
+def _a_fecha(valor):
+    """TIMESTAMP de SQLite ('YYYY-MM-DD HH:MM:SS', UTC) o epoch -> datetime UTC al segundo."""
+    if valor is None:
+        return None
+    if isinstance(valor, (int, float)):
+        return datetime.fromtimestamp(int(valor), timezone.utc)
+    try:
+        return datetime.fromisoformat(str(valor)).replace(tzinfo=timezone.utc, microsecond=0)
+    except ValueError:
+        return None
+
+
+def version_deploy(app):
+    """(hash, mtime) de las plantillas + manifest de estáticos: cambia con cada deploy."""
+    h = hashlib.blake2b(digest_size=8)
+    ultimo = 0.0
+    raices = [os.path.join(app.root_path, app.template_folder)]
+    estaticos = app.extensions.get("estaticos")
+    if estaticos:
+        raices.append(os.path.join(app.static_folder, app.config["ESTATICOS_DIR"]))
+    for raiz in raices:
+        for carpeta, _, archivos in sorted(os.walk(raiz)):
+            for nombre in sorted(archivos):
+                ruta = os.path.join(carpeta, nombre)
+                st = os.stat(ruta)
+                h.update(f"{os.path.relpath(ruta, raiz)}:{st.st_size}:{st.st_mtime_ns};".encode())
+                ultimo = max(ultimo, st.st_mtime)
+    # las páginas llevan URLs firmadas del proxy de imágenes: otro secreto, otras páginas
+    secreto = app.config.get("PROXY_IMAGENES_SECRETO")
+    if secreto:
+        h.update(hashlib.sha256(secreto.encode("utf-8")).digest())
+    return h.hexdigest(), int(ultimo)
+
+
+def _visitante():
+    """Lo que cambia la página por visitante: (clave, última modificación, privado)."""
+    piezas, actualizado = estado_carrito()
+    staff = None
+    if session.get("tipo_usuario") == "staff":
+        staff = (session.get("user_id"), session.get("nombre_completo"), session.get("username"))
+    privado = bool(session.get("carrito_id")) or staff is not None
+    return (piezas, staff), _a_fecha(actualizado), privado
+
+
+def _es_fresco(etag, ultima):
+    if request.if_none_match:  # RFC 9110: If-None-Match manda sobre If-Modified-Since
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and ultima:
+        return ultima <= request.if_modified_since
+    return False
+
+
+def _poner_validadores(resp, etag, ultima, privado):
+    resp.set_etag(etag)
+    if ultima:
+        resp.last_modified = ultima
+    resp.cache_control.no_cache = True
+    if privado:
+        resp.cache_control.private = True
+    else:
+        resp.cache_control.public = True
+    resp.vary.add("Cookie")
+    return resp
+
+
+def condicional(clave_vista=None):
+    """Decorador: ETag/Last-Modified y 304 antes de correr la vista.
+
+    `clave_vista()` regresa lo que distingue una respuesta de otra en esa
+    ruta (filtros, orden, cursor...). Debe ser hasheable y no tocar la BD.
+    """
+
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura(*args, **kwargs):
+            deploy = current_app.extensions.get("condicional")
+            if deploy is None or request.method not in ("GET", "HEAD"):
+                return vista(*args, **kwargs)
+
+            version, actualizado = marca_catalogo()
+            visitante, carrito_en, privado = _visitante()
+            partes = (vista.__name__, version, deploy[0], clave_vista() if clave_vista else None, visitante)
+            etag = hashlib.blake2b(repr(partes).encode("utf-8"), digest_size=12).hexdigest()
+            fechas = [f for f in (_a_fecha(actualizado), carrito_en, _a_fecha(deploy[1])) if f]
+            ultima = max(fechas) if fechas else None
+
+            if _es_fresco(etag, ultima):
+                return _poner_validadores(Response(status=304), etag, ultima, privado)
+
+            resp = current_app.make_response(vista(*args, **kwargs))
+            if resp.status_code == 200:
+                _poner_validadores(resp, etag, ultima, privado)
+            return resp
+
+        return envoltura
+
+    return decorador
+
+
+def args_normalizados():
+    """request.args en orden: ?b=2&a=1 y ?a=1&b=2 son la misma página."""
+    return tuple(sorted(request.args.items(multi=True)))
+
+
+def init_app(app):
+    if not app.config["CONDICIONAL_HABILITADO"]:
+        return
+    app.extensions["condicional"] = version_deploy(app)
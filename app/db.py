@@ -0,0 +1,304 @@
+import os
+import queue
+import sqlite3
+import threading
+import math
+import time
+
+from flask import Response, current_app, g
+
+# =========================================================
+# POOL DE CONEXIONES SQLITE
+# - Una conexión por request (se guarda en `g`) tomada de un pool acotado.
+# - Los PRAGMA se configuran una sola vez, al crear cada conexión del pool.
+# - Al terminar el app context (teardown) la conexión regresa al pool.
+# - El pool tiene al menos tantas conexiones como hilos por worker
+#   (SERVIDOR_HILOS); si aun así se agota (servidor con hilos de werkzeug,
+#   sin tope de hilos) el request recibe 503 + Retry-After, no un 500.
+# - Las conexiones acumulan el tiempo pasado en SQLite (execute/fetch)
+#   para que app/metricas.py separe tiempo de BD y de render.
+# =========================================================
+
+
+class CursorMedido(sqlite3.Cursor):
+    """Cursor que suma a su conexión el tiempo de execute y fetch.
+
+    Con el perfilador activo (app/perfilador.py) cada execute abre un
+    registro y el tiempo de sus fetch se le suma también.
+    """
+
+    _registro = None
+
+    def _medir(self, fn, *args):
+        inicio = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            segundos = time.perf_counter() - inicio
+            self.connection.segundos += segundos
+            if self._registro is not None:
+                self._registro.segundos += segundos
+
+    def _ejecutar(self, fn, sql, params, *args):
+        perfil = self.connection.perfil
+        if perfil is None:
+            self._registro = None
+            return self._medir(fn, sql, *args)
+        self._registro = perfil.iniciar(self.connection, sql, params)
+        try:
+            return self._medir(fn, sql, *args)
+        finally:
+            perfil.terminar()
+
+    def execute(self, sql, *args):
+        return self._ejecutar(super().execute, sql, args[0] if args else (), *args)
+
+    def executemany(self, sql, *args):
+        # params=None: no se puede repetir con EXPLAIN ni comparar
+        return self._ejecutar(super().executemany, sql, None, *args)
+
+    def executescript(self, sql):
+        return self._ejecutar(super().executescript, sql, None)
+
+    def fetchone(self):
+        return self._medir(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._medir(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._medir(super().fetchall)
+
+    def __next__(self):
+        return self._medir(super().__next__)
+
+
+class ConexionMedida(sqlite3.Connection):
+    """Conexión del pool: todos sus cursores son CursorMedido."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.segundos = 0.0
+        self.perfil = None  # PerfilConsultas del request (app/perfilador.py)
+
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    # en 3.11 Connection.execute no pasa por self.cursor()
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def executescript(self, *args):
+        return self.cursor().executescript(*args)
+
+
+class PoolAgotado(RuntimeError):
+    """No se liberó ninguna conexión dentro del tiempo de espera."""
+
+
+class PoolSQLite:
+    """Pool acotado y thread-safe de conexiones a un archivo SQLite."""
+
+    def __init__(self, path, max_conexiones=8, timeout=5.0, pragmas=None):
+        self.path = path
+        self.max_conexiones = max(1, int(max_conexiones))
+        self.timeout = float(timeout)
+        self.pragmas = list(pragmas or [])
+
+        self._libres = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._creadas = 0
+        self._pid = os.getpid()
+
+        # contadores expuestos en estadisticas()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_total_ms = 0.0
+        # al_esperar(segundos): lo engancha app/metricas.py para sumar la espera a /metrics
+        self.al_esperar = None
+
+    def _conectar(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, factory=ConexionMedida)
+        conn.row_factory = sqlite3.Row
+        for pragma in self.pragmas:
+            conn.execute(f"PRAGMA {pragma}")
+        return conn
+
+    def _revisar_fork(self):
+        # Tras un fork (gunicorn --preload) las conexiones del padre no sirven.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._libres = queue.LifoQueue()
+                    self._creadas = 0
+                    self._pid = os.getpid()
+
+    def adquirir(self):
+        self._revisar_fork()
+
+        try:
+            conn = self._libres.get_nowait()
+            with self._lock:
+                self.hits += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            crear = self._creadas < self.max_conexiones
+            if crear:
+                self._creadas += 1
+                self.misses += 1
+
+        if crear:
+            try:
+                return self._conectar()
+            except Exception:
+                with self._lock:
+                    self._creadas -= 1
+                raise
+
+        # Pool lleno: esperamos a que otro request libere su conexión
+        inicio = time.perf_counter()
+        try:
+            conn = self._libres.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolAgotado(f"Sin conexiones libres para {os.path.basename(self.path)}")
+        finally:
+            espera = time.perf_counter() - inicio
+            with self._lock:
+                self.waits += 1
+                self.wait_total_ms += espera * 1000
+            if self.al_esperar is not None:
+                self.al_esperar(espera)
+        return conn
+
+    def liberar(self, conn):
+        if self._pid != os.getpid():
+            conn.close()
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Conexión rota: la descartamos y dejamos lugar para otra
+            conn.close()
+            with self._lock:
+                self._creadas -= 1
+            return
+        self._libres.put(conn)
+
+    def cerrar(self):
+        while True:
+            try:
+                self._libres.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._creadas = 0
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "db": os.path.basename(self.path),
+                "max": self.max_conexiones,
+                "creadas": self._creadas,
+                "libres": self._libres.qsize(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "wait_total_ms": round(self.wait_total_ms, 2),
+            }
+
+
+def _pragmas(config):
+    return [
+        "journal_mode = WAL",
+        "synchronous = NORMAL",
+        f"mmap_size = {int(config['DB_MMAP_SIZE'])}",
+        f"cache_size = -{int(config['DB_CACHE_SIZE_KB'])}",
+        f"busy_timeout = {int(config['DB_BUSY_TIMEOUT_MS'])}",
+        "temp_store = MEMORY",
+    ]
+
+
+def tam_pool(config):
+    """Conexiones por pool: cada request concurrente del worker retiene una."""
+    return max(int(config["DB_POOL_SIZE"]), int(config.get("SERVIDOR_HILOS") or 1))
+
+
+def init_app(app):
+    """Crea los pools de gadget.db y empleados.db y registra el teardown."""
+    pragmas = _pragmas(app.config)
+    tam = tam_pool(app.config)
+    app.extensions["sqlite_pools"] = {
+        "gadget": PoolSQLite(
+            app.config["DATABASE"],
+            tam,
+            app.config["DB_POOL_TIMEOUT"],
+            pragmas,
+        ),
+        "staff": PoolSQLite(
+            app.config["STAFF_DATABASE"],
+            tam,
+            app.config["DB_POOL_TIMEOUT"],
+            pragmas,
+        ),
+    }
+    app.teardown_appcontext(liberar_conexiones)
+
+    @app.errorhandler(PoolAgotado)
+    def pool_agotado(e):
+        app.logger.warning("%s", e)
+        resp = Response("Servidor ocupado, intenta de nuevo en un momento.\n", 503, mimetype="text/plain")
+        resp.headers["Retry-After"] = str(max(1, math.ceil(app.config["DB_POOL_RETRY_AFTER"])))
+        return resp
+
+
+def _conexion(nombre):
+    attr = f"_db_{nombre}"
+    conn = getattr(g, attr, None)
+    if conn is None:
+        conn = current_app.extensions["sqlite_pools"][nombre].adquirir()
+        conn.segundos = 0.0
+        perfilador = current_app.extensions.get("perfilador")
+        if perfilador is not None:
+            perfilador.adjuntar(conn, nombre)
+        setattr(g, attr, conn)
+    return conn
+
+
+def get_conn():
+    """Conexión a gadget.db del request actual (productos, inventario, etc.)."""
+    return _conexion("gadget")
+
+
+def get_staff_conn():
+    """Conexión a empleados.db del request actual (staff/admin)."""
+    return _conexion("staff")
+
+
+def segundos_db():
+    """Tiempo en SQLite del request actual (ambas bases)."""
+    pools = current_app.extensions.get("sqlite_pools", {})
+    return sum(getattr(g, f"_db_{n}").segundos for n in pools if hasattr(g, f"_db_{n}"))
+
+
+def liberar_conexiones(exc=None):
+    pools = current_app.extensions.get("sqlite_pools", {})
+    for nombre, pool in pools.items():
+        conn = g.pop(f"_db_{nombre}", None)
+        if conn is not None:
+            if conn.perfil is not None:
+                conn.set_trace_callback(None)
+                conn.perfil = None
+            pool.liberar(conn)
+
+
+def estadisticas_pools(app=None):
+    app = app or current_app
+    return {n: p.estadisticas() for n, p in app.extensions.get("sqlite_pools", {}).items()}
@@ -0,0 +1,276 @@
+import fnmatch
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import time
+
+import click
+from flask import abort, request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se genera .gz
+    brotli = None
+
+# =========================================================
+# ESTÁTICOS CON HUELLA + PRECOMPRIMIDOS
+#   flask compilar-estaticos
+# - Copia lo que casa con ESTATICOS_PATRONES (css/*, js/*, logos...) a
+#   static/dist/ con el hash del contenido en el nombre:
+#   css/style.css -> dist/css/style.3f9a1c2b.css, y al lado .gz y .br
+#   (si brotli está instalado y sale más chico).
+# - Cada build AGREGA sus archivos a dist/ y al final cambia solo
+#   manifest.json (os.replace). Los de builds anteriores siguen ahí para
+#   las páginas y workers que aún los piden; se podan pasados
+#   ESTATICOS_BUILDS_CONSERVAR builds y ESTATICOS_CONSERVAR_S segundos.
+# - dist/manifest.json se lee UNA vez en create_app; con él
+#   url_for('static', filename='css/style.css') da la ruta con huella
+#   (url_defaults), así las plantillas no cambian.
+# - Lo de dist/ se sirve según Accept-Encoding con
+#   Cache-Control: public, max-age=31536000, immutable; si el contenido
+#   cambia cambia el nombre, nunca hay que revalidar.
+# - Sin manifest (no se compiló), con app.debug o si un original cambió
+#   después de compilar, ese archivo sale sin huella como antes.
+# =========================================================
+
+MANIFIESTO = "manifest.json"
+CODIFICACIONES = (("br", ".br"), ("gzip", ".gz"))  # en orden de preferencia
+
+
+def _hash(datos):
+    return hashlib.blake2b(datos, digest_size=8).hexdigest()
+
+
+def _comprimir(datos, codificacion):
+    if codificacion == "gzip":
+        return gzip.compress(datos, compresslevel=9, mtime=0)  # mtime=0: mismo archivo en cada build
+    return brotli.compress(datos, quality=11)
+
+
+def _fuentes(static_folder, patrones, salida):
+    for raiz, dirs, archivos in os.walk(static_folder):
+        if os.path.abspath(raiz) == os.path.abspath(salida):
+            dirs[:] = []
+            continue
+        for nombre in sorted(archivos):
+            rel = os.path.relpath(os.path.join(raiz, nombre), static_folder).replace(os.sep, "/")
+            if any(fnmatch.fnmatch(rel, p) for p in patrones):
+                yield rel
+
+
+def _escribir(ruta, datos):
+    """El archivo aparece completo o no aparece (tmp + os.replace)."""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(datos)
+    os.replace(tmp, ruta)
+
+
+def _leer_manifiesto(salida):
+    try:
+        with open(os.path.join(salida, MANIFIESTO), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _rutas_build(archivos):
+    """Lo que un build tiene en disco: cada archivo con huella y sus .gz/.br."""
+    rutas = set()
+    for info in archivos.values():
+        rutas.add(info["ruta"])
+        for codificacion, sufijo in CODIFICACIONES:
+            if codificacion in info["codificaciones"]:
+                rutas.add(info["ruta"] + sufijo)
+    return rutas
+
+
+def _podar(static_folder, subdir, builds):
+    """Borra de dist/ lo que ya no usa ningún build conservado. Regresa cuántos."""
+    salida = os.path.join(static_folder, subdir)
+    usados = {os.path.normpath(os.path.join(static_folder, r)) for b in builds for r in _rutas_build(b)}
+    usados.add(os.path.normpath(os.path.join(salida, MANIFIESTO)))
+    borrados = 0
+    for raiz, _, nombres in os.walk(salida, topdown=False):
+        for nombre in nombres:
+            ruta = os.path.normpath(os.path.join(raiz, nombre))
+            if ruta not in usados:
+                os.remove(ruta)
+                borrados += 1
+        if os.path.abspath(raiz) != os.path.abspath(salida) and not os.listdir(raiz):
+            os.rmdir(raiz)
+    return borrados
+
+
+def compilar(static_folder, subdir, patrones, comprimir, minimo=0.9, conservar=3, conservar_s=7 * 24 * 3600, log=None):
+    """Agrega a dist/ los archivos con huella del build nuevo y cambia el manifest. Regresa el manifest.
+
+    Los archivos de builds anteriores se quedan: una página que todavía
+    apunta a style.<hash viejo>.css (cache del navegador, worker que no
+    se ha reciclado) la sigue encontrando. Se podan los builds más allá
+    de los últimos `conservar` que además tengan más de `conservar_s`.
+    """
+    salida = os.path.join(static_folder, subdir)
+    archivos = {}
+    for rel in _fuentes(static_folder, patrones, salida):
+        origen = os.path.join(static_folder, rel)
+        with open(origen, "rb") as f:
+            datos = f.read()
+        base, ext = os.path.splitext(rel)
+        destino = f"{base}.{_hash(datos)}{ext}"
+        ruta = os.path.join(salida, destino)
+        if not os.path.exists(ruta):  # mismo hash, mismo contenido: ya está de otro build
+            _escribir(ruta, datos)
+
+        st = os.stat(origen)
+        info = {
+            "ruta": f"{subdir}/{destino}",
+            "tipo": mimetypes.guess_type(rel)[0] or "application/octet-stream",
+            "bytes": len(datos),
+            "origen_mtime": st.st_mtime,
+            "origen_bytes": st.st_size,
+            "codificaciones": {},
+        }
+        if ext.lower() in comprimir:
+            for codificacion, sufijo in CODIFICACIONES:
+                if codificacion == "br" and brotli is None:
+                    continue
+                comprimido = _comprimir(datos, codificacion)
+                if len(comprimido) <= len(datos) * minimo:
+                    if not os.path.exists(ruta + sufijo):
+                        _escribir(ruta + sufijo, comprimido)
+                    info["codificaciones"][codificacion] = len(comprimido)
+        archivos[rel] = info
+
+    # builds anteriores, del más reciente al más viejo (sin repetir el que se acaba de generar)
+    ahora = time.time()
+    previo = _leer_manifiesto(salida) or {}
+    builds = [{"generado": previo.get("generado", 0), "archivos": previo.get("archivos", {})}]
+    builds += previo.get("anteriores", [])
+    vigentes = _rutas_build(archivos)
+    builds = [b for b in builds if b["archivos"] and _rutas_build(b["archivos"]) != vigentes]
+    anteriores = [b for i, b in enumerate(builds) if i < conservar - 1 or ahora - b["generado"] < conservar_s]
+
+    manifiesto = {"generado": ahora, "archivos": archivos, "anteriores": anteriores}
+    # solo el manifest se cambia de golpe; los archivos que nombra ya están en disco
+    _escribir(os.path.join(salida, MANIFIESTO), json.dumps(manifiesto, indent=1, ensure_ascii=False).encode("utf-8"))
+    podados = _podar(static_folder, subdir, [archivos] + [b["archivos"] for b in anteriores])
+    if log and podados:
+        log(f"{podados} archivos de builds viejos borrados de {subdir}/")
+    return manifiesto
+
+
+class Manifiesto:
+    """Archivos con huella vigentes: original -> info y ruta con huella -> info.
+
+    por_ruta también tiene los de builds anteriores que siguen en disco:
+    se sirven igual (immutable, .gz/.br) aunque url_for ya no los genere.
+    """
+
+    def __init__(self, archivos=None, anteriores=()):
+        self.por_origen = archivos or {}
+        self.por_ruta = {}
+        for build in reversed(anteriores):
+            self.por_ruta.update((info["ruta"], info) for info in build["archivos"].values())
+        self.por_ruta.update((info["ruta"], info) for info in self.por_origen.values())
+
+    @classmethod
+    def cargar(cls, static_folder, subdir, log=None):
+        ruta = os.path.join(static_folder, subdir, MANIFIESTO)
+        try:
+            with open(ruta, encoding="utf-8") as f:
+                datos = json.load(f)
+            archivos = datos["archivos"]
+        except (OSError, ValueError, KeyError):
+            return cls()
+        vigentes = {}
+        for rel, info in archivos.items():
+            try:
+                st = os.stat(os.path.join(static_folder, rel))
+            except OSError:
+                continue
+            if st.st_size != info["origen_bytes"] or st.st_mtime != info["origen_mtime"]:
+                if log:
+                    log(f"{rel} cambió después de compilar; se sirve sin huella (flask compilar-estaticos)")
+                continue
+            vigentes[rel] = info
+        return cls(vigentes, datos.get("anteriores", ()))
+
+    def __len__(self):
+        return len(self.por_origen)
+
+
+def _elegir_codificacion(info):
+    aceptadas = request.accept_encodings
+    for codificacion, sufijo in CODIFICACIONES:
+        if codificacion in info["codificaciones"] and aceptadas[codificacion]:
+            return codificacion, sufijo
+    return None, ""
+
+
+def init_app(app):
+    subdir = app.config["ESTATICOS_DIR"]
+
+    @app.cli.command("compilar-estaticos")
+    def compilar_estaticos():
+        """Copia los estáticos con hash en el nombre y genera .gz/.br + manifest."""
+        inicio = time.perf_counter()
+        manifiesto = compilar(
+            app.static_folder, subdir, app.config["ESTATICOS_PATRONES"], app.config["ESTATICOS_COMPRIMIR"],
+            conservar=app.config["ESTATICOS_BUILDS_CONSERVAR"], conservar_s=app.config["ESTATICOS_CONSERVAR_S"],
+            log=lambda m: click.echo(f"  · {m}"),
+        )
+        originales = comprimidos = 0
+        for rel, info in manifiesto["archivos"].items():
+            mejor = min(info["codificaciones"].values(), default=info["bytes"])
+            originales += info["bytes"]
+            comprimidos += mejor
+            detalle = ", ".join(f"{c} {b:,}" for c, b in info["codificaciones"].items())
+            click.echo(f"  · {rel} -> {info['ruta']} ({info['bytes']:,} B{'; ' + detalle if detalle else ''})")
+        if brotli is None:
+            click.echo("  (sin brotli: solo .gz; pip install brotli)")
+        click.echo(
+            f"✔ {len(manifiesto['archivos'])} archivos en {time.perf_counter() - inicio:.1f}s: "
+            f"{originales:,} B -> {comprimidos:,} B transferidos en el mejor caso"
+        )
+
+    if not app.config["ESTATICOS_HUELLA"] or app.debug:
+        return  # en debug se editan los CSS sin recompilar
+
+    manifiesto = Manifiesto.cargar(app.static_folder, subdir, log=app.logger.warning)
+    app.extensions["estaticos"] = manifiesto
+    if not manifiesto:
+        return
+
+    @app.url_defaults
+    def _con_huella(endpoint, values):
+        if endpoint == "static":
+            info = manifiesto.por_origen.get(values.get("filename"))
+            if info:
+                values["filename"] = info["ruta"]
+
+    servir_original = app.view_functions["static"]
+    max_age = app.config["ESTATICOS_MAX_AGE"]
+
+    def servir_estatico(filename):
+        info = manifiesto.por_ruta.get(filename)
+        if info is None:
+            return servir_original(filename=filename)
+        codificacion, sufijo = _elegir_codificacion(info)
+        ruta = safe_join(app.static_folder, filename + sufijo)
+        try:
+            resp = send_file(ruta, mimetype=info["tipo"], max_age=max_age, conditional=True)
+        except FileNotFoundError:  # manifest en memoria de un worker viejo; el build ya se podó
+            abort(404)
+        if codificacion:
+            resp.headers["Content-Encoding"] = codificacion
+        if info["codificaciones"]:
+            resp.vary.add("Accept-Encoding")
+        resp.cache_control.immutable = True
+        return resp
+
+    app.view_functions["static"] = servir_estatico
@@ -0,0 +1,118 @@
+from .busqueda import buscar_ids
+from .catalogo import obtener_snapshot, consultar
+
+# =========================================================
+# FACETAS DEL LISTADO /productos
+# Una sola pasada sobre el snapshot del catálogo calcula:
+# - los productos que cumplen TODOS los filtros
+# - cuántos hay por marca (ignorando el filtro de marca)
+# - cuántos hay por categoría (ignorando el filtro de categoría)
+# - precio mínimo/máximo (ignorando el filtro de precio)
+# Así el sidebar puede mostrar "Apple (12)" sin consultas extra.
+# La única consulta a la BD es la de FTS cuando hay texto (q).
+# =========================================================
+
+# Tipos “principales” (lo que NO debe caer en accesorios)
+TIPOS_PRINCIPALES = ("Smartphone", "Laptop", "Tablet")
+
+# checkbox del sidebar -> tipo en BD ("accesorios" = todo lo demás)
+CATEGORIAS = {
+    "telefonos": "Smartphone",
+    "laptops": "Laptop",
+    "tablets": "Tablet",
+    "wearables": "Wearable",
+    "accesorios": None,
+}
+
+
+def leer_filtros(args):
+    """Normaliza los filtros del query string (request.args)."""
+    precio_max = args.get("precio_max")
+    try:
+        precio_max_num = float(precio_max) if precio_max not in (None, "") else None
+    except ValueError:
+        precio_max_num = None
+
+    return {
+        "categorias": args.getlist("categoria"),
+        "marcas": args.getlist("marca"),
+        "q": (args.get("q") or "").strip(),
+        "precio_max": precio_max_num,
+    }
+
+
+def clave_filtros(filtros):
+    """Clave estable (orden y mayúsculas no importan) para caches."""
+    return (
+        tuple(sorted(set(filtros["categorias"]))),
+        tuple(sorted(set(filtros["marcas"]))),
+        filtros["q"].lower(),
+        filtros["precio_max"],
+    )
+
+
+def categorias_de(tipo):
+    """Slugs de categoría a los que pertenece un tipo de producto."""
+    slugs = [slug for slug, t in CATEGORIAS.items() if t == tipo]
+    if tipo not in TIPOS_PRINCIPALES:
+        slugs.append("accesorios")
+    return slugs
+
+
+def _calcular(filtros):
+    snapshot = obtener_snapshot()
+
+    categorias = set(c for c in filtros["categorias"] if c in CATEGORIAS)
+    marcas = set(filtros["marcas"])
+    precio_max = filtros["precio_max"]
+
+    # Con texto: candidatos en orden de relevancia (bm25); sin texto: por id
+    if filtros["q"]:
+        ids = buscar_ids(filtros["q"])
+        if ids is None:
+            candidatos = snapshot.productos
+        else:
+            candidatos = [snapshot.por_id[i] for i in ids if i in snapshot.por_id]
+    else:
+        candidatos = snapshot.productos
+
+    productos = []
+    cuenta_marcas = {m: 0 for m in snapshot.marcas}
+    cuenta_categorias = {slug: 0 for slug in CATEGORIAS}
+    precio_min_f = None
+    precio_max_f = None
+
+    for p in candidatos:
+        slugs = categorias_de(p["tipo"])
+        precio = p["precio"]
+
+        ok_categoria = not categorias or any(s in categorias for s in slugs)
+        ok_marca = not marcas or p["marca"] in marcas
+        ok_precio = precio_max is None or (precio is not None and precio <= precio_max)
+
+        if ok_categoria and ok_precio:
+            cuenta_marcas[p["marca"]] = cuenta_marcas.get(p["marca"], 0) + 1
+        if ok_marca and ok_precio:
+            for s in slugs:
+                cuenta_categorias[s] += 1
+        if ok_categoria and ok_marca:
+            if precio is not None:
+                precio_min_f = precio if precio_min_f is None else min(precio_min_f, precio)
+                precio_max_f = precio if precio_max_f is None else max(precio_max_f, precio)
+            if ok_precio:
+                productos.append(p)
+
+    return {
+        "productos": tuple(productos),
+        "total": len(productos),
+        "marcas": cuenta_marcas,
+        "categorias": cuenta_categorias,
+        "precio_min": precio_min_f or 0,
+        "precio_max": precio_max_f or 0,
+        "max_precio_catalogo": snapshot.max_precio,
+    }
+
+
+def facetas(filtros):
+    """Resultado + facetas para unos filtros (memoizado por versión de catálogo)."""
+    return consultar(("facetas",) + clave_filtros(filtros), lambda: _calcular(filtros))
@@ -0,0 +1,163 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from .catalogo import marca_catalogo
+from .condicional import version_deploy
+from .proxy_imagenes import CacheDisco
+
+# =========================================================
+# CACHE DE FRAGMENTOS RENDERIZADOS (tarjetas de producto, resultados)
+#   {% cache "tarjeta", producto.id, loop.index <= 4 %} ... {% endcache %}
+# - La clave es lo que va en la etiqueta + versión del catálogo + versión
+#   del deploy (plantillas y estáticos): editar un producto o desplegar
+#   plantillas nuevas cambia la clave, no hay que borrar nada.
+# - Primer nivel: LRU en memoria por worker acotado a FRAGMENTOS_MAX_BYTES
+#   (se vacía al cambiar la versión del catálogo).
+# - Segundo nivel opcional en disco (FRAGMENTOS_DIR) compartido por todos
+#   los workers, con el mismo LRU por mtime que el proxy de imágenes.
+# - Solo se cachea lo que depende del producto: el contador del carrito,
+#   la sesión de staff y los filtros del formulario siguen dinámicos.
+# - Con app.debug o FRAGMENTOS_HABILITADOS = False la etiqueta solo
+#   renderiza su contenido.
+# =========================================================
+
+
+class CacheFragmentos:
+    def __init__(self, deploy, max_bytes=8 * 1024 * 1024, disco=None):
+        self.deploy = deploy
+        self.max_bytes = int(max_bytes)
+        self.disco = disco
+
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # clave -> html
+        self._bytes = 0
+        self._version = None
+
+        self.hits = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self.expulsiones = 0
+
+    def _guardar_memoria(self, clave, html):
+        with self._lock:
+            if clave in self._entradas:
+                return
+            self._entradas[clave] = html
+            self._bytes += len(html)
+            while self._bytes > self.max_bytes and self._entradas:
+                _, viejo = self._entradas.popitem(last=False)
+                self._bytes -= len(viejo)
+                self.expulsiones += 1
+
+    def _leer_disco(self, clave):
+        entrada = self.disco.leer(clave)
+        if entrada is None:
+            return None
+        try:
+            with open(entrada[1], encoding="utf-8") as f:
+                return f.read()
+        except OSError:  # otro worker lo desalojó entre leer() y open()
+            return None
+
+    def obtener(self, partes, generar):
+        """HTML del fragmento `partes`; si no está, lo genera con `generar()`."""
+        version = marca_catalogo()[0]
+        clave = hashlib.blake2b(repr((self.deploy, version, partes)).encode("utf-8"), digest_size=16).hexdigest()
+
+        with self._lock:
+            if version != self._version:  # catálogo nuevo: lo de memoria ya no sirve
+                self._entradas.clear()
+                self._bytes = 0
+                self._version = version
+            html = self._entradas.get(clave)
+            if html is not None:
+                self._entradas.move_to_end(clave)
+                self.hits += 1
+                return html
+
+        if self.disco is not None:
+            html = self._leer_disco(clave)
+            if html is not None:
+                with self._lock:
+                    self.hits_disco += 1
+                self._guardar_memoria(clave, html)
+                return html
+
+        with self._lock:
+            self.misses += 1
+        html = str(generar())
+        self._guardar_memoria(clave, html)
+        if self.disco is not None:
+            self.disco.guardar(clave, html.encode("utf-8"), {"version": version, "partes": repr(partes)[:200]})
+        return html
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def estadisticas(self):
+        with self._lock:
+            datos = {
+                "version_catalogo": self._version,
+                "entradas": len(self._entradas),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "hits_disco": self.hits_disco,
+                "misses": self.misses,
+                "expulsiones": self.expulsiones,
+            }
+        if self.disco is not None:
+            datos["disco"] = self.disco.estadisticas()
+        return datos
+
+
+class ExtensionFragmentos(Extension):
+    """{% cache nombre, parte, ... %}cuerpo{% endcache %}"""
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragmentos=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        partes = [nodes.Const(parser.name), parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            partes.append(parser.parse_expression())
+        cuerpo = parser.parse_statements(("name:endcache",), drop_needle=True)
+        llamada = self.call_method("_fragmento", [nodes.Tuple(partes, "load")])
+        return nodes.CallBlock(llamada, [], [], cuerpo).set_lineno(lineno)
+
+    def _fragmento(self, partes, caller):
+        cache = self.environment.fragmentos
+        if cache is None:
+            return caller()
+        return Markup(cache.obtener(partes, caller))
+
+
+def estadisticas_fragmentos():
+    cache = current_app.jinja_env.fragmentos
+    return cache.estadisticas() if cache else None
+
+
+def init_app(app):
+    # la etiqueta existe siempre; sin cache solo renderiza su contenido
+    app.jinja_env.add_extension(ExtensionFragmentos)
+    if not app.config["FRAGMENTOS_HABILITADOS"] or app.debug:
+        return  # en debug se editan las plantillas sin reiniciar
+
+    disco = None
+    if app.config["FRAGMENTOS_DIR"]:
+        disco = CacheDisco(app.config["FRAGMENTOS_DIR"], app.config["FRAGMENTOS_DISCO_MAX_BYTES"])
+    app.jinja_env.fragmentos = CacheFragmentos(
+        version_deploy(app)[0], app.config["FRAGMENTOS_MAX_BYTES"], disco
+    )
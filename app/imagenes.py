@@ -0,0 +1,378 @@
+import hashlib
+import io
+import os
+import re
+import time
+import unicodedata
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import click
+from flask import current_app
+
+from .catalogo import invalidar_catalogo
+from .db import get_conn
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow es opcional: sin él las plantillas usan url_imagen tal cual
+    Image = None
+
+# =========================================================
+# PIPELINE DE IMÁGENES DE PRODUCTO
+#   flask procesar-imagenes [--id N] [--descargar] [--forzar] [--limpiar]
+# - Del original (archivo en app/static o, con --descargar, la URL
+#   remota) salen miniaturas de IMAGENES_ANCHOS px en WebP (+ AVIF si
+#   Pillow lo soporta y está en IMAGENES_FORMATOS) y JPEG de respaldo.
+# - Nombres con hash del contenido y sin espacios ni acentos:
+#   static/img/v/iphone15-320w-3f9a1c2b.webp -> se pueden servir con
+#   cache "immutable".
+# - imagen_variantes (migración 8) guarda ancho/alto/bytes/archivo por
+#   producto; si cambia url_imagen un trigger borra las variantes y la
+#   tienda vuelve a la URL original hasta reprocesar.
+# - El snapshot del catálogo trae el srcset armado (producto["imagen"])
+#   y las plantillas lo pintan con el macro de _imagen.html.
+# - Sin Pillow todo sigue funcionando con url_imagen (pero no se aceptan
+#   archivos subidos desde el admin: sin él no hay forma de validarlos).
+# =========================================================
+
+FORMATO_PIL = {"webp": "WEBP", "avif": "AVIF", "jpeg": "JPEG"}
+EXTENSION = {"webp": "webp", "avif": "avif", "jpeg": "jpg"}
+TIPO_MIME = {"webp": "image/webp", "avif": "image/avif", "jpeg": "image/jpeg"}
+
+
+class ImagenNoDisponible(Exception):
+    pass
+
+
+def disponible():
+    return Image is not None
+
+
+def formatos_soportados(formatos):
+    if Image is None:
+        return ()
+    return tuple(f for f in formatos if f == "jpeg" or features.check(f))
+
+
+def slug(texto, largo=40):
+    """'Cargador Rápido 30W' -> 'cargador-rapido-30w'."""
+    texto = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    texto = re.sub(r"[^a-zA-Z0-9]+", "-", texto).strip("-").lower()
+    return texto[:largo].rstrip("-") or "imagen"
+
+
+# ---------------- origen ----------------
+
+def es_remota(url):
+    return urlsplit(url or "").scheme in ("http", "https")
+
+
+def ruta_local(url, static_folder, static_url_path="/static"):
+    """Archivo dentro de static_folder al que apunta url_imagen (o None)."""
+    if not url or es_remota(url):
+        return None
+    ruta = urlsplit(url).path
+    for prefijo in (static_url_path.rstrip("/") + "/", static_url_path.strip("/") + "/"):
+        if ruta.startswith(prefijo):
+            ruta = ruta[len(prefijo):]
+            break
+    base = os.path.realpath(static_folder)
+    completa = os.path.realpath(os.path.join(base, ruta.lstrip("/")))
+    if not completa.startswith(base + os.sep) or not os.path.isfile(completa):
+        return None
+    return completa
+
+
+def descargar(url, max_bytes, timeout=10.0):
+    req = urllib.request.Request(url, headers={"User-Agent": "LaCasaDelGadget/imagenes"})
+    with urllib.request.urlopen(req, timeout=timeout) as r:
+        datos = r.read(max_bytes + 1)
+    if len(datos) > max_bytes:
+        raise ImagenNoDisponible(f"más de {max_bytes} bytes")
+    return datos
+
+
+def leer_origen(url, static_folder, remotas=False, max_bytes=10 * 1024 * 1024):
+    """(bytes, nombre base) del original de url_imagen."""
+    local = ruta_local(url, static_folder)
+    if local:
+        with open(local, "rb") as f:
+            return f.read(), os.path.splitext(os.path.basename(local))[0]
+    if es_remota(url):
+        if not remotas:
+            raise ImagenNoDisponible("URL remota (usa --descargar)")
+        try:
+            datos = descargar(url, max_bytes)
+        except OSError as e:
+            raise ImagenNoDisponible(f"no se pudo descargar: {e}")
+        nombre = os.path.splitext(os.path.basename(urlsplit(url).path))[0]
+        return datos, nombre
+    raise ImagenNoDisponible("sin imagen local")
+
+
+# ---------------- variantes ----------------
+
+def generar_variantes(datos, nombre, anchos, formatos, calidad=80):
+    """Lista de (formato, ancho, alto, nombre_archivo, bytes) para un original."""
+    if Image is None:
+        raise ImagenNoDisponible("Pillow no está instalado")
+    try:
+        original = Image.open(io.BytesIO(datos))
+        original = ImageOps.exif_transpose(original)
+        original.load()
+    except Exception as e:  # noqa: BLE001 - Pillow lanza de todo con archivos rotos
+        raise ImagenNoDisponible(f"imagen inválida: {e}")
+
+    con_alfa = original.mode in ("RGBA", "LA") or (original.mode == "P" and "transparency" in original.info)
+    base = original.convert("RGBA" if con_alfa else "RGB")
+    # nunca agrandar: anchos mayores al original se reducen a uno solo
+    anchos = sorted({min(int(a), base.width) for a in anchos})
+    prefijo = slug(nombre)
+
+    salida = []
+    for ancho in anchos:
+        alto = max(1, round(base.height * ancho / base.width))
+        img = base if ancho == base.width else base.resize((ancho, alto), Image.LANCZOS)
+        for formato in formatos:
+            copia = img
+            if formato == "jpeg" and copia.mode == "RGBA":
+                fondo = Image.new("RGB", copia.size, (255, 255, 255))
+                fondo.paste(copia, mask=copia.getchannel("A"))
+                copia = fondo
+            buf = io.BytesIO()
+            opciones = {"quality": calidad}
+            if formato == "jpeg":
+                opciones.update(optimize=True, progressive=True)
+            elif formato == "webp":
+                opciones.update(method=4)
+            copia.save(buf, FORMATO_PIL[formato], **opciones)
+            contenido = buf.getvalue()
+            h = hashlib.blake2b(contenido, digest_size=4).hexdigest()
+            salida.append((formato, ancho, alto, f"{prefijo}-{ancho}w-{h}.{EXTENSION[formato]}", contenido))
+    return salida
+
+
+def _guardar(directorio, archivo, contenido):
+    ruta = os.path.join(directorio, archivo)
+    if not os.path.exists(ruta):  # mismo hash = mismo contenido
+        tmp = f"{ruta}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(contenido)
+        os.replace(tmp, ruta)
+
+
+def _config(app):
+    return {
+        "static_folder": app.static_folder,
+        "directorio": os.path.join(app.static_folder, app.config["IMAGENES_DIR"]),
+        "subdir": app.config["IMAGENES_DIR"].strip("/"),
+        "anchos": app.config["IMAGENES_ANCHOS"],
+        "formatos": formatos_soportados(app.config["IMAGENES_FORMATOS"]),
+        "calidad": app.config["IMAGENES_CALIDAD"],
+        "max_bytes": app.config["IMAGENES_MAX_BYTES"],
+    }
+
+
+def _leer(cfg, url, remotas):
+    """Original + su hash (sin BD, corre en hilos): (origen_hash, datos, nombre)."""
+    datos, nombre = leer_origen(url, cfg["static_folder"], remotas, cfg["max_bytes"])
+    origen_hash = hashlib.blake2b(datos, digest_size=16).hexdigest()
+    return origen_hash, datos, nombre
+
+
+def _escribir_variantes(conn, cfg, producto_id, url, origen_hash, variantes):
+    os.makedirs(cfg["directorio"], exist_ok=True)
+    for _, _, _, archivo, contenido in variantes:
+        _guardar(cfg["directorio"], archivo, contenido)
+    conn.execute("DELETE FROM imagen_variantes WHERE producto_id = ?", (producto_id,))
+    conn.executemany("""
+        INSERT INTO imagen_variantes (producto_id, formato, ancho, alto, archivo, bytes, origen, origen_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [
+        (producto_id, formato, ancho, alto, f"{cfg['subdir']}/{archivo}", len(contenido), url, origen_hash)
+        for formato, ancho, alto, archivo, contenido in variantes
+    ])
+
+
+def procesar_producto(producto_id, remotas=False):
+    """Hook de admin: genera las variantes de un producto si su imagen es local.
+
+    Regresa True si cambió algo. No lanza si falta Pillow o la imagen.
+    """
+    app = current_app
+    if not disponible() or not app.config["IMAGENES_HABILITADAS"]:
+        return False
+    conn = get_conn()
+    row = conn.execute("SELECT url_imagen FROM productos WHERE id = ?", (producto_id,)).fetchone()
+    if not row or not row["url_imagen"]:
+        return False
+    cfg = _config(app)
+    try:
+        origen_hash, datos, nombre = _leer(cfg, row["url_imagen"], remotas)
+        actual = conn.execute(
+            "SELECT origen_hash FROM imagen_variantes WHERE producto_id = ? LIMIT 1", (producto_id,)
+        ).fetchone()
+        if actual and actual["origen_hash"] == origen_hash:
+            return False
+        variantes = generar_variantes(datos, nombre, cfg["anchos"], cfg["formatos"], cfg["calidad"])
+        _escribir_variantes(conn, cfg, producto_id, row["url_imagen"], origen_hash, variantes)
+    except (ImagenNoDisponible, OSError) as e:
+        conn.rollback()
+        app.logger.info("Imagen del producto %s sin procesar: %s", producto_id, e)
+        return False
+    invalidar_catalogo(conn)
+    conn.commit()
+    return True
+
+
+# formato que detecta Pillow -> extensión con la que se guarda la subida
+EXTENSION_SUBIDA = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp", "GIF": ".gif", "AVIF": ".avif"}
+
+
+def guardar_subida(archivo, static_folder, subdir="img/productos"):
+    """Guarda un archivo subido desde el admin; regresa su url_imagen (/static/...).
+
+    Solo se acepta lo que Pillow abre como imagen; la extensión sale del
+    formato detectado, no del nombre del archivo.
+    """
+    if Image is None:
+        raise ImagenNoDisponible("subir imágenes requiere Pillow; usa una URL de imagen")
+    datos = archivo.read()
+    try:
+        with Image.open(io.BytesIO(datos)) as img:
+            formato = img.format
+            img.verify()
+    except Exception:  # noqa: BLE001
+        raise ImagenNoDisponible("archivo de imagen no válido")
+    ext = EXTENSION_SUBIDA.get(formato)
+    if ext is None:
+        raise ImagenNoDisponible(f"formato de imagen no permitido ({formato})")
+    nombre = os.path.splitext(os.path.basename(archivo.filename or ""))[0]
+    h = hashlib.blake2b(datos, digest_size=4).hexdigest()
+    final = f"{slug(nombre)}-{h}{ext}"
+    directorio = os.path.join(static_folder, subdir)
+    os.makedirs(directorio, exist_ok=True)
+    _guardar(directorio, final, datos)
+    return f"/static/{subdir}/{final}"
+
+
+# ---------------- para el snapshot / plantillas ----------------
+
+def variantes_por_producto(conn, static_url_path="/static"):
+    """{producto_id: {"src", "ancho", "alto", "fuentes": [(mime, srcset)]}} para el catálogo."""
+    filas = conn.execute("""
+        SELECT producto_id, formato, ancho, alto, archivo
+        FROM imagen_variantes
+        ORDER BY producto_id, formato, ancho
+    """).fetchall()
+    por_producto = {}
+    for r in filas:
+        por_producto.setdefault(r["producto_id"], {}).setdefault(r["formato"], []).append(r)
+
+    orden = ("avif", "webp")  # el navegador toma la primera <source> que soporte
+    resultado = {}
+    for pid, formatos in por_producto.items():
+        respaldo = formatos.get("jpeg") or next(iter(formatos.values()))
+        mediana = respaldo[len(respaldo) // 2]
+        resultado[pid] = {
+            "src": f"{static_url_path}/{mediana['archivo']}",
+            "srcset": ", ".join(f"{static_url_path}/{r['archivo']} {r['ancho']}w" for r in respaldo),
+            "ancho": mediana["ancho"],
+            "alto": mediana["alto"],
+            "fuentes": tuple(
+                (TIPO_MIME[f], ", ".join(f"{static_url_path}/{r['archivo']} {r['ancho']}w" for r in formatos[f]))
+                for f in orden if f in formatos
+            ),
+        }
+    return resultado
+
+
+# ---------------- CLI ----------------
+
+def _limpiar_huerfanas(conn, cfg):
+    """Borra archivos de IMAGENES_DIR que ya no usa ningún producto."""
+    if not os.path.isdir(cfg["directorio"]):
+        return 0, 0
+    usados = {os.path.basename(r[0]) for r in conn.execute("SELECT archivo FROM imagen_variantes")}
+    borrados = liberados = 0
+    for nombre in os.listdir(cfg["directorio"]):
+        if nombre not in usados:
+            ruta = os.path.join(cfg["directorio"], nombre)
+            liberados += os.path.getsize(ruta)
+            os.remove(ruta)
+            borrados += 1
+    return borrados, liberados
+
+
+def init_app(app):
+    @app.cli.command("procesar-imagenes")
+    @click.option("--id", "ids", type=int, multiple=True, help="Solo estos productos (repetible).")
+    @click.option("--descargar", is_flag=True, help="También bajar y procesar url_imagen remotas.")
+    @click.option("--forzar", is_flag=True, help="Regenerar aunque el original no haya cambiado.")
+    @click.option("--limpiar", is_flag=True, help="Borrar variantes que ya no usa ningún producto.")
+    @click.option("--hilos", default=os.cpu_count() or 2, show_default=True)
+    def procesar_imagenes(ids, descargar, forzar, limpiar, hilos):
+        """Genera miniaturas WebP/JPEG con nombre por hash para las imágenes de productos."""
+        if not disponible():
+            raise click.ClickException("Falta Pillow: pip install Pillow")
+        cfg = _config(app)
+        click.echo(f"Anchos {list(cfg['anchos'])}, formatos {list(cfg['formatos'])} -> static/{cfg['subdir']}/")
+
+        conn = get_conn()
+        sql = "SELECT id, url_imagen FROM productos WHERE url_imagen IS NOT NULL AND url_imagen != ''"
+        if ids:
+            sql += f" AND id IN ({','.join('?' * len(ids))})"
+        productos = conn.execute(sql, ids).fetchall()
+        previos = {
+            r["producto_id"]: r["origen_hash"]
+            for r in conn.execute("SELECT producto_id, MIN(origen_hash) AS origen_hash FROM imagen_variantes GROUP BY producto_id")
+        }
+
+        def trabajo(fila):
+            try:
+                origen_hash, datos, nombre = _leer(cfg, fila["url_imagen"], descargar)
+                if not forzar and previos.get(fila["id"]) == origen_hash:
+                    return fila, "igual", len(datos), None
+                variantes = generar_variantes(datos, nombre, cfg["anchos"], cfg["formatos"], cfg["calidad"])
+                return fila, origen_hash, len(datos), variantes
+            except ImagenNoDisponible as e:
+                return fila, None, 0, str(e)
+
+        inicio = time.perf_counter()
+        hechos = iguales = omitidos = 0
+        bytes_original = bytes_tarjeta = 0
+        tarjeta = sorted(cfg["anchos"])[len(cfg["anchos"]) // 2]
+        # el trabajo pesado (descarga + Pillow) en hilos; la BD solo en este hilo
+        with ThreadPoolExecutor(max(1, hilos)) as pool:
+            for fila, origen_hash, tam, resultado in pool.map(trabajo, productos):
+                if origen_hash is None:
+                    omitidos += 1
+                    click.echo(f"  · {fila['id']}: {resultado}", err=True)
+                    continue
+                if origen_hash == "igual":
+                    iguales += 1
+                    continue
+                _escribir_variantes(conn, cfg, fila["id"], fila["url_imagen"], origen_hash, resultado)
+                conn.commit()
+                hechos += 1
+                bytes_original += tam
+                chicas = [v for v in resultado if v[0] != "jpeg" and v[1] <= tarjeta] or resultado
+                bytes_tarjeta += len(max(chicas, key=lambda v: v[1])[4])
+
+        if hechos:
+            invalidar_catalogo(conn)
+            conn.commit()
+        click.echo(
+            f"✔ {hechos} procesados, {iguales} sin cambio, {omitidos} omitidos "
+            f"en {time.perf_counter() - inicio:.1f}s"
+        )
+        if bytes_original:
+            click.echo(
+                f"  originales {bytes_original / 1024:,.0f} KB -> tarjeta {tarjeta}px "
+                f"{bytes_tarjeta / 1024:,.0f} KB ({bytes_tarjeta / bytes_original:.0%})"
+            )
+        if limpiar:
+            borrados, liberados = _limpiar_huerfanas(conn, cfg)
+            click.echo(f"  limpieza: {borrados} archivos, {liberados / 1024:,.0f} KB")
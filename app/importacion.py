@@ -0,0 +1,400 @@
+import csv
+import json
+import os
+import sqlite3
+import time
+
+import click
+
+from .catalogo import invalidar_catalogo
+from .checkout import _es_busy
+from .metricas import _vivo
+
+# =========================================================
+# IMPORTAR / EXPORTAR CATÁLOGO (gadget.db)
+#   flask importar-catalogo proveedor.jsonl --lote 5000
+#   flask exportar-catalogo catalogo.csv
+# - Lee JSON Lines, CSV o un arreglo JSON (app/static/productos.json)
+#   renglón por renglón: la memoria no depende del tamaño del archivo.
+# - Upsert por id (o por codigo_barras si no trae id) con executemany,
+#   un lote = una transacción. Nada se borra: lo que no viene en el
+#   archivo se queda como está.
+# - Renglones con solo algunas columnas (ej. id,precio) actualizan esas
+#   columnas y no insertan.
+# - --diferir-indices quita los índices secundarios y los triggers de
+#   FTS de productos durante la carga y los reconstruye al final. Su SQL
+#   queda en indices_diferidos con el pid de la carga, que da un latido
+#   por lote: si la carga muere (pid inexistente o sin latido en
+#   LATIDO_MAX_S), el siguiente arranque o la siguiente importación los
+#   repone. Mientras la carga vive nadie más los toca.
+# - Para aplicar un feed completo (con bajas y sin reescribir lo que no
+#   cambió) ver app/sincronizacion.py.
+# =========================================================
+
+COLUMNAS = (
+    "id", "nombre", "marca", "tipo", "color", "almacenamiento", "precio",
+    "descripcion", "url_imagen", "disponible", "codigo_barras",
+)
+REQUERIDAS = ("nombre", "marca", "tipo")
+
+_ENTEROS = ("id",)
+_REALES = ("precio",)
+_VERDADERO = ("1", "true", "si", "sí", "yes", "t", "x")
+
+
+class RenglonInvalido(ValueError):
+    pass
+
+
+# ---------------- lectura en streaming ----------------
+
+def _leer_jsonl(f):
+    for n, linea in enumerate(f, 1):
+        linea = linea.strip()
+        if linea:
+            try:
+                yield json.loads(linea)
+            except json.JSONDecodeError as e:
+                raise click.ClickException(f"Línea {n}: JSON inválido ({e.msg})")
+
+
+def _leer_csv(f):
+    yield from csv.DictReader(f)
+
+
+def _leer_arreglo_json(f, bloque=1 << 16):
+    """Objetos de un arreglo JSON [ {...}, {...} ] sin cargarlo completo."""
+    decoder = json.JSONDecoder()
+    buf = ""
+    inicio = False
+    fin = False
+    while not fin:
+        trozo = f.read(bloque)
+        fin = not trozo
+        buf += trozo
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if not inicio:
+                if buf[pos] != "[":
+                    raise click.ClickException("El archivo JSON debe ser un arreglo de productos")
+                inicio = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if fin:
+                    raise click.ClickException("JSON incompleto o inválido")
+                break  # falta texto: leer otro bloque
+            yield obj
+        buf = buf[pos:]
+
+
+LECTORES = {"jsonl": _leer_jsonl, "csv": _leer_csv, "json": _leer_arreglo_json}
+
+
+def formato_de(ruta, formato=None):
+    if formato:
+        return formato
+    ext = os.path.splitext(ruta)[1].lower().lstrip(".")
+    if ext in ("jsonl", "ndjson"):
+        return "jsonl"
+    if ext in LECTORES:
+        return ext
+    raise click.ClickException(f"No sé leer '{ruta}': usa --formato jsonl|csv|json")
+
+
+def normalizar(renglon):
+    """Dict del archivo -> {columna: valor} solo con columnas conocidas."""
+    limpio = {}
+    for col in COLUMNAS:
+        if col not in renglon:
+            continue
+        valor = renglon[col]
+        if isinstance(valor, str):
+            valor = valor.strip()
+            if valor == "":
+                valor = None
+        try:
+            if valor is not None and col in _ENTEROS:
+                valor = int(valor)
+            elif valor is not None and col in _REALES:
+                valor = float(valor)
+            elif col == "disponible":
+                valor = 1 if (valor if isinstance(valor, (bool, int)) else str(valor).lower() in _VERDADERO) else 0
+        except (TypeError, ValueError):
+            raise RenglonInvalido(f"{col}={renglon[col]!r}")
+        limpio[col] = valor
+
+    if limpio.get("id") is None:
+        limpio.pop("id", None)
+        if not limpio.get("codigo_barras"):
+            raise RenglonInvalido("sin id ni codigo_barras")
+    return limpio
+
+
+# ---------------- escritura por lotes ----------------
+
+def _sql_para(columnas):
+    """SQL de upsert (renglón completo) o de UPDATE (renglón parcial)."""
+    llave = "id" if "id" in columnas else "codigo_barras"
+    resto = [c for c in columnas if c != llave]
+
+    if all(c in columnas for c in REQUERIDAS):
+        asignar = ", ".join(f"{c} = excluded.{c}" for c in resto)
+        return f"""
+            INSERT INTO productos ({", ".join(columnas)})
+            VALUES ({", ".join("?" * len(columnas))})
+            ON CONFLICT ({llave}) DO UPDATE SET {asignar},
+                hash_contenido = NULL, actualizado_en = CURRENT_TIMESTAMP
+        """, columnas
+
+    asignar = ", ".join(f"{c} = ?" for c in resto)
+    return f"""
+        UPDATE productos SET {asignar}, hash_contenido = NULL, actualizado_en = CURRENT_TIMESTAMP
+        WHERE {llave} = ?
+    """, tuple(resto) + (llave,)
+
+
+def _escribir_lote(conn, lote):
+    """Un lote en una transacción; agrupa por juego de columnas."""
+    grupos = {}
+    for renglon in lote:
+        # normalizar() deja las llaves en el orden de COLUMNAS
+        grupos.setdefault(tuple(renglon), []).append(renglon)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for columnas, renglones in grupos.items():
+            sql, orden = _sql_para(columnas)
+            if orden == columnas:
+                valores = [tuple(r.values()) for r in renglones]
+            else:
+                valores = [tuple(r[c] for c in orden) for r in renglones]
+            conn.executemany(sql, valores)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+# Solo lo que se puede reconstruir de golpe al final: índices no únicos
+# (los únicos son llave del upsert) y los triggers de FTS. Los demás
+# triggers de productos (hash, variantes de imagen, resumen_stock) siguen
+# activos durante la carga.
+_SQL_DIFERIBLES = """
+    SELECT type, name, sql FROM sqlite_master
+    WHERE tbl_name = 'productos' AND sql IS NOT NULL
+      AND ((type = 'index' AND sql NOT LIKE 'CREATE UNIQUE %')
+           OR (type = 'trigger' AND name GLOB 'productos_fts_*'))
+"""
+
+
+LATIDO_MAX_S = 15 * 60  # sin latido en este tiempo la carga se da por muerta (pid reciclado, colgada)
+
+
+def _quitar_indices(conn):
+    """Quita índices secundarios y triggers de FTS; su SQL queda en indices_diferidos."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        objetos = conn.execute(_SQL_DIFERIBLES).fetchall()
+        conn.executemany(
+            "INSERT OR REPLACE INTO indices_diferidos (nombre, tipo, sql, pid, latido) "
+            "VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
+            [(nombre, tipo, sql, os.getpid()) for tipo, nombre, sql in objetos],
+        )
+        for tipo, nombre, _ in objetos:
+            conn.execute(f'DROP {"INDEX" if tipo == "index" else "TRIGGER"} IF EXISTS "{nombre}"')
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return len(objetos)
+
+
+def _latido(conn):
+    conn.execute("UPDATE indices_diferidos SET latido = CURRENT_TIMESTAMP WHERE pid = ?", (os.getpid(),))
+
+
+def _reponibles(conn):
+    """(nombre, sql) de indices_diferidos cuya carga es este proceso o ya murió."""
+    filas = conn.execute(
+        "SELECT nombre, sql, pid, (julianday('now') - julianday(latido)) * 86400 FROM indices_diferidos"
+    ).fetchall()
+    return [
+        (nombre, sql) for nombre, sql, pid, edad in filas
+        if pid is None or pid == os.getpid() or edad is None or edad > LATIDO_MAX_S or not _vivo(pid)
+    ]
+
+
+def _restaurar_indices(conn):
+    """Repone lo pendiente en indices_diferidos de esta carga o de una que murió."""
+    # lectura simple: casi siempre no hay nada y no se pide el candado de escritura
+    if not _reponibles(conn):
+        return 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        pendientes = _reponibles(conn)  # otra vez, ya con el candado
+        existentes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master")}
+        repuestos = [nombre for nombre, sql in pendientes if nombre not in existentes]
+        for nombre, sql in pendientes:
+            if nombre not in existentes:
+                conn.execute(sql)
+        if any(nombre.startswith("productos_fts") for nombre in repuestos):
+            conn.execute("INSERT INTO productos_fts (productos_fts) VALUES ('rebuild')")
+        conn.executemany("DELETE FROM indices_diferidos WHERE nombre = ?", [(nombre,) for nombre, _ in pendientes])
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return len(repuestos)
+
+
+def restaurar_indices_pendientes(db_path):
+    """Al arrancar: repone índices y triggers que dejó quitados una carga que murió."""
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=1.0)
+    try:
+        repuestos = _restaurar_indices(conn)
+        if repuestos:
+            invalidar_catalogo(conn)
+    except sqlite3.OperationalError as e:
+        if not _es_busy(e):
+            raise
+        repuestos = 0  # otro proceso está escribiendo (ej. la carga reconstruyendo); lo verá el siguiente arranque
+    finally:
+        conn.close()
+    return repuestos
+
+
+def importar(db_path, renglones, lote=5000, diferir_indices=False, progreso=None):
+    """Carga `renglones` (iterable de dicts). Regresa (leidos, invalidos, segundos)."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -65536")  # 64 MB para reconstruir índices
+
+    inicio = aviso = time.perf_counter()
+    leidos = invalidos = 0
+    _restaurar_indices(conn)  # lo que haya dejado una carga anterior que murió
+    diferidos = _quitar_indices(conn) if diferir_indices else 0
+    try:
+        pendiente = []
+        for crudo in renglones:
+            try:
+                pendiente.append(normalizar(crudo))
+            except RenglonInvalido as e:
+                invalidos += 1
+                if progreso:
+                    progreso(f"  renglón {leidos + invalidos} ignorado: {e}")
+                continue
+            leidos += 1
+            if len(pendiente) >= lote:
+                _escribir_lote(conn, pendiente)
+                pendiente = []
+                if diferidos:
+                    _latido(conn)
+                if progreso and time.perf_counter() - aviso >= 1.0:
+                    aviso = time.perf_counter()
+                    progreso(f"  {leidos:,} renglones ({leidos / (aviso - inicio):,.0f}/s)")
+        if pendiente:
+            _escribir_lote(conn, pendiente)
+    finally:
+        if diferidos:
+            _restaurar_indices(conn)
+        if leidos:
+            invalidar_catalogo(conn)
+        conn.close()
+    return leidos, invalidos, time.perf_counter() - inicio
+
+
+def exportar(db_path, salida, formato, lote=5000):
+    """Escribe el catálogo completo en `salida` (mismo formato que importar)."""
+    conn = sqlite3.connect(db_path)
+    cur = conn.execute(f"SELECT {', '.join(COLUMNAS)} FROM productos ORDER BY id ASC")
+    total = 0
+
+    if formato == "csv":
+        w = csv.writer(salida)
+        w.writerow(COLUMNAS)
+    elif formato == "json":
+        salida.write("[\n")
+
+    while True:
+        filas = cur.fetchmany(lote)
+        if not filas:
+            break
+        for fila in filas:
+            if formato == "csv":
+                w.writerow(["" if v is None else v for v in fila])
+            else:
+                obj = dict(zip(COLUMNAS, fila))
+                obj["disponible"] = bool(obj["disponible"])
+                texto = json.dumps(obj, ensure_ascii=False)
+                if formato == "json":
+                    texto = ("  " if total == 0 else ",\n  ") + texto
+                    salida.write(texto)
+                else:
+                    salida.write(texto + "\n")
+            total += 1
+
+    if formato == "json":
+        salida.write("\n]\n")
+    conn.close()
+    return total
+
+
+def _abrir(archivo, modo):
+    if archivo == "-":
+        return click.get_text_stream("stdin" if modo == "r" else "stdout", encoding="utf-8")
+    return open(archivo, modo, encoding="utf-8", newline="")
+
+
+def init_app(app):
+    with app.app_context():
+        repuestos = restaurar_indices_pendientes(app.config["DATABASE"])
+    if repuestos:
+        print(f"✔ {repuestos} índices/triggers de productos repuestos (carga con --diferir-indices interrumpida)")
+
+    @app.cli.command("importar-catalogo")
+    @click.argument("archivo", type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+    @click.option("--formato", type=click.Choice(sorted(LECTORES)), help="Por defecto, según la extensión.")
+    @click.option("--lote", default=5000, show_default=True, help="Renglones por transacción.")
+    @click.option("--diferir-indices", is_flag=True, help="Reconstruir índices y FTS al final (cargas grandes).")
+    def importar_catalogo(archivo, formato, lote, diferir_indices):
+        """Upsert de productos desde JSON Lines, CSV o arreglo JSON."""
+        formato = formato_de(archivo, formato) if archivo != "-" else (formato or "jsonl")
+        with _abrir(archivo, "r") as f:
+            try:
+                leidos, invalidos, seg = importar(
+                    app.config["DATABASE"],
+                    LECTORES[formato](f),
+                    lote=max(1, lote),
+                    diferir_indices=diferir_indices,
+                    progreso=lambda m: click.echo(m, err=True),
+                )
+            except sqlite3.IntegrityError as e:
+                # los lotes anteriores ya quedaron guardados
+                raise click.ClickException(f"Lote rechazado: {e}")
+        click.echo(
+            f"✔ {leidos:,} productos en {seg:.2f}s ({leidos / max(seg, 1e-9):,.0f} renglones/s)"
+            + (f", {invalidos} ignorados" if invalidos else "")
+        )
+
+    @app.cli.command("exportar-catalogo")
+    @click.argument("archivo", type=click.Path(dir_okay=False, allow_dash=True), default="-")
+    @click.option("--formato", type=click.Choice(sorted(LECTORES)), help="Por defecto, según la extensión.")
+    def exportar_catalogo(archivo, formato):
+        """Exporta productos en el mismo formato que lee importar-catalogo."""
+        formato = formato_de(archivo, formato) if archivo != "-" else (formato or "jsonl")
+        inicio = time.perf_counter()
+        with _abrir(archivo, "w") as f:
+            total = exportar(app.config["DATABASE"], f, formato)
+        seg = time.perf_counter() - inicio
+        click.echo(f"✔ {total:,} productos en {seg:.2f}s ({total / max(seg, 1e-9):,.0f} renglones/s)", err=True)
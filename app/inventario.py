@@ -0,0 +1,256 @@
+import random
+import sqlite3
+import threading
+import time
+
+from flask import current_app
+
+from .checkout import StockInsuficiente, _es_busy
+
+# =========================================================
+# INVENTARIO POR SUCURSAL (gadget.db)
+# - inventario tiene UNA fila por (producto_id, sucursal) (índice único,
+#   migración 10).
+# - resumen_stock.stock_total lo mantienen los triggers de la migración 5
+#   y todo producto tiene su renglón: el total de un producto es una
+#   lectura por llave primaria, sin SUM (carrito, admin_productos).
+# - Ajustes y traspasos en BEGIN IMMEDIATE con UPDATE ... WHERE stock >= ?
+#   (igual que checkout.py): nunca se descuenta lo que no hay, y cada
+#   movimiento queda en registro_inventario.
+# - Un traspaso no cambia el total: los dos UPDATE pasan por el trigger
+#   y se compensan dentro de la misma transacción.
+# =========================================================
+
+
+class MovimientoInvalido(ValueError):
+    pass
+
+
+def stock_total(conn, producto_id):
+    """Piezas de `producto_id` en todas las sucursales (resumen_stock)."""
+    row = conn.execute(
+        "SELECT stock_total FROM resumen_stock WHERE producto_id = ?", (int(producto_id),)
+    ).fetchone()
+    return int(row[0]) if row else 0
+
+
+def _uno(cur, sql, params):
+    """Primer renglón de un RETURNING; fetchall para que la sentencia termine antes del COMMIT."""
+    filas = cur.execute(sql, params).fetchall()
+    return filas[0] if filas else None
+
+
+class Inventario:
+    def __init__(self, sucursales, stock_bajo=5):
+        self.sucursales = tuple(sucursales)
+        self.stock_bajo = int(stock_bajo)
+
+        self._lock = threading.Lock()
+        self.ajustes = 0
+        self.traspasos = 0
+        self.rechazos = 0
+
+    def validar_sucursal(self, sucursal):
+        sucursal = (sucursal or "").strip()
+        if sucursal not in self.sucursales:
+            raise MovimientoInvalido(f"Sucursal desconocida: {sucursal or '(vacía)'}")
+        return sucursal
+
+    # ---------------------------------------------------------
+    # lecturas
+    # ---------------------------------------------------------
+
+    def por_sucursal(self, conn, producto_id):
+        """{sucursal: piezas} de un producto; las sucursales sin fila salen en 0."""
+        stock = dict.fromkeys(self.sucursales, 0)
+        for sucursal, piezas in conn.execute(
+            "SELECT sucursal, stock FROM inventario WHERE producto_id = ?", (int(producto_id),)
+        ):
+            stock[sucursal] = int(piezas or 0)
+        return stock
+
+    def tabla(self, conn):
+        """Todos los productos con su stock por sucursal y el total materializado.
+
+        Regresa (sucursales, renglones). Si hay filas de una sucursal que ya no
+        está en la configuración, se agrega al final para no esconder piezas.
+        """
+        por_producto = {}
+        extra = []
+        for producto_id, sucursal, piezas in conn.execute(
+            "SELECT producto_id, sucursal, stock FROM inventario ORDER BY producto_id"
+        ):
+            if sucursal not in self.sucursales and sucursal not in extra:
+                extra.append(sucursal)
+            por_producto.setdefault(producto_id, {})[sucursal] = int(piezas or 0)
+
+        sucursales = self.sucursales + tuple(extra)
+        renglones = []
+        for producto_id, nombre, marca, disponible, total in conn.execute("""
+            SELECT p.id, p.nombre, p.marca, p.disponible, COALESCE(s.stock_total, 0)
+            FROM productos p
+            LEFT JOIN resumen_stock s ON s.producto_id = p.id
+            ORDER BY p.id ASC
+        """):
+            stock = por_producto.get(producto_id, {})
+            renglones.append({
+                "id": producto_id,
+                "nombre": nombre,
+                "marca": marca,
+                "disponible": disponible,
+                "stock_total": int(total),
+                "por_sucursal": {s: stock.get(s, 0) for s in sucursales},
+                "bajo": total < self.stock_bajo,
+            })
+        return sucursales, renglones
+
+    # ---------------------------------------------------------
+    # movimientos
+    # ---------------------------------------------------------
+
+    def mover(self, cur, producto_id, sucursal, cambio, motivo):
+        """Suma `cambio` (negativo = salida) a la fila de la sucursal.
+
+        Corre dentro de la transacción que ya tenga abierta `cur`. Regresa
+        las piezas que quedan en esa sucursal; lanza StockInsuficiente si
+        la salida es mayor a lo que hay.
+        """
+        cambio = int(cambio)
+        if cambio < 0:
+            row = _uno(cur, """
+                UPDATE inventario
+                SET stock = stock + ?, actualizado_en = CURRENT_TIMESTAMP
+                WHERE producto_id = ? AND sucursal = ? AND stock >= ?
+                RETURNING id, stock
+            """, (cambio, producto_id, sucursal, -cambio))
+            if row is None:
+                disponible = cur.execute(
+                    "SELECT stock FROM inventario WHERE producto_id = ? AND sucursal = ?", (producto_id, sucursal)
+                ).fetchone()
+                raise StockInsuficiente(producto_id, -cambio, int(disponible[0]) if disponible else 0)
+        else:
+            row = _uno(cur, """
+                INSERT INTO inventario (producto_id, sucursal, stock)
+                VALUES (?, ?, ?)
+                ON CONFLICT (producto_id, sucursal) DO UPDATE SET
+                    stock = stock + excluded.stock,
+                    actualizado_en = CURRENT_TIMESTAMP
+                RETURNING id, stock
+            """, (producto_id, sucursal, cambio))
+
+        inventario_id, quedan = int(row[0]), int(row[1])
+        if cambio:
+            cur.execute("""
+                INSERT INTO registro_inventario (inventario_id, cambio, motivo)
+                VALUES (?, ?, ?)
+            """, (inventario_id, cambio, motivo))
+        return quedan
+
+    def _transaccion(self, conn, producto_id, paso, reintentos=5, espera_base=0.02):
+        """Corre paso(cur) en BEGIN IMMEDIATE; reintenta si la BD está ocupada."""
+        for intento in range(reintentos + 1):
+            try:
+                cur = conn.cursor()
+                cur.execute("BEGIN IMMEDIATE")
+                try:
+                    if cur.execute("SELECT 1 FROM productos WHERE id = ?", (producto_id,)).fetchone() is None:
+                        raise MovimientoInvalido(f"Producto {producto_id} no existe")
+                    resultado = paso(cur)
+                    conn.commit()
+                    return resultado
+                except BaseException:
+                    conn.rollback()
+                    raise
+            except StockInsuficiente:
+                with self._lock:
+                    self.rechazos += 1
+                raise
+            except sqlite3.OperationalError as e:
+                if not _es_busy(e) or intento == reintentos:
+                    raise
+                time.sleep(espera_base * (2 ** intento) * (1 + random.random()))
+
+    def ajustar(self, conn, producto_id, sucursal, cambio, motivo="ajuste manual", **kw):
+        """Entrada (+) o salida (-) en una sucursal. Regresa las piezas que quedan ahí."""
+        sucursal = self.validar_sucursal(sucursal)
+        producto_id, cambio = int(producto_id), int(cambio)
+        if cambio == 0:
+            raise MovimientoInvalido("El ajuste debe ser distinto de 0")
+
+        def paso(cur):
+            return self.mover(cur, producto_id, sucursal, cambio, motivo)
+
+        quedan = self._transaccion(conn, producto_id, paso, **kw)
+        with self._lock:
+            self.ajustes += 1
+        return quedan
+
+    def fijar(self, conn, producto_id, sucursal, stock, motivo="conteo físico", **kw):
+        """Deja la sucursal en exactamente `stock` piezas (registra la diferencia)."""
+        sucursal = self.validar_sucursal(sucursal)
+        producto_id, stock = int(producto_id), int(stock)
+        if stock < 0:
+            raise MovimientoInvalido("El stock no puede ser negativo")
+
+        def paso(cur):
+            row = cur.execute(
+                "SELECT stock FROM inventario WHERE producto_id = ? AND sucursal = ?", (producto_id, sucursal)
+            ).fetchone()
+            actual = int(row[0]) if row else 0
+            if row is not None and actual == stock:
+                return stock
+            return self.mover(cur, producto_id, sucursal, stock - actual, motivo)
+
+        quedan = self._transaccion(conn, producto_id, paso, **kw)
+        with self._lock:
+            self.ajustes += 1
+        return quedan
+
+    def transferir(self, conn, producto_id, origen, destino, cantidad, motivo=None, **kw):
+        """Mueve piezas entre sucursales. Regresa (quedan en origen, quedan en destino).
+
+        Lanza MovimientoInvalido (datos) o StockInsuficiente (no alcanza en
+        el origen) sin modificar nada.
+        """
+        origen = self.validar_sucursal(origen)
+        destino = self.validar_sucursal(destino)
+        producto_id, cantidad = int(producto_id), int(cantidad)
+        if origen == destino:
+            raise MovimientoInvalido("El origen y el destino son la misma sucursal")
+        if cantidad <= 0:
+            raise MovimientoInvalido("La cantidad a traspasar debe ser mayor a 0")
+        motivo = motivo or f"traspaso {origen} -> {destino}"
+
+        def paso(cur):
+            quedan_origen = self.mover(cur, producto_id, origen, -cantidad, motivo)
+            quedan_destino = self.mover(cur, producto_id, destino, cantidad, motivo)
+            return quedan_origen, quedan_destino
+
+        resultado = self._transaccion(conn, producto_id, paso, **kw)
+        with self._lock:
+            self.traspasos += 1
+        return resultado
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "sucursales": list(self.sucursales),
+                "ajustes": self.ajustes,
+                "traspasos": self.traspasos,
+                "rechazos": self.rechazos,
+            }
+
+
+def inventario():
+    return current_app.extensions["inventario"]
+
+
+def estadisticas_inventario():
+    return inventario().estadisticas()
+
+
+def init_app(app):
+    app.extensions["inventario"] = Inventario(
+        app.config["INVENTARIO_SUCURSALES"],
+        stock_bajo=app.config["STOCK_BAJO_UMBRAL"],
+    )
@@ -0,0 +1,346 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+
+from flask import current_app, g, request, template_rendered, before_render_template, got_request_exception
+
+from .db import segundos_db
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin compactación de archivos de workers muertos
+    fcntl = None
+
+# =========================================================
+# MÉTRICAS HTTP (formato de texto de Prometheus en /metrics)
+# - before/after_request miden por endpoint: latencia (histograma),
+#   tamaño de respuesta, status, requests en curso y, dentro de cada
+#   request, tiempo en SQLite (app/db.py) vs tiempo de render de Jinja.
+# - Cada worker acumula en memoria. Con METRICAS_DIR (por omisión
+#   database/metricas, ver config.py) cada proceso vuelca su estado a
+#   METRICAS_DIR/metricas-<pid>.json cada METRICAS_VOLCADO_S segundos y
+#   /metrics suma los archivos de todos los procesos. Los contadores de
+#   workers que ya murieron se compactan en metricas-archivo.json.
+# - La etiqueta es el endpoint de Flask (no la URL) para no disparar la
+#   cardinalidad; lo que no tiene ruta queda como "sin_ruta".
+# - Las esperas del pool de SQLite también son contadores del registro
+#   (PoolSQLite.al_esperar), así que se suman entre procesos igual.
+# =========================================================
+
+PREFIJO = "gadget_"
+
+AYUDA = {
+    "http_peticiones_total": ("counter", "Requests atendidos por endpoint, método y status."),
+    "http_duracion_segundos": ("histogram", "Latencia del request (before_request -> after_request)."),
+    "http_respuesta_bytes": ("histogram", "Tamaño del cuerpo de la respuesta (sin streaming)."),
+    "db_segundos": ("histogram", "Tiempo en SQLite dentro del request."),
+    "render_segundos": ("histogram", "Tiempo de render de plantillas dentro del request."),
+    "excepciones_total": ("counter", "Excepciones no manejadas por endpoint y tipo."),
+    "http_en_curso": ("gauge", "Requests en curso (procesos vivos)."),
+    "db_pool_esperas_total": ("counter", "Veces que un request esperó conexión del pool."),
+    "db_pool_espera_segundos_total": ("counter", "Tiempo total esperando conexión del pool."),
+}
+
+
+class RegistroMetricas:
+    """Contadores e histogramas del proceso; thread-safe."""
+
+    def __init__(self, buckets_latencia, buckets_tamano):
+        self.buckets = {
+            "http_duracion_segundos": tuple(buckets_latencia),
+            "db_segundos": tuple(buckets_latencia),
+            "render_segundos": tuple(buckets_latencia),
+            "http_respuesta_bytes": tuple(buckets_tamano),
+        }
+        self._lock = threading.Lock()
+        self.contadores = {}   # (nombre, etiquetas) -> valor
+        self.histogramas = {}  # (nombre, etiquetas) -> [conteo por bucket..., +Inf, suma]
+        self.en_curso = 0
+
+    def sumar(self, nombre, etiquetas, valor=1):
+        clave = (nombre, etiquetas)
+        with self._lock:
+            self.contadores[clave] = self.contadores.get(clave, 0) + valor
+
+    def observar(self, nombre, etiquetas, valor):
+        buckets = self.buckets[nombre]
+        i = 0
+        while i < len(buckets) and valor > buckets[i]:
+            i += 1
+        clave = (nombre, etiquetas)
+        with self._lock:
+            h = self.histogramas.get(clave)
+            if h is None:
+                h = self.histogramas[clave] = [0] * (len(buckets) + 2)
+            h[i] += 1
+            h[-1] += valor
+
+    def en_curso_mas(self, delta):
+        with self._lock:
+            self.en_curso += delta
+
+    def volcado(self):
+        """Estado serializable (JSON) para combinar entre procesos."""
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "contadores": [[n, list(e), v] for (n, e), v in self.contadores.items()],
+                "histogramas": [[n, list(e), list(h)] for (n, e), h in self.histogramas.items()],
+                "en_curso": self.en_curso,
+            }
+
+
+# ---------------- combinar y exportar ----------------
+
+def _etiquetas(pares):
+    return tuple(tuple(p) for p in pares)
+
+
+def combinar(volcados, vivos=None):
+    """Suma volcados de varios procesos. Los gauges solo cuentan pids en `vivos`."""
+    contadores, histogramas, en_curso = {}, {}, 0
+    for v in volcados:
+        for n, e, valor in v.get("contadores", ()):
+            clave = (n, _etiquetas(e))
+            contadores[clave] = contadores.get(clave, 0) + valor
+        for n, e, h in v.get("histogramas", ()):
+            clave = (n, _etiquetas(e))
+            actual = histogramas.get(clave)
+            if actual is None or len(actual) != len(h):
+                histogramas[clave] = list(h)
+            else:
+                histogramas[clave] = [a + b for a, b in zip(actual, h)]
+        if vivos is None or v.get("pid") in vivos:
+            en_curso += v.get("en_curso", 0)
+    return {
+        "contadores": [[n, list(e), v] for (n, e), v in contadores.items()],
+        "histogramas": [[n, list(e), h] for (n, e), h in histogramas.items()],
+        "en_curso": en_curso,
+    }
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _texto_etiquetas(pares, extra=()):
+    pares = list(pares) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+
+def _numero(v):
+    if isinstance(v, float):
+        return repr(round(v, 6))
+    return str(v)
+
+
+def formato_prometheus(combinado, buckets, extra=()):
+    """Texto de exposición v0.0.4. `extra`: [(nombre, etiquetas, valor)] de gauges/contadores sueltos."""
+    series = {}
+    for n, e, v in combinado["contadores"]:
+        series.setdefault(n, []).append(f"{PREFIJO}{n}{_texto_etiquetas(e)} {_numero(v)}")
+    for n, e, h in combinado["histogramas"]:
+        lineas = series.setdefault(n, [])
+        acumulado = 0
+        limites = buckets.get(n, ())
+        for i, limite in enumerate(limites):
+            acumulado += h[i]
+            lineas.append(f"{PREFIJO}{n}_bucket{_texto_etiquetas(e, [('le', _numero(float(limite)))])} {acumulado}")
+        acumulado += h[len(limites)]
+        lineas.append(f"{PREFIJO}{n}_bucket{_texto_etiquetas(e, [('le', '+Inf')])} {acumulado}")
+        lineas.append(f"{PREFIJO}{n}_sum{_texto_etiquetas(e)} {_numero(h[-1])}")
+        lineas.append(f"{PREFIJO}{n}_count{_texto_etiquetas(e)} {acumulado}")
+    series.setdefault("http_en_curso", []).append(f"{PREFIJO}http_en_curso {combinado['en_curso']}")
+    for n, e, v in extra:
+        series.setdefault(n, []).append(f"{PREFIJO}{n}{_texto_etiquetas(e)} {_numero(v)}")
+
+    salida = []
+    for n in sorted(series):
+        tipo, ayuda = AYUDA.get(n, ("untyped", ""))
+        salida.append(f"# HELP {PREFIJO}{n} {ayuda}")
+        salida.append(f"# TYPE {PREFIJO}{n} {tipo}")
+        salida.extend(sorted(series[n]) if tipo != "histogram" else series[n])
+    return "\n".join(salida) + "\n"
+
+
+# ---------------- varios procesos (METRICAS_DIR) ----------------
+
+def _vivo(pid):
+    if os.name != "posix":
+        return True  # en Windows os.kill(pid, 0) manda CTRL_C
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escribir_json(ruta, datos):
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(datos, f, separators=(",", ":"))
+    os.replace(tmp, ruta)
+
+
+def _leer_json(ruta):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class AlmacenMetricas:
+    """Registro del proceso + volcado periódico a un directorio compartido."""
+
+    def __init__(self, registro, directorio=None, volcado_s=5.0):
+        self.registro = registro
+        self.directorio = directorio
+        self.volcado_s = float(volcado_s)
+        self._ultimo = 0.0
+        self._lock = threading.Lock()
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+            atexit.register(self.volcar)
+
+    def _ruta(self, pid=None):
+        return os.path.join(self.directorio, f"metricas-{pid or os.getpid()}.json")
+
+    def volcar(self):
+        if not self.directorio:
+            return
+        with self._lock:
+            self._ultimo = time.monotonic()
+            _escribir_json(self._ruta(), self.registro.volcado())
+
+    def tal_vez_volcar(self):
+        if self.directorio and time.monotonic() - self._ultimo >= self.volcado_s:
+            self.volcar()
+
+    def _compactar(self, muertos):
+        """Suma los archivos de pids muertos en metricas-archivo.json y los borra."""
+        if fcntl is None or not muertos:
+            return
+        with open(os.path.join(self.directorio, "metricas.lock"), "w") as candado:
+            fcntl.flock(candado, fcntl.LOCK_EX)
+            archivo = os.path.join(self.directorio, "metricas-archivo.json")
+            volcados = [_leer_json(archivo) or {}]
+            rutas = [r for r in muertos if os.path.exists(r)]
+            volcados += [v for v in map(_leer_json, rutas) if v]
+            if len(volcados) > 1:
+                combinado = combinar(volcados, vivos=set())
+                combinado["pid"] = None
+                _escribir_json(archivo, combinado)
+            for r in rutas:
+                os.remove(r)
+
+    def combinado(self):
+        if not self.directorio:
+            return combinar([self.registro.volcado()])
+        self.volcar()
+        volcados, vivos, muertos = [], set(), []
+        for ruta in glob.glob(os.path.join(self.directorio, "metricas-*.json")):
+            v = _leer_json(ruta)
+            if not v:
+                continue
+            volcados.append(v)
+            pid = v.get("pid")
+            if pid is None:
+                continue
+            if _vivo(pid):
+                vivos.add(pid)
+            else:
+                muertos.append(ruta)
+        resultado = combinar(volcados, vivos)
+        self._compactar(muertos)
+        return resultado
+
+
+# ---------------- hooks de Flask ----------------
+
+def _almacen(app=None):
+    return (app or current_app).extensions["metricas"]
+
+
+def _inicio_render(sender, template, context, **extra):
+    g._metricas_render_inicio = time.perf_counter()
+
+
+def _fin_render(sender, template, context, **extra):
+    inicio = g.pop("_metricas_render_inicio", None)
+    if inicio is not None:
+        g._metricas_render_s = g.get("_metricas_render_s", 0.0) + time.perf_counter() - inicio
+
+
+def _excepcion(sender, exception, **extra):
+    _almacen(sender).registro.sumar(
+        "excepciones_total",
+        (("endpoint", request.endpoint or "sin_ruta"), ("tipo", type(exception).__name__)),
+    )
+
+
+def exportar_metricas():
+    """Texto de /metrics con lo de todos los procesos."""
+    almacen = _almacen()
+    return formato_prometheus(almacen.combinado(), almacen.registro.buckets)
+
+
+def _contar_esperas(registro, nombre):
+    etiquetas = (("db", nombre),)
+    registro.sumar("db_pool_esperas_total", etiquetas, 0)  # la serie existe desde el arranque
+    registro.sumar("db_pool_espera_segundos_total", etiquetas, 0.0)
+
+    def al_esperar(segundos):
+        registro.sumar("db_pool_esperas_total", etiquetas)
+        registro.sumar("db_pool_espera_segundos_total", etiquetas, segundos)
+    return al_esperar
+
+
+def init_app(app):
+    if not app.config["METRICAS_HABILITADAS"]:
+        return
+
+    registro = RegistroMetricas(app.config["METRICAS_BUCKETS_LATENCIA"], app.config["METRICAS_BUCKETS_BYTES"])
+    almacen = AlmacenMetricas(registro, app.config["METRICAS_DIR"], app.config["METRICAS_VOLCADO_S"])
+    app.extensions["metricas"] = almacen
+
+    # esperas del pool como contadores del registro: se vuelcan y suman entre workers
+    for nombre, pool in app.extensions.get("sqlite_pools", {}).items():
+        pool.al_esperar = _contar_esperas(registro, nombre)
+
+    before_render_template.connect(_inicio_render, app)
+    template_rendered.connect(_fin_render, app)
+    got_request_exception.connect(_excepcion, app)
+
+    @app.before_request
+    def _metricas_inicio():
+        g._metricas_inicio = time.perf_counter()
+        registro.en_curso_mas(1)
+
+    @app.after_request
+    def _metricas_fin(response):
+        inicio = g.get("_metricas_inicio")
+        if inicio is None:
+            return response
+        endpoint = (("endpoint", request.endpoint or "sin_ruta"),)
+        registro.sumar("http_peticiones_total", endpoint + (("metodo", request.method), ("status", str(response.status_code))))
+        registro.observar("http_duracion_segundos", endpoint, time.perf_counter() - inicio)
+        registro.observar("db_segundos", endpoint, segundos_db())
+        registro.observar("render_segundos", endpoint, g.get("_metricas_render_s", 0.0))
+        if not response.is_streamed:
+            registro.observar("http_respuesta_bytes", endpoint, response.calculate_content_length() or 0)
+        return response
+
+    @app.teardown_request
+    def _metricas_teardown(exc=None):
+        # también corre si after_request no llegó a correr
+        if g.pop("_metricas_inicio", None) is not None:
+            registro.en_curso_mas(-1)
+            almacen.tal_vez_volcar()
@@ -0,0 +1,645 @@
+import re
+import sqlite3
+
+import click
+
+# =========================================================
+# MIGRACIONES VERSIONADAS (gadget.db)
+# - La versión aplicada vive en PRAGMA user_version.
+# - Cada migración corre en su propia transacción junto con el
+#   cambio de user_version: o se aplica completa o no se aplica.
+# - Para agregar una: nueva tupla (version, descripcion, sql | funcion(conn))
+#   al final de MIGRACIONES. Nunca editar una ya publicada.
+# =========================================================
+
+MIGRACIONES = [
+    (1, "índices de catálogo e inventario", """
+        CREATE INDEX IF NOT EXISTS idx_productos_catalogo
+            ON productos (disponible, tipo, marca, precio);
+        CREATE INDEX IF NOT EXISTS idx_productos_marca
+            ON productos (disponible, marca);
+        CREATE INDEX IF NOT EXISTS idx_productos_precio
+            ON productos (disponible, precio);
+        CREATE INDEX IF NOT EXISTS idx_inventario_producto
+            ON inventario (producto_id, sucursal, stock);
+    """),
+    (2, "contador de versión del catálogo", """
+        CREATE TABLE IF NOT EXISTS catalogo_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 1,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        INSERT OR IGNORE INTO catalogo_version (id, version) VALUES (1, 1);
+    """),
+    (3, "búsqueda de texto completo (FTS5) sobre productos", """
+        CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+            nombre, marca, tipo, descripcion,
+            content = 'productos',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        );
+
+        CREATE TRIGGER IF NOT EXISTS productos_fts_ai AFTER INSERT ON productos BEGIN
+            INSERT INTO productos_fts (rowid, nombre, marca, tipo, descripcion)
+            VALUES (new.id, new.nombre, new.marca, new.tipo, new.descripcion);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS productos_fts_ad AFTER DELETE ON productos BEGIN
+            INSERT INTO productos_fts (productos_fts, rowid, nombre, marca, tipo, descripcion)
+            VALUES ('delete', old.id, old.nombre, old.marca, old.tipo, old.descripcion);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS productos_fts_au
+        AFTER UPDATE OF nombre, marca, tipo, descripcion ON productos BEGIN
+            INSERT INTO productos_fts (productos_fts, rowid, nombre, marca, tipo, descripcion)
+            VALUES ('delete', old.id, old.nombre, old.marca, old.tipo, old.descripcion);
+            INSERT INTO productos_fts (rowid, nombre, marca, tipo, descripcion)
+            VALUES (new.id, new.nombre, new.marca, new.tipo, new.descripcion);
+        END;
+
+        INSERT INTO productos_fts (productos_fts) VALUES ('rebuild');
+        -- rank por defecto: bm25 con pesos nombre, marca, tipo, descripcion
+        INSERT INTO productos_fts (productos_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 3.0, 1.0)');
+    """),
+    (4, "carrito del lado del servidor", """
+        CREATE TABLE IF NOT EXISTS carritos (
+            id TEXT PRIMARY KEY,
+            piezas INTEGER NOT NULL DEFAULT 0,
+            creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_carritos_actualizado ON carritos (actualizado_en);
+
+        CREATE TABLE IF NOT EXISTS carrito_items (
+            carrito_id TEXT NOT NULL,
+            producto_id INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL CHECK (cantidad > 0),
+            agregado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (carrito_id, producto_id),
+            FOREIGN KEY (carrito_id) REFERENCES carritos(id),
+            FOREIGN KEY (producto_id) REFERENCES productos(id)
+        ) WITHOUT ROWID;
+
+        -- carritos.piezas = SUM(cantidad) siempre al día
+        CREATE TRIGGER IF NOT EXISTS carrito_items_ai AFTER INSERT ON carrito_items BEGIN
+            UPDATE carritos SET piezas = piezas + new.cantidad, actualizado_en = CURRENT_TIMESTAMP
+            WHERE id = new.carrito_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS carrito_items_au AFTER UPDATE OF cantidad ON carrito_items BEGIN
+            UPDATE carritos SET piezas = piezas + new.cantidad - old.cantidad, actualizado_en = CURRENT_TIMESTAMP
+            WHERE id = new.carrito_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS carrito_items_ad AFTER DELETE ON carrito_items BEGIN
+            UPDATE carritos SET piezas = piezas - old.cantidad, actualizado_en = CURRENT_TIMESTAMP
+            WHERE id = old.carrito_id;
+        END;
+    """),
+    (5, "resúmenes incrementales para el dashboard", """
+        CREATE TABLE IF NOT EXISTS resumen_ventas_dia (
+            fecha TEXT PRIMARY KEY,
+            total REAL NOT NULL DEFAULT 0,
+            num_ventas INTEGER NOT NULL DEFAULT 0,
+            piezas INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS resumen_producto_dia (
+            fecha TEXT NOT NULL,
+            producto_id INTEGER NOT NULL,
+            piezas INTEGER NOT NULL DEFAULT 0,
+            importe REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, producto_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_resumen_producto_top
+            ON resumen_producto_dia (fecha, piezas DESC);
+
+        CREATE TABLE IF NOT EXISTS resumen_empleado_mes (
+            mes TEXT NOT NULL,
+            empleado_id INTEGER NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            num_ventas INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (mes, empleado_id)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS resumen_stock (
+            producto_id INTEGER PRIMARY KEY,
+            stock_total INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_resumen_stock_total ON resumen_stock (stock_total);
+
+        CREATE INDEX IF NOT EXISTS idx_citas_fecha ON citas (fecha_hora);
+
+        -- ventas -> resumen del día y del empleado
+        CREATE TRIGGER IF NOT EXISTS resumen_ventas_ai AFTER INSERT ON ventas BEGIN
+            INSERT INTO resumen_ventas_dia (fecha, total, num_ventas)
+            VALUES (date(new.creado_en), COALESCE(new.total, 0), 1)
+            ON CONFLICT (fecha) DO UPDATE SET
+                total = total + excluded.total,
+                num_ventas = num_ventas + 1;
+
+            INSERT INTO resumen_empleado_mes (mes, empleado_id, total, num_ventas)
+            VALUES (strftime('%Y-%m', new.creado_en), COALESCE(new.empleado_id, 0), COALESCE(new.total, 0), 1)
+            ON CONFLICT (mes, empleado_id) DO UPDATE SET
+                total = total + excluded.total,
+                num_ventas = num_ventas + 1;
+        END;
+
+        -- detalle_venta -> piezas por producto y por día
+        CREATE TRIGGER IF NOT EXISTS resumen_detalle_ai AFTER INSERT ON detalle_venta BEGIN
+            INSERT INTO resumen_producto_dia (fecha, producto_id, piezas, importe)
+            VALUES (
+                (SELECT date(creado_en) FROM ventas WHERE id = new.venta_id),
+                new.producto_id,
+                COALESCE(new.cantidad, 1),
+                COALESCE(new.cantidad, 1) * COALESCE(new.precio, 0)
+            )
+            ON CONFLICT (fecha, producto_id) DO UPDATE SET
+                piezas = piezas + excluded.piezas,
+                importe = importe + excluded.importe;
+
+            UPDATE resumen_ventas_dia
+            SET piezas = piezas + COALESCE(new.cantidad, 1)
+            WHERE fecha = (SELECT date(creado_en) FROM ventas WHERE id = new.venta_id);
+        END;
+
+        -- inventario -> stock total por producto
+        CREATE TRIGGER IF NOT EXISTS resumen_stock_ai AFTER INSERT ON inventario BEGIN
+            INSERT INTO resumen_stock (producto_id, stock_total)
+            VALUES (new.producto_id, COALESCE(new.stock, 0))
+            ON CONFLICT (producto_id) DO UPDATE SET stock_total = stock_total + excluded.stock_total;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS resumen_stock_au AFTER UPDATE OF stock, producto_id ON inventario BEGIN
+            UPDATE resumen_stock SET stock_total = stock_total - COALESCE(old.stock, 0)
+            WHERE producto_id = old.producto_id;
+            INSERT INTO resumen_stock (producto_id, stock_total)
+            VALUES (new.producto_id, COALESCE(new.stock, 0))
+            ON CONFLICT (producto_id) DO UPDATE SET stock_total = stock_total + excluded.stock_total;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS resumen_stock_ad AFTER DELETE ON inventario BEGIN
+            UPDATE resumen_stock SET stock_total = stock_total - COALESCE(old.stock, 0)
+            WHERE producto_id = old.producto_id;
+        END;
+
+        -- backfill con lo que ya exista
+        INSERT INTO resumen_ventas_dia (fecha, total, num_ventas, piezas)
+        SELECT date(v.creado_en), SUM(COALESCE(v.total, 0)), COUNT(*),
+               COALESCE(SUM((SELECT SUM(COALESCE(d.cantidad, 1)) FROM detalle_venta d WHERE d.venta_id = v.id)), 0)
+        FROM ventas v
+        GROUP BY date(v.creado_en);
+
+        INSERT INTO resumen_producto_dia (fecha, producto_id, piezas, importe)
+        SELECT date(v.creado_en), d.producto_id,
+               SUM(COALESCE(d.cantidad, 1)), SUM(COALESCE(d.cantidad, 1) * COALESCE(d.precio, 0))
+        FROM detalle_venta d
+        JOIN ventas v ON v.id = d.venta_id
+        GROUP BY date(v.creado_en), d.producto_id;
+
+        INSERT INTO resumen_empleado_mes (mes, empleado_id, total, num_ventas)
+        SELECT strftime('%Y-%m', creado_en), COALESCE(empleado_id, 0), SUM(COALESCE(total, 0)), COUNT(*)
+        FROM ventas
+        GROUP BY strftime('%Y-%m', creado_en), COALESCE(empleado_id, 0);
+
+        INSERT INTO resumen_stock (producto_id, stock_total)
+        SELECT producto_id, COALESCE(SUM(stock), 0)
+        FROM inventario
+        GROUP BY producto_id;
+    """),
+    (6, "código de barras de productos", """
+        ALTER TABLE productos ADD COLUMN codigo_barras TEXT;
+        -- UNIQUE permite varios NULL: productos sin código siguen escaneándose por id
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_productos_codigo_barras ON productos (codigo_barras);
+    """),
+    (7, "hash de contenido para sincronizar el catálogo", """
+        ALTER TABLE productos ADD COLUMN hash_contenido TEXT;
+
+        -- Cualquier cambio que no venga de la sincronización (admin, importador)
+        -- deja el hash en NULL para que el siguiente feed vuelva a comparar.
+        CREATE TRIGGER IF NOT EXISTS productos_hash_au
+        AFTER UPDATE OF nombre, marca, tipo, color, almacenamiento, precio, descripcion,
+                        url_imagen, disponible, codigo_barras ON productos
+        WHEN new.hash_contenido IS NOT NULL AND new.hash_contenido IS old.hash_contenido
+        BEGIN
+            UPDATE productos SET hash_contenido = NULL WHERE id = new.id;
+        END;
+    """),
+    (8, "variantes de imagen por producto", """
+        CREATE TABLE IF NOT EXISTS imagen_variantes (
+            producto_id INTEGER NOT NULL,
+            formato TEXT NOT NULL,              -- webp | avif | jpeg
+            ancho INTEGER NOT NULL,
+            alto INTEGER NOT NULL,
+            archivo TEXT NOT NULL,              -- relativo a app/static, con hash del contenido
+            bytes INTEGER NOT NULL,
+            origen TEXT NOT NULL,               -- url_imagen de la que salió
+            origen_hash TEXT NOT NULL,
+            creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (producto_id, formato, ancho)
+        ) WITHOUT ROWID;
+
+        -- otra imagen = variantes viejas fuera (la tienda usa url_imagen hasta reprocesar)
+        CREATE TRIGGER IF NOT EXISTS imagen_variantes_au
+        AFTER UPDATE OF url_imagen ON productos
+        WHEN new.url_imagen IS NOT old.url_imagen
+        BEGIN
+            DELETE FROM imagen_variantes WHERE producto_id = new.id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS imagen_variantes_ad
+        AFTER DELETE ON productos
+        BEGIN
+            DELETE FROM imagen_variantes WHERE producto_id = old.id;
+        END;
+    """),
+    (9, "agenda de citas: horarios por empleado y sucursal", """
+        -- fecha_hora y fin en UTC (como CURRENT_TIMESTAMP); datos del visitante sin cuenta
+        ALTER TABLE citas ADD COLUMN fin TIMESTAMP;
+        ALTER TABLE citas ADD COLUMN sucursal TEXT;
+        ALTER TABLE citas ADD COLUMN nombre_cliente TEXT;
+        ALTER TABLE citas ADD COLUMN correo TEXT;
+        ALTER TABLE citas ADD COLUMN telefono TEXT;
+        ALTER TABLE citas ADD COLUMN notas TEXT;
+        UPDATE citas SET fin = datetime(fecha_hora, '+60 minutes') WHERE fin IS NULL;
+
+        -- índice de intervalos: las citas de un empleado no se enciman, así que
+        -- ordenadas por inicio también quedan ordenadas por fin
+        CREATE INDEX IF NOT EXISTS idx_citas_empleado_inicio
+            ON citas (empleado_id, fecha_hora, fin) WHERE estado != 'cancelada';
+        CREATE INDEX IF NOT EXISTS idx_citas_fecha ON citas (fecha_hora);
+        CREATE INDEX IF NOT EXISTS idx_cita_productos_cita ON cita_productos (cita_id);
+
+        -- turnos en hora local de la tienda; empleado_id = empleados.id (empleados.db)
+        CREATE TABLE IF NOT EXISTS horarios_empleado (
+            empleado_id INTEGER NOT NULL,
+            sucursal TEXT NOT NULL,
+            dia_semana INTEGER NOT NULL CHECK (dia_semana BETWEEN 0 AND 6),  -- 0 = lunes
+            inicio TEXT NOT NULL,                                            -- 'HH:MM'
+            fin TEXT NOT NULL,
+            PRIMARY KEY (empleado_id, dia_semana, inicio)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_horarios_sucursal ON horarios_empleado (sucursal, dia_semana);
+
+        -- cualquier cambio en citas u horarios invalida la disponibilidad cacheada
+        CREATE TABLE IF NOT EXISTS agenda_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 1,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        INSERT OR IGNORE INTO agenda_version (id, version) VALUES (1, 1);
+
+        CREATE TRIGGER IF NOT EXISTS citas_agenda_ai AFTER INSERT ON citas BEGIN
+            UPDATE agenda_version SET version = version + 1, actualizado_en = CURRENT_TIMESTAMP WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS citas_agenda_au
+        AFTER UPDATE OF empleado_id, fecha_hora, fin, estado ON citas BEGIN
+            UPDATE agenda_version SET version = version + 1, actualizado_en = CURRENT_TIMESTAMP WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS citas_agenda_ad AFTER DELETE ON citas BEGIN
+            UPDATE agenda_version SET version = version + 1, actualizado_en = CURRENT_TIMESTAMP WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS horarios_agenda_ai AFTER INSERT ON horarios_empleado BEGIN
+            UPDATE agenda_version SET version = version + 1, actualizado_en = CURRENT_TIMESTAMP WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS horarios_agenda_au AFTER UPDATE ON horarios_empleado BEGIN
+            UPDATE agenda_version SET version = version + 1, actualizado_en = CURRENT_TIMESTAMP WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS horarios_agenda_ad AFTER DELETE ON horarios_empleado BEGIN
+            UPDATE agenda_version SET version = version + 1, actualizado_en = CURRENT_TIMESTAMP WHERE id = 1;
+        END;
+    """),
+    (10, "inventario: una fila por producto y sucursal, stock_total para todos", """
+        -- duplicados (mismo producto y sucursal): se suman en la fila más vieja
+        UPDATE inventario SET stock = (
+            SELECT SUM(COALESCE(d.stock, 0)) FROM inventario d
+            WHERE d.producto_id = inventario.producto_id AND d.sucursal = inventario.sucursal
+        )
+        WHERE id IN (SELECT MIN(id) FROM inventario GROUP BY producto_id, sucursal HAVING COUNT(*) > 1);
+
+        UPDATE registro_inventario SET inventario_id = (
+            SELECT MIN(d.id) FROM inventario i
+            JOIN inventario d ON d.producto_id = i.producto_id AND d.sucursal = i.sucursal
+            WHERE i.id = registro_inventario.inventario_id
+        )
+        WHERE inventario_id NOT IN (SELECT MIN(id) FROM inventario GROUP BY producto_id, sucursal)
+          AND inventario_id IN (SELECT id FROM inventario);
+
+        DELETE FROM inventario
+        WHERE id NOT IN (SELECT MIN(id) FROM inventario GROUP BY producto_id, sucursal);
+
+        UPDATE inventario SET stock = 0 WHERE stock IS NULL;
+
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_inventario_producto_sucursal
+            ON inventario (producto_id, sucursal);
+
+        -- nunca stock negativo ni NULL (el total materializado no los tolera)
+        CREATE TRIGGER IF NOT EXISTS inventario_stock_valido_ai
+        BEFORE INSERT ON inventario WHEN new.stock IS NULL OR new.stock < 0 BEGIN
+            SELECT RAISE(ABORT, 'stock inválido en inventario');
+        END;
+        CREATE TRIGGER IF NOT EXISTS inventario_stock_valido_au
+        BEFORE UPDATE OF stock ON inventario WHEN new.stock IS NULL OR new.stock < 0 BEGIN
+            SELECT RAISE(ABORT, 'stock inválido en inventario');
+        END;
+
+        -- todo producto tiene su renglón en resumen_stock (aunque sea 0):
+        -- get_stock_total y admin_productos leen solo por llave primaria
+        CREATE TRIGGER IF NOT EXISTS resumen_stock_producto_ai AFTER INSERT ON productos BEGIN
+            INSERT INTO resumen_stock (producto_id, stock_total) VALUES (new.id, 0)
+            ON CONFLICT (producto_id) DO NOTHING;
+        END;
+
+        -- se recalcula completo: lo que se haya desviado queda cuadrado
+        DELETE FROM resumen_stock;
+        INSERT INTO resumen_stock (producto_id, stock_total)
+        SELECT producto_id, SUM(stock) FROM inventario GROUP BY producto_id;
+        INSERT INTO resumen_stock (producto_id, stock_total)
+        SELECT id, 0 FROM productos WHERE true
+        ON CONFLICT (producto_id) DO NOTHING;
+    """),
+    (11, "importación: DDL de índices diferidos pendiente de restaurar", """
+        -- flask importar-catalogo --diferir-indices guarda aquí lo que quita, en la
+        -- misma transacción; si el proceso muere, el siguiente arranque lo repone
+        CREATE TABLE IF NOT EXISTS indices_diferidos (
+            nombre TEXT PRIMARY KEY,
+            tipo TEXT NOT NULL,
+            sql TEXT NOT NULL,
+            quitado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """),
+    (12, "importación: dueño (pid) y latido de los índices diferidos", """
+        -- la carga que quitó los índices los repone ella misma; otro proceso
+        -- solo los repone si ese pid ya no existe o dejó de dar latido
+        ALTER TABLE indices_diferidos ADD COLUMN pid INTEGER;
+        ALTER TABLE indices_diferidos ADD COLUMN latido TIMESTAMP;
+    """),
+    (13, "resúmenes del dashboard por hora UTC (día y mes en hora local de la tienda)", """
+        -- date(creado_en) es el día UTC: en CDMX una venta de las 19:00 caía
+        -- en "mañana". SQLite no sabe de zonas horarias, así que se guarda por
+        -- hora UTC y resumenes.py suma las horas del día/mes local que le
+        -- calcula la agenda (CITAS_ZONA_HORARIA).
+        DROP TRIGGER IF EXISTS resumen_ventas_ai;
+        DROP TRIGGER IF EXISTS resumen_detalle_ai;
+        DROP TABLE IF EXISTS resumen_ventas_dia;
+        DROP TABLE IF EXISTS resumen_producto_dia;
+        DROP TABLE IF EXISTS resumen_empleado_mes;
+
+        CREATE TABLE IF NOT EXISTS resumen_ventas_hora (
+            hora TEXT PRIMARY KEY,  -- 'AAAA-MM-DD HH:00:00' UTC
+            total REAL NOT NULL DEFAULT 0,
+            num_ventas INTEGER NOT NULL DEFAULT 0,
+            piezas INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS resumen_producto_hora (
+            hora TEXT NOT NULL,
+            producto_id INTEGER NOT NULL,
+            piezas INTEGER NOT NULL DEFAULT 0,
+            importe REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (hora, producto_id)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS resumen_empleado_hora (
+            hora TEXT NOT NULL,
+            empleado_id INTEGER NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            num_ventas INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hora, empleado_id)
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS resumen_ventas_ai AFTER INSERT ON ventas BEGIN
+            INSERT INTO resumen_ventas_hora (hora, total, num_ventas)
+            VALUES (strftime('%Y-%m-%d %H:00:00', new.creado_en), COALESCE(new.total, 0), 1)
+            ON CONFLICT (hora) DO UPDATE SET
+                total = total + excluded.total,
+                num_ventas = num_ventas + 1;
+
+            INSERT INTO resumen_empleado_hora (hora, empleado_id, total, num_ventas)
+            VALUES (strftime('%Y-%m-%d %H:00:00', new.creado_en), COALESCE(new.empleado_id, 0), COALESCE(new.total, 0), 1)
+            ON CONFLICT (hora, empleado_id) DO UPDATE SET
+                total = total + excluded.total,
+                num_ventas = num_ventas + 1;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS resumen_detalle_ai AFTER INSERT ON detalle_venta BEGIN
+            INSERT INTO resumen_producto_hora (hora, producto_id, piezas, importe)
+            VALUES (
+                (SELECT strftime('%Y-%m-%d %H:00:00', creado_en) FROM ventas WHERE id = new.venta_id),
+                new.producto_id,
+                COALESCE(new.cantidad, 1),
+                COALESCE(new.cantidad, 1) * COALESCE(new.precio, 0)
+            )
+            ON CONFLICT (hora, producto_id) DO UPDATE SET
+                piezas = piezas + excluded.piezas,
+                importe = importe + excluded.importe;
+
+            UPDATE resumen_ventas_hora
+            SET piezas = piezas + COALESCE(new.cantidad, 1)
+            WHERE hora = (SELECT strftime('%Y-%m-%d %H:00:00', creado_en) FROM ventas WHERE id = new.venta_id);
+        END;
+
+        -- backfill con lo que ya exista
+        INSERT INTO resumen_ventas_hora (hora, total, num_ventas, piezas)
+        SELECT strftime('%Y-%m-%d %H:00:00', v.creado_en), SUM(COALESCE(v.total, 0)), COUNT(*),
+               COALESCE(SUM((SELECT SUM(COALESCE(d.cantidad, 1)) FROM detalle_venta d WHERE d.venta_id = v.id)), 0)
+        FROM ventas v
+        GROUP BY 1;
+
+        INSERT INTO resumen_producto_hora (hora, producto_id, piezas, importe)
+        SELECT strftime('%Y-%m-%d %H:00:00', v.creado_en), d.producto_id,
+               SUM(COALESCE(d.cantidad, 1)), SUM(COALESCE(d.cantidad, 1) * COALESCE(d.precio, 0))
+        FROM detalle_venta d
+        JOIN ventas v ON v.id = d.venta_id
+        GROUP BY 1, d.producto_id;
+
+        INSERT INTO resumen_empleado_hora (hora, empleado_id, total, num_ventas)
+        SELECT strftime('%Y-%m-%d %H:00:00', creado_en), COALESCE(empleado_id, 0), SUM(COALESCE(total, 0)), COUNT(*)
+        FROM ventas
+        GROUP BY 1, COALESCE(empleado_id, 0);
+    """),
+]
+
+
+def version_actual(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _sentencias(script):
+    """Parte un script SQL en sentencias completas (respeta BEGIN...END de triggers)."""
+    actual = ""
+    for trozo in script.split(";"):
+        actual += trozo + ";"
+        if sqlite3.complete_statement(actual):
+            if actual.strip(" \t\r\n;"):
+                yield actual
+            actual = ""
+    if actual.strip(" \t\r\n;"):
+        yield actual
+
+
+def aplicar_migraciones(db_path, log=print):
+    """Aplica las migraciones pendientes. Regresa la versión final.
+
+    Varios workers pueden arrancar a la vez: cada migración relee
+    user_version dentro de su BEGIN IMMEDIATE y se salta si otro
+    proceso ya la aplicó.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=60)
+    try:
+        version = version_actual(conn)
+        for numero, descripcion, paso in MIGRACIONES:
+            if numero <= version:
+                continue
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = version_actual(conn)
+                if numero <= version:
+                    conn.execute("COMMIT")
+                    continue
+                if callable(paso):
+                    paso(conn)
+                else:
+                    for sentencia in _sentencias(paso):
+                        conn.execute(sentencia)
+                conn.execute(f"PRAGMA user_version = {int(numero)}")
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+
+            version = numero
+            log(f"✔ Migración {numero}: {descripcion}")
+        return version
+    finally:
+        conn.close()
+
+
+# =========================================================
+# VERIFICACIÓN DE PLANES (EXPLAIN QUERY PLAN)
+# Mismas consultas que corren las rutas de routes.py; si alguna
+# termina en un SCAN completo de la tabla, el índice no sirve.
+# (nombre, sql, params, tablas a las que SÍ se permite SCAN)
+# =========================================================
+
+CONSULTAS_RUTAS = [
+    ("snapshot del catálogo (catalogo.py)", """
+        SELECT id, nombre, marca, tipo, precio, descripcion, url_imagen, disponible, codigo_barras
+        FROM productos WHERE disponible = 1 ORDER BY id ASC
+    """, (), ()),
+    ("variantes de imagen del snapshot (imagenes.py)", """
+        SELECT producto_id, formato, ancho, alto, archivo
+        FROM imagen_variantes
+        ORDER BY producto_id, formato, ancho
+    """, (), ("imagen_variantes",)),
+    ("admin: código de barras duplicado", """
+        SELECT id FROM productos WHERE codigo_barras = ?
+    """, ("7501234567890",), ()),
+    ("get_stock_total (inventario.py)", """
+        SELECT stock_total FROM resumen_stock WHERE producto_id = ?
+    """, (1,), ()),
+    ("inventario: stock por sucursal", """
+        SELECT sucursal, stock FROM inventario WHERE producto_id = ?
+    """, (1,), ()),
+    ("inventario: descontar en una sucursal", """
+        SELECT id FROM inventario WHERE producto_id = ? AND sucursal = ? AND stock >= ?
+    """, (1, "Centro", 1), ()),
+    ("búsqueda q (busqueda.buscar_ids)", """
+        SELECT rowid FROM productos_fts WHERE productos_fts MATCH ? ORDER BY rank
+    """, ('"apple"*',), ()),
+    ("sugerencias", """
+        SELECT p.id, p.nombre
+        FROM (SELECT rowid, rank FROM productos_fts WHERE productos_fts MATCH ?) f
+        JOIN productos p ON p.id = f.rowid
+        WHERE p.disponible = 1
+        ORDER BY f.rank
+        LIMIT ?
+    """, ('"apple"*', 8), ()),
+    # El listado de admin recorre todos los productos a propósito;
+    # el total sale de resumen_stock por llave primaria (sin GROUP BY).
+    ("admin_productos", """
+        SELECT p.id, COALESCE(r.stock_total, 0) AS stock
+        FROM productos p
+        LEFT JOIN resumen_stock r ON r.producto_id = p.id
+        ORDER BY p.id ASC
+    """, (), ("p",)),
+    # La vista por sucursal también es de todo el inventario.
+    ("admin: stock por sucursal (inventario.py)", """
+        SELECT producto_id, sucursal, stock FROM inventario ORDER BY producto_id
+    """, (), ("inventario",)),
+    ("dashboard: ventas de hoy (resumenes.py)", """
+        SELECT COALESCE(SUM(total), 0), COALESCE(SUM(num_ventas), 0), COALESCE(SUM(piezas), 0)
+        FROM resumen_ventas_hora WHERE hora >= ? AND hora < ?
+    """, ("2026-01-01 06:00:00", "2026-01-02 06:00:00"), ()),
+    ("dashboard: top del día", """
+        SELECT producto_id, SUM(piezas) AS piezas FROM resumen_producto_hora
+        WHERE hora >= ? AND hora < ?
+        GROUP BY producto_id ORDER BY piezas DESC LIMIT 1
+    """, ("2026-01-01 06:00:00", "2026-01-02 06:00:00"), ()),
+    ("dashboard: empleado del mes", """
+        SELECT empleado_id, SUM(total) AS total FROM resumen_empleado_hora
+        WHERE hora >= ? AND hora < ? AND empleado_id != 0
+        GROUP BY empleado_id ORDER BY total DESC LIMIT 1
+    """, ("2026-01-01 06:00:00", "2026-02-01 06:00:00"), ()),
+    ("dashboard: stock bajo", """
+        SELECT COUNT(*) FROM resumen_stock WHERE stock_total < ?
+    """, (5,), ()),
+    ("dashboard: citas de hoy", """
+        SELECT COUNT(*) FROM citas
+        WHERE fecha_hora >= ? AND fecha_hora < ?
+    """, ("2026-01-01 06:00:00", "2026-01-02 06:00:00"), ()),
+    ("agenda: citas de un día (agenda.py)", """
+        SELECT empleado_id, fecha_hora, fin FROM citas
+        WHERE fecha_hora >= ? AND fecha_hora < ? AND estado != 'cancelada' AND empleado_id IS NOT NULL
+    """, ("2026-01-01 00:00:00", "2026-01-02 00:00:00"), ()),
+    ("agenda: empalme al reservar", """
+        SELECT 1 FROM citas
+        WHERE empleado_id = ? AND estado != 'cancelada'
+          AND fecha_hora >= datetime(?, '-1 day') AND fecha_hora < ? AND fin > ?
+        LIMIT 1
+    """, (4, "2026-01-01 16:00:00", "2026-01-01 17:00:00", "2026-01-01 16:00:00"), ()),
+    ("agenda: turnos de la sucursal", """
+        SELECT empleado_id, inicio, fin FROM horarios_empleado
+        WHERE sucursal = ? AND dia_semana = ? ORDER BY empleado_id, inicio
+    """, ("Centro", 0), ()),
+    # Últimas ventas: recorre ventas por rowid al revés y corta en LIMIT
+    ("dashboard: últimas ventas", """
+        SELECT id, creado_en, empleado_id, total FROM ventas ORDER BY id DESC LIMIT 5
+    """, (), ("ventas",)),
+]
+
+_SCAN_COMPLETO = re.compile(r"^SCAN (\w+)$")
+
+
+def revisar_planes(conn, consultas=None):
+    """Regresa [(nombre, [lineas del plan], ok)] para cada consulta."""
+    resultado = []
+    for nombre, sql, params, scan_permitido in consultas or CONSULTAS_RUTAS:
+        plan = [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        ok = True
+        for linea in plan:
+            m = _SCAN_COMPLETO.match(linea.strip())
+            if m and m.group(1) not in scan_permitido:
+                ok = False
+        resultado.append((nombre, plan, ok))
+    return resultado
+
+
+def init_app(app):
+    @app.cli.command("verificar-indices")
+    def verificar_indices():
+        """Corre EXPLAIN QUERY PLAN sobre las consultas de las rutas."""
+        conn = sqlite3.connect(app.config["DATABASE"])
+        try:
+            fallas = 0
+            for nombre, plan, ok in revisar_planes(conn):
+                click.echo(f"{'OK   ' if ok else 'FALLA'} {nombre}")
+                for linea in plan:
+                    click.echo(f"      {linea}")
+                fallas += 0 if ok else 1
+        finally:
+            conn.close()
+
+        if fallas:
+            raise click.ClickException(f"{fallas} consulta(s) sin índice")
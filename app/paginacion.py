@@ -0,0 +1,80 @@
+from bisect import bisect_right
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from .catalogo import consultar
+
+# =========================================================
+# PAGINACIÓN POR CURSOR (keyset / seek) DEL LISTADO
+# - El cursor guarda la clave de orden del último producto mostrado,
+#   no un offset: la siguiente página empieza justo después de esa
+#   clave (bisect, O(log n)) aunque cambien los filtros o el catálogo.
+# - El token va firmado (itsdangerous) para que sea opaco.
+# =========================================================
+
+ORDENES = ("id", "relevancia", "precio_asc", "precio_desc")
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.secret_key, salt="cursor-productos")
+
+
+def codificar_cursor(orden, clave):
+    return _serializer().dumps({"o": orden, "k": list(clave)})
+
+
+def decodificar_cursor(token, orden):
+    """Clave del cursor, o None si el token no es válido para este orden."""
+    if not token:
+        return None
+    try:
+        datos = _serializer().loads(token)
+    except BadSignature:
+        return None
+    if not isinstance(datos, dict) or datos.get("o") != orden or not isinstance(datos.get("k"), list):
+        return None
+    return tuple(datos["k"])
+
+
+def _clave(producto, orden, posicion):
+    precio = float(producto["precio"] or 0)
+    if orden == "precio_asc":
+        return (precio, int(producto["id"]))
+    if orden == "precio_desc":
+        return (-precio, int(producto["id"]))
+    if orden == "relevancia":
+        # el orden de relevancia es estable mientras no cambie el catálogo
+        return (posicion,)
+    return (int(producto["id"]),)
+
+
+def _ordenar(productos, orden):
+    con_clave = sorted(
+        ((_clave(p, orden, i), p) for i, p in enumerate(productos)),
+        key=lambda par: par[0],
+    )
+    return tuple(p for _, p in con_clave), [c for c, _ in con_clave]
+
+
+def paginar(productos, orden, cursor, por_pagina, clave_cache):
+    """Regresa (pagina, siguiente_cursor | None).
+
+    `productos` es el resultado completo (facetas); `clave_cache` identifica
+    esos filtros para memoizar el ordenamiento.
+    """
+    if orden not in ORDENES:
+        orden = "id"
+
+    ordenados, claves = consultar(
+        ("orden", orden) + tuple(clave_cache),
+        lambda: _ordenar(productos, orden),
+    )
+
+    desde = decodificar_cursor(cursor, orden)
+    inicio = bisect_right(claves, desde) if desde is not None else 0
+    fin = inicio + max(1, int(por_pagina))
+
+    pagina = ordenados[inicio:fin]
+    siguiente = codificar_cursor(orden, claves[fin - 1]) if fin < len(ordenados) else None
+    return pagina, siguiente
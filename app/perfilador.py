@@ -0,0 +1,298 @@
+import functools
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from markupsafe import Markup
+
+# =========================================================
+# PERFILADOR DE CONSULTAS SQL (por request)
+# - Cada execute de las conexiones del pool (app/db.py) abre un
+#   registro con su SQL, parámetros y tiempo (execute + fetch).
+# - set_trace_callback dice qué corrió SQLite de verdad: los pasos de
+#   triggers y los BEGIN/COMMIT se cuentan aparte de las consultas.
+# - Al final del request:
+#     * N+1: la misma consulta (misma plantilla) PERFILADOR_REPETIDAS
+#       veces o más; "idénticas": misma consulta con mismos parámetros.
+#     * Lentas (>= PERFILADOR_LENTA_MS) al log con su EXPLAIN QUERY PLAN.
+#     * Header X-Consultas + Server-Timing y, con app.debug, un panel
+#       al final del HTML.
+# - Los helpers de routes.py decorados con @perfilado aparecen como
+#   origen de sus consultas (ej. get_stock_total ×12).
+# - Apagado por defecto: PERFILADOR=1 en el entorno para prenderlo.
+# =========================================================
+
+_ESPACIOS = re.compile(r"\s+")
+_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+
+
+def plantilla(sql):
+    return _ESPACIOS.sub(" ", sql).strip()
+
+
+def _clave_params(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return tuple(sorted(params.items()))
+    try:
+        return tuple(params)
+    except TypeError:
+        return repr(params)
+
+
+class Ejecucion:
+    __slots__ = ("db", "sql", "params", "origen", "segundos", "expandida", "disparos")
+
+    def __init__(self, db, sql, params, origen):
+        self.db = db
+        self.sql = sql
+        self.params = params
+        self.origen = origen
+        self.segundos = 0.0
+        self.expandida = None  # texto que reportó el trace de SQLite
+        self.disparos = 0      # pasos de triggers durante este execute
+
+
+class PerfilConsultas:
+    """Consultas de un request (las dos bases)."""
+
+    def __init__(self, max_registros=1000):
+        self.max_registros = max_registros
+        self.ejecuciones = []
+        self.total = 0
+        self.segundos = 0.0
+        self.disparos = 0
+        self.transacciones = 0
+        self.por_plantilla = Counter()
+        self.por_identica = Counter()
+        self.origen_de = {}
+        self.helpers = {}  # nombre -> [llamadas, segundos, consultas]
+        self.pila = []
+        self._en_curso = None
+        self.pausado = False
+
+    # ---------- lo llaman CursorMedido y el trace de SQLite ----------
+    def iniciar(self, conn, sql, params):
+        texto = plantilla(sql)
+        origen = self.pila[-1] if self.pila else "ruta"
+        e = Ejecucion(getattr(conn, "nombre_db", "?"), texto, params, origen)
+        self.total += 1
+        self.por_plantilla[texto] += 1
+        self.origen_de.setdefault(texto, origen)
+        clave = _clave_params(params)
+        if clave is not None:
+            try:
+                self.por_identica[(texto, clave)] += 1
+            except TypeError:  # parámetros no hasheables
+                pass
+        if len(self.ejecuciones) < self.max_registros:
+            self.ejecuciones.append(e)
+        self._en_curso = e
+        return e
+
+    def terminar(self):
+        self._en_curso = None
+
+    def traza(self, texto):
+        if self.pausado:
+            return
+        if texto.lstrip()[:9].upper().startswith(_CONTROL):
+            self.transacciones += 1
+            return
+        e = self._en_curso
+        if e is None:
+            return
+        if e.expandida is None:
+            e.expandida = texto
+        else:
+            e.disparos += 1
+            self.disparos += 1
+
+    # ---------- resumen ----------
+    def cerrar(self):
+        self.segundos = sum(e.segundos for e in self.ejecuciones)
+
+    def repetidas(self, umbral):
+        return [(sql, n, self.origen_de.get(sql, "ruta"))
+                for sql, n in self.por_plantilla.most_common() if n >= umbral]
+
+    def identicas(self):
+        return [(sql, params, n) for (sql, params), n in self.por_identica.most_common() if n >= 2]
+
+    def lentas(self, umbral_ms):
+        return [e for e in self.ejecuciones if e.segundos * 1000 >= umbral_ms]
+
+
+def perfil_actual():
+    if not has_request_context():
+        return None
+    return g.get("_perfil_consultas")
+
+
+def perfilado(fn):
+    """Marca un helper como origen de sus consultas en el perfil del request."""
+
+    @functools.wraps(fn)
+    def envoltura(*args, **kwargs):
+        perfil = perfil_actual()
+        if perfil is None:
+            return fn(*args, **kwargs)
+        perfil.pila.append(fn.__name__)
+        antes = perfil.total
+        inicio = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            perfil.pila.pop()
+            datos = perfil.helpers.setdefault(fn.__name__, [0, 0.0, 0])
+            datos[0] += 1
+            datos[1] += time.perf_counter() - inicio
+            datos[2] += perfil.total - antes
+
+    return envoltura
+
+
+def plan_de(conn, sql, params):
+    """Líneas del EXPLAIN QUERY PLAN (sin contar como consulta del request)."""
+    try:
+        filas = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+    except sqlite3.Error as e:
+        return [f"(sin plan: {e})"]
+    return [f"{'  ' * (1 if r[1] else 0)}{r[3]}" for r in filas]
+
+
+class Perfilador:
+    def __init__(self, lenta_ms=100.0, repetidas=5, max_registros=1000, header=True, panel=False):
+        self.lenta_ms = float(lenta_ms)
+        self.repetidas = int(repetidas)
+        self.max_registros = int(max_registros)
+        self.header = header
+        self.panel = panel
+
+        self._lock = threading.Lock()
+        self.por_endpoint = {}  # endpoint -> [requests, consultas, max, n_mas_1, lentas]
+
+    def adjuntar(self, conn, nombre):
+        perfil = perfil_actual()
+        if perfil is None:
+            return
+        conn.nombre_db = nombre
+        conn.perfil = perfil
+        conn.set_trace_callback(perfil.traza)
+
+    def anotar(self, endpoint, perfil, n_mas_1, lentas):
+        with self._lock:
+            datos = self.por_endpoint.setdefault(endpoint, [0, 0, 0, 0, 0])
+            datos[0] += 1
+            datos[1] += perfil.total
+            datos[2] = max(datos[2], perfil.total)
+            datos[3] += 1 if n_mas_1 else 0
+            datos[4] += len(lentas)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    "requests": d[0],
+                    "consultas_prom": round(d[1] / max(1, d[0]), 2),
+                    "consultas_max": d[2],
+                    "requests_n_mas_1": d[3],
+                    "lentas": d[4],
+                }
+                for endpoint, d in sorted(self.por_endpoint.items())
+            }
+
+
+def estadisticas_perfilador():
+    perfilador = current_app.extensions.get("perfilador")
+    return perfilador.estadisticas() if perfilador else None
+
+
+def _registrar_en_log(endpoint, perfil, repetidas, identicas, lentas):
+    log = current_app.logger
+    for sql, n, origen in repetidas:
+        log.warning("N+1 en %s: %d× desde %s: %s", endpoint, n, origen, sql[:300])
+    for sql, params, n in identicas:
+        log.warning("Consulta idéntica %d× en %s: %s %r", n, endpoint, sql[:300], params)
+    for e in lentas:
+        conn = g.get(f"_db_{e.db}")
+        plan = plan_de(conn, e.sql, e.params) if conn is not None and e.params is not None else []
+        log.warning(
+            "Consulta lenta (%.1f ms) en %s [%s]: %s\n%s",
+            e.segundos * 1000, endpoint, e.origen, plantilla(e.expandida or e.sql)[:1000],
+            "\n".join("    plan: " + linea for linea in plan),
+        )
+
+
+def _panel_html(endpoint, perfil, repetidas, identicas, lenta_ms):
+    grupos = {}
+    for e in perfil.ejecuciones:
+        d = grupos.setdefault(e.sql, {"sql": e.sql, "db": e.db, "origen": e.origen, "n": 0, "ms": 0.0, "lenta": False})
+        d["ms"] += e.segundos * 1000
+        d["lenta"] = d["lenta"] or e.segundos * 1000 >= lenta_ms
+    for d in grupos.values():
+        d["n"] = perfil.por_plantilla[d["sql"]]
+    return Markup(current_app.jinja_env.get_template("debug/consultas.html").render(
+        endpoint=endpoint,
+        perfil=perfil,
+        grupos=sorted(grupos.values(), key=lambda d: d["ms"], reverse=True),
+        repetidas={sql for sql, _, _ in repetidas},
+        identicas={sql for sql, _, _ in identicas},
+        helpers=sorted(perfil.helpers.items(), key=lambda h: h[1][1], reverse=True),
+    ))
+
+
+def init_app(app):
+    if not app.config["PERFILADOR_HABILITADO"]:
+        return
+
+    perfilador = Perfilador(
+        app.config["PERFILADOR_LENTA_MS"],
+        app.config["PERFILADOR_REPETIDAS"],
+        app.config["PERFILADOR_MAX_REGISTROS"],
+        header=app.config["PERFILADOR_HEADER"],
+        panel=app.debug or app.config["PERFILADOR_PANEL"],
+    )
+    app.extensions["perfilador"] = perfilador
+
+    @app.before_request
+    def _perfil_inicio():
+        g._perfil_consultas = PerfilConsultas(perfilador.max_registros)
+
+    @app.after_request
+    def _perfil_fin(response):
+        perfil = g.get("_perfil_consultas")
+        if perfil is None:
+            return response
+        perfil.pausado = True
+        perfil.cerrar()
+
+        endpoint = request.endpoint or "sin_ruta"
+        repetidas = perfil.repetidas(perfilador.repetidas)
+        identicas = perfil.identicas()
+        lentas = perfil.lentas(perfilador.lenta_ms)
+        perfilador.anotar(endpoint, perfil, repetidas, lentas)
+        if repetidas or identicas or lentas:
+            _registrar_en_log(endpoint, perfil, repetidas, identicas, lentas)
+
+        if perfilador.header:
+            response.headers["X-Consultas"] = (
+                f"n={perfil.total}; ms={perfil.segundos * 1000:.1f}; triggers={perfil.disparos}; "
+                f"tx={perfil.transacciones}; repetidas={len(repetidas)}; lentas={len(lentas)}"
+            )
+            response.headers.add(
+                "Server-Timing", f'db;dur={perfil.segundos * 1000:.1f};desc="{perfil.total} consultas"'
+            )
+
+        if (perfilador.panel and response.mimetype == "text/html"
+                and not response.is_streamed and response.status_code == 200):
+            html = response.get_data(as_text=True)
+            i = html.rfind("</body>")
+            if i != -1:
+                panel = _panel_html(endpoint, perfil, repetidas, identicas, perfilador.lenta_ms)
+                response.set_data(html[:i] + panel + html[i:])
+        return response
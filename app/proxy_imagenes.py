@@ -0,0 +1,465 @@
+import base64
+import hashlib
+import hmac
+import http.client
+import io
+import ipaddress
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from flask import current_app
+
+from config import secreto_local
+
+from .imagenes import Image, es_remota
+
+# =========================================================
+# PROXY CON CACHE PARA IMÁGENES REMOTAS (url_imagen en otro CDN)
+#   /img/r/<firma>/<url en base64>?w=320
+# - Las plantillas no apuntan al CDN: el filtro |imagen_remota arma la
+#   URL del proxy firmada con PROXY_IMAGENES_SECRETO (variable de entorno
+#   o, si no hay, un secreto aleatorio de la instalación guardado fuera
+#   del repo). Sin el secreto no se puede firmar otra URL.
+# - Aun firmada, solo se descarga de direcciones públicas: la IP a la que
+#   quedó conectado el socket se revisa antes de mandar el request (también
+#   en cada redirección), así ni un url_imagen ni un DNS apuntando a la red
+#   interna, loopback o link-local (metadatos de la nube) sirven de SSRF.
+# - Cada original se baja UNA vez y queda en disco (PROXY_IMAGENES_DIR),
+#   en un LRU acotado a PROXY_IMAGENES_MAX_BYTES (mtime = último uso,
+#   sirve igual con varios workers sobre el mismo directorio).
+# - Pasado PROXY_IMAGENES_TTL se revalida con If-None-Match /
+#   If-Modified-Since; si el CDN falla se sirve la copia vieja.
+# - Requests simultáneos por la misma imagen esperan a una sola
+#   descarga (por proceso).
+# - Con Pillow, ?w= (uno de IMAGENES_ANCHOS) redimensiona y entrega WebP
+#   si el navegador lo acepta; la variante se cachea con el hash del
+#   original, así un original nuevo no sirve miniaturas viejas.
+# =========================================================
+
+
+class ImagenRemotaNoDisponible(Exception):
+    pass
+
+
+class DestinoNoPermitido(ImagenRemotaNoDisponible):
+    """La URL (o una redirección) lleva a una dirección que no es pública."""
+
+
+# ---------------- firma de URLs ----------------
+
+def _b64(texto):
+    return base64.urlsafe_b64encode(texto.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _de_b64(datos):
+    return base64.urlsafe_b64decode(datos + "=" * (-len(datos) % 4)).decode("utf-8")
+
+
+def firmar(url, secreto):
+    return hmac.new(secreto.encode("utf-8"), url.encode("utf-8"), hashlib.sha256).hexdigest()[:20]
+
+
+def verificar(firma, datos, secreto):
+    """URL original si la firma es válida, si no None."""
+    try:
+        url = _de_b64(datos)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not hmac.compare_digest(firma, firmar(url, secreto)) or not es_remota(url):
+        return None
+    return url
+
+
+# ---------------- solo direcciones públicas ----------------
+
+def direccion_publica(ip):
+    ip = ipaddress.ip_address(ip.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+class _ConexionPublica(http.client.HTTPConnection):
+    """Revisa a qué IP quedó conectado el socket antes de mandar nada.
+
+    Se revisa la dirección real de la conexión y no lo que resolvió el DNS
+    antes: así no hay hueco entre revisar y conectar (DNS rebinding).
+    """
+
+    def connect(self):
+        super().connect()
+        ip = self.sock.getpeername()[0]
+        if not direccion_publica(ip):
+            self.sock.close()
+            self.sock = None
+            raise DestinoNoPermitido(f"{self.host} es una dirección no pública ({ip})")
+
+
+class _ConexionPublicaHTTPS(http.client.HTTPSConnection, _ConexionPublica):
+    # MRO: HTTPSConnection.connect -> _ConexionPublica.connect (revisión) -> TLS
+    pass
+
+
+class _HTTPPublico(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_ConexionPublica, req)
+
+
+class _HTTPSPublico(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_ConexionPublicaHTTPS, req, context=self._context)
+
+
+class _RedireccionesHTTP(urllib.request.HTTPRedirectHandler):
+    """Solo redirecciones a http(s) (urllib también seguiría a ftp://)."""
+
+    max_redirections = 3
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not es_remota(newurl):
+            raise DestinoNoPermitido(f"redirección a {newurl}")
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def abridor(permitir_privadas=False):
+    """Opener de urllib para el proxy. Sin proxies del entorno: se conecta directo."""
+    manejadores = [urllib.request.ProxyHandler({}), _RedireccionesHTTP]
+    if not permitir_privadas:
+        manejadores += [_HTTPPublico, _HTTPSPublico]
+    return urllib.request.build_opener(*manejadores)
+
+
+# ---------------- LRU en disco ----------------
+
+class CacheDisco:
+    """Cuerpos + metadatos (JSON) por clave; desaloja por mtime al pasar max_bytes."""
+
+    def __init__(self, directorio, max_bytes):
+        self.directorio = directorio
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._estimado = None  # bytes en disco (se recalcula al desalojar)
+        self.desalojos = 0
+        os.makedirs(directorio, exist_ok=True)
+
+    def _rutas(self, clave):
+        base = os.path.join(self.directorio, clave[:2], clave)
+        return base + ".bin", base + ".json"
+
+    def leer(self, clave):
+        """(meta, ruta del cuerpo) o None. Marca la entrada como recién usada."""
+        cuerpo, meta = self._rutas(clave)
+        try:
+            with open(meta, encoding="utf-8") as f:
+                datos = json.load(f)
+            os.utime(cuerpo)
+        except (OSError, ValueError):
+            return None
+        return datos, cuerpo
+
+    def guardar(self, clave, contenido, meta):
+        cuerpo, ruta_meta = self._rutas(clave)
+        os.makedirs(os.path.dirname(cuerpo), exist_ok=True)
+        sufijo = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(cuerpo + sufijo, "wb") as f:
+            f.write(contenido)
+        os.replace(cuerpo + sufijo, cuerpo)
+        self.actualizar_meta(clave, meta)
+        with self._lock:
+            if self._estimado is None:
+                self._estimado = self._tamano_total()
+            self._estimado += len(contenido)
+            exceso = self._estimado > self.max_bytes
+        if exceso:
+            self.desalojar()
+        return cuerpo
+
+    def actualizar_meta(self, clave, meta):
+        _, ruta_meta = self._rutas(clave)
+        tmp = f"{ruta_meta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, ruta_meta)
+
+    def _entradas(self):
+        for raiz, _, archivos in os.walk(self.directorio):
+            for nombre in archivos:
+                if nombre.endswith(".bin"):
+                    ruta = os.path.join(raiz, nombre)
+                    try:
+                        st = os.stat(ruta)
+                    except FileNotFoundError:
+                        continue
+                    yield st.st_mtime, st.st_size, ruta
+
+    def _tamano_total(self):
+        return sum(tam for _, tam, _ in self._entradas())
+
+    def desalojar(self, objetivo=0.9):
+        """Borra lo menos usado hasta quedar en objetivo * max_bytes."""
+        with self._lock:
+            entradas = sorted(self._entradas())
+            total = sum(tam for _, tam, _ in entradas)
+            limite = self.max_bytes * objetivo
+            for _, tam, ruta in entradas:
+                if total <= limite:
+                    break
+                for r in (ruta, ruta[:-4] + ".json"):
+                    try:
+                        os.remove(r)
+                    except FileNotFoundError:  # otro worker ya lo borró
+                        pass
+                total -= tam
+                self.desalojos += 1
+            self._estimado = total
+
+    def estadisticas(self):
+        with self._lock:
+            return {"max_bytes": self.max_bytes, "bytes_estimados": self._estimado, "desalojos": self.desalojos}
+
+
+# ---------------- proxy ----------------
+
+class _Vuelo:
+    __slots__ = ("listo", "resultado", "error")
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class ProxyImagenes:
+    def __init__(self, cache, ttl=86400.0, timeout=5.0, max_bytes=10 * 1024 * 1024, anchos=(), calidad=80,
+                 permitir_privadas=False):
+        self.cache = cache
+        self._abridor = abridor(permitir_privadas)
+        self.ttl = float(ttl)
+        self.timeout = float(timeout)
+        self.max_bytes = int(max_bytes)
+        self.anchos = tuple(anchos)
+        self.calidad = calidad
+
+        self._lock = threading.Lock()
+        self._vuelos = {}  # clave -> _Vuelo (una descarga/variante a la vez)
+
+        self.hits = 0
+        self.descargas = 0
+        self.revalidadas = 0
+        self.compartidas = 0
+        self.viejas_servidas = 0
+        self.errores = 0
+        self.variantes = 0
+
+    def _sumar(self, contador):
+        with self._lock:
+            setattr(self, contador, getattr(self, contador) + 1)
+
+    def _una_vez(self, clave, fn):
+        """Ejecuta fn() solo en el primer hilo que pide `clave`; los demás esperan su resultado."""
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelos[clave] = _Vuelo()
+            else:
+                self.compartidas += 1
+        if not lider:
+            if not vuelo.listo.wait(self.timeout * 3):
+                raise ImagenRemotaNoDisponible("tiempo de espera agotado")
+            if vuelo.error:
+                raise vuelo.error
+            return vuelo.resultado
+        try:
+            vuelo.resultado = fn()
+            return vuelo.resultado
+        except Exception as e:
+            vuelo.error = e
+            raise
+        finally:
+            vuelo.listo.set()
+            with self._lock:
+                self._vuelos.pop(clave, None)
+
+    # ---------- original ----------
+    def _descargar(self, url, previo):
+        headers = {"User-Agent": "LaCasaDelGadget/proxy-imagenes", "Accept": "image/*"}
+        if previo:
+            if previo.get("etag"):
+                headers["If-None-Match"] = previo["etag"]
+            if previo.get("last_modified"):
+                headers["If-Modified-Since"] = previo["last_modified"]
+        req = urllib.request.Request(url, headers=headers)
+        try:
+            with self._abridor.open(req, timeout=self.timeout) as r:
+                tipo = r.headers.get_content_type()
+                if not tipo.startswith("image/"):
+                    raise ImagenRemotaNoDisponible(f"tipo {tipo}")
+                contenido = r.read(self.max_bytes + 1)
+                if len(contenido) > self.max_bytes:
+                    raise ImagenRemotaNoDisponible("imagen demasiado grande")
+                return 200, contenido, {
+                    "tipo": tipo,
+                    "etag": r.headers.get("ETag"),
+                    "last_modified": r.headers.get("Last-Modified"),
+                }
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and previo:
+                return 304, None, None
+            raise ImagenRemotaNoDisponible(f"HTTP {e.code}")
+        except OSError as e:  # URLError, timeout, conexión rechazada...
+            raise ImagenRemotaNoDisponible(str(e))
+
+    def original(self, url):
+        """(meta, ruta) del original cacheado; lo baja o revalida si hace falta."""
+        clave = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        entrada = self.cache.leer(clave)
+        if entrada and time.time() - entrada[0]["revisado"] < self.ttl:
+            self._sumar("hits")
+            return entrada
+
+        def traer():
+            actual = self.cache.leer(clave)  # otro hilo/worker pudo traerla ya
+            if actual and time.time() - actual[0]["revisado"] < self.ttl:
+                return actual
+            previo = actual[0] if actual else None
+            try:
+                status, contenido, meta = self._descargar(url, previo)
+            except ImagenRemotaNoDisponible:
+                self._sumar("errores")
+                if actual:
+                    self._sumar("viejas_servidas")
+                    return actual  # mejor vieja que rota
+                raise
+            if status == 304:
+                self._sumar("revalidadas")
+                previo["revisado"] = time.time()
+                self.cache.actualizar_meta(clave, previo)
+                return previo, actual[1]
+            self._sumar("descargas")
+            meta.update({
+                "url": url,
+                "hash": hashlib.blake2b(contenido, digest_size=12).hexdigest(),
+                "bytes": len(contenido),
+                "revisado": time.time(),
+                "modificado": time.time(),  # Last-Modified hacia el navegador (el mtime es el LRU)
+            })
+            return meta, self.cache.guardar(clave, contenido, meta)
+
+        return self._una_vez(clave, traer)
+
+    # ---------- variante redimensionada ----------
+    def variante(self, url, ancho, webp):
+        meta, ruta = self.original(url)
+        if Image is None or ancho not in self.anchos:
+            return meta, ruta
+        formato = "webp" if webp else "jpeg"
+        clave = hashlib.sha256(f"{meta['hash']}|{ancho}|{formato}".encode()).hexdigest()
+        entrada = self.cache.leer(clave)
+        if entrada:
+            self._sumar("hits")
+            return entrada
+
+        def generar():
+            actual = self.cache.leer(clave)
+            if actual:
+                return actual
+            try:
+                with Image.open(ruta) as img:
+                    img.load()
+                    if img.width > ancho:
+                        img = img.resize((ancho, max(1, round(img.height * ancho / img.width))), Image.LANCZOS)
+                    if formato == "jpeg" or img.mode not in ("RGB", "RGBA"):
+                        img = img.convert("RGB" if formato == "jpeg" else "RGBA")
+                    buf = io.BytesIO()
+                    img.save(buf, "WEBP" if webp else "JPEG", quality=self.calidad)
+            except Exception:  # noqa: BLE001 - si Pillow no puede, se sirve el original
+                return meta, ruta
+            contenido = buf.getvalue()
+            self._sumar("variantes")
+            datos = {
+                "tipo": f"image/{formato}",
+                "hash": hashlib.blake2b(contenido, digest_size=12).hexdigest(),
+                "bytes": len(contenido),
+                "modificado": meta.get("modificado"),
+                "url": url,
+                "ancho": ancho,
+            }
+            return datos, self.cache.guardar(clave, contenido, datos)
+
+        return self._una_vez(clave, generar)
+
+    def estadisticas(self):
+        with self._lock:
+            datos = {
+                "hits": self.hits,
+                "descargas": self.descargas,
+                "revalidadas_304": self.revalidadas,
+                "compartidas": self.compartidas,
+                "viejas_servidas": self.viejas_servidas,
+                "errores": self.errores,
+                "variantes": self.variantes,
+            }
+        datos["disco"] = self.cache.estadisticas()
+        return datos
+
+
+# ---------------- helpers para rutas / plantillas ----------------
+
+def _proxy():
+    return current_app.extensions.get("proxy_imagenes")
+
+
+def obtener_imagen(url, ancho=None, webp=False):
+    proxy = _proxy()
+    if ancho:
+        return proxy.variante(url, ancho, webp)
+    return proxy.original(url)
+
+
+def url_verificada(firma, datos):
+    return verificar(firma, datos, current_app.config["PROXY_IMAGENES_SECRETO"])
+
+
+def url_proxy(url, ancho=None):
+    """URL del proxy para url_imagen remota; cualquier otra se regresa igual."""
+    if not url or not es_remota(url) or _proxy() is None:
+        return url
+    ruta = f"/img/r/{firmar(url, current_app.config['PROXY_IMAGENES_SECRETO'])}/{_b64(url)}"
+    return f"{ruta}?w={int(ancho)}" if ancho else ruta
+
+
+def srcset_proxy(url):
+    """srcset con los anchos del proxy (vacío si no es remota o no hay Pillow)."""
+    proxy = _proxy()
+    if Image is None or proxy is None or not url or not es_remota(url):
+        return ""
+    return ", ".join(f"{url_proxy(url, a)} {a}w" for a in proxy.anchos)
+
+
+def estadisticas_proxy():
+    proxy = _proxy()
+    return proxy.estadisticas() if proxy else None
+
+
+def init_app(app):
+    # los filtros existen siempre: sin proxy regresan la URL tal cual
+    app.add_template_filter(url_proxy, "imagen_remota")
+    app.add_template_filter(srcset_proxy, "srcset_remoto")
+    if not app.config["PROXY_IMAGENES_HABILITADO"]:
+        return
+    if not app.config["PROXY_IMAGENES_SECRETO"]:
+        app.config["PROXY_IMAGENES_SECRETO"] = secreto_local(os.path.dirname(app.config["DATABASE"]), "proxy-imagenes")
+    app.extensions["proxy_imagenes"] = ProxyImagenes(
+        CacheDisco(app.config["PROXY_IMAGENES_DIR"], app.config["PROXY_IMAGENES_MAX_BYTES"]),
+        ttl=app.config["PROXY_IMAGENES_TTL"],
+        timeout=app.config["PROXY_IMAGENES_TIMEOUT"],
+        max_bytes=app.config["IMAGENES_MAX_BYTES"],
+        anchos=app.config["IMAGENES_ANCHOS"],
+        calidad=app.config["IMAGENES_CALIDAD"],
+        permitir_privadas=app.config["PROXY_IMAGENES_PERMITIR_PRIVADAS"],
+    )
@@ -0,0 +1,232 @@
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+
+import click
+from flask import current_app
+
+from .catalogo import obtener_snapshot
+from .db import get_conn, get_staff_conn
+
+# =========================================================
+# RESÚMENES PARA EL DASHBOARD (gadget.db)
+# Tablas de agregados mantenidas por triggers (migraciones 5 y 13):
+# - resumen_ventas_hora    hora -> total, num_ventas, piezas
+# - resumen_producto_hora  (hora, producto_id) -> piezas, importe
+# - resumen_empleado_hora  (hora, empleado_id) -> total, num_ventas
+# - resumen_stock          producto_id -> stock_total (todas las sucursales)
+# Las horas son UTC (como CURRENT_TIMESTAMP de SQLite); "hoy" y "este
+# mes" son los de la tienda (CITAS_ZONA_HORARIA): la agenda da el rango
+# UTC y se suman esas horas por llave primaria (<= 24 renglones por día).
+# El resultado se guarda unos segundos en memoria.
+# =========================================================
+
+# Recalcula todo desde las tablas base (backfill / reparación)
+SQL_RECONSTRUIR = """
+    DELETE FROM resumen_ventas_hora;
+    DELETE FROM resumen_producto_hora;
+    DELETE FROM resumen_empleado_hora;
+    DELETE FROM resumen_stock;
+
+    INSERT INTO resumen_ventas_hora (hora, total, num_ventas, piezas)
+    SELECT strftime('%Y-%m-%d %H:00:00', v.creado_en), SUM(COALESCE(v.total, 0)), COUNT(*),
+           COALESCE(SUM((SELECT SUM(COALESCE(d.cantidad, 1)) FROM detalle_venta d WHERE d.venta_id = v.id)), 0)
+    FROM ventas v
+    GROUP BY 1;
+
+    INSERT INTO resumen_producto_hora (hora, producto_id, piezas, importe)
+    SELECT strftime('%Y-%m-%d %H:00:00', v.creado_en), d.producto_id,
+           SUM(COALESCE(d.cantidad, 1)), SUM(COALESCE(d.cantidad, 1) * COALESCE(d.precio, 0))
+    FROM detalle_venta d
+    JOIN ventas v ON v.id = d.venta_id
+    GROUP BY 1, d.producto_id;
+
+    INSERT INTO resumen_empleado_hora (hora, empleado_id, total, num_ventas)
+    SELECT strftime('%Y-%m-%d %H:00:00', creado_en), COALESCE(empleado_id, 0), SUM(COALESCE(total, 0)), COUNT(*)
+    FROM ventas
+    GROUP BY 1, COALESCE(empleado_id, 0);
+
+    INSERT INTO resumen_stock (producto_id, stock_total)
+    SELECT producto_id, COALESCE(SUM(stock), 0)
+    FROM inventario
+    GROUP BY producto_id;
+
+    INSERT INTO resumen_stock (producto_id, stock_total)
+    SELECT id, 0 FROM productos WHERE true
+    ON CONFLICT (producto_id) DO NOTHING;
+"""
+
+
+def reconstruir(db_path):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.executescript("BEGIN IMMEDIATE;\n" + SQL_RECONSTRUIR + "\nCOMMIT;")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+# =========================================================
+# LECTURAS DEL DASHBOARD
+# =========================================================
+
+def _fecha_corta(ts):
+    """creado_en (UTC) en la fecha local de la tienda, 'dd/mm/aaaa'."""
+    try:
+        return current_app.extensions["agenda"].local(ts).strftime("%d/%m/%Y")
+    except (KeyError, TypeError, ValueError):
+        return ts or ""
+
+
+def _fecha_cita(ts):
+    """fecha_hora (UTC) en la hora local de la tienda, 'dd/mm/aaaa HH:MM'."""
+    try:
+        return current_app.extensions["agenda"].local(ts).strftime("%d/%m/%Y %H:%M")
+    except (KeyError, TypeError, ValueError):
+        return (ts or "")[:16]
+
+
+def _nombres_empleados(ids):
+    ids = sorted({int(i) for i in ids if i})
+    if not ids:
+        return {}
+    cur = get_staff_conn().execute(
+        f"SELECT id, username, nombre_completo FROM empleados WHERE id IN ({','.join('?' * len(ids))})",
+        ids,
+    )
+    return {int(r["id"]): r["nombre_completo"] or r["username"] for r in cur.fetchall()}
+
+
+def _nombre_producto(producto_id):
+    producto = obtener_snapshot().por_id.get(int(producto_id))
+    if producto:
+        return producto["nombre"]
+    row = get_conn().execute("SELECT nombre FROM productos WHERE id = ?", (producto_id,)).fetchone()
+    return row["nombre"] if row else f"#{producto_id}"
+
+
+def _calcular_dashboard():
+    conn = get_conn()
+    umbral = int(current_app.config["STOCK_BAJO_UMBRAL"])
+    agenda = current_app.extensions["agenda"]
+    hoy_local = agenda.ahora().date()
+    primero_mes = hoy_local.replace(day=1)
+    siguiente_mes = (primero_mes + timedelta(days=32)).replace(day=1)
+    dia = agenda.rango_bd(hoy_local, hoy_local + timedelta(days=1))
+    mes = agenda.rango_bd(primero_mes, siguiente_mes)
+
+    hoy = conn.execute("""
+        SELECT SUM(total) AS total, SUM(num_ventas) AS num_ventas, SUM(piezas) AS piezas
+        FROM resumen_ventas_hora WHERE hora >= ? AND hora < ?
+    """, dia).fetchone()
+
+    top = conn.execute("""
+        SELECT producto_id, SUM(piezas) AS piezas FROM resumen_producto_hora
+        WHERE hora >= ? AND hora < ?
+        GROUP BY producto_id
+        ORDER BY piezas DESC
+        LIMIT 1
+    """, dia).fetchone()
+
+    stock_bajo = conn.execute(
+        "SELECT COUNT(*) FROM resumen_stock WHERE stock_total < ?", (umbral,)
+    ).fetchone()[0]
+
+    mejor = conn.execute("""
+        SELECT empleado_id, SUM(total) AS total FROM resumen_empleado_hora
+        WHERE hora >= ? AND hora < ? AND empleado_id != 0
+        GROUP BY empleado_id
+        ORDER BY total DESC
+        LIMIT 1
+    """, mes).fetchone()
+
+    citas = conn.execute("""
+        SELECT COUNT(*) AS total,
+               COALESCE(SUM(CASE WHEN estado = 'pendiente' THEN 1 ELSE 0 END), 0) AS pendientes
+        FROM citas
+        WHERE fecha_hora >= ? AND fecha_hora < ?
+    """, dia).fetchone()
+
+    ventas = conn.execute("""
+        SELECT id, creado_en, empleado_id, total, metodo_pago
+        FROM ventas
+        ORDER BY id DESC
+        LIMIT 5
+    """).fetchall()
+
+    proximas = conn.execute("""
+        SELECT c.id, c.fecha_hora, c.estado, c.sucursal, COALESCE(c.nombre_cliente, u.nombre_usuario) AS nombre_usuario,
+               (SELECT GROUP_CONCAT(p.nombre, ', ')
+                FROM cita_productos cp JOIN productos p ON p.id = cp.producto_id
+                WHERE cp.cita_id = c.id) AS productos
+        FROM citas c
+        LEFT JOIN usuarios u ON u.id = c.usuario_id
+        WHERE c.fecha_hora >= datetime('now') AND c.estado != 'cancelada'
+        ORDER BY c.fecha_hora ASC
+        LIMIT 5
+    """).fetchall()
+
+    nombres = _nombres_empleados([v["empleado_id"] for v in ventas] + ([mejor["empleado_id"]] if mejor else []))
+
+    datos_kpi = {
+        "ventas_dia": float(hoy["total"] or 0),
+        "num_ventas_dia": int(hoy["num_ventas"] or 0),
+        "piezas_dia": int(hoy["piezas"] or 0),
+        "top_producto_dia": _nombre_producto(top["producto_id"]) if top else "—",
+        "top_piezas_dia": int(top["piezas"]) if top else 0,
+        "citas_hoy": int(citas["total"] or 0),
+        "citas_pendientes": int(citas["pendientes"] or 0),
+        "stock_bajo": int(stock_bajo),
+        "empleado_mes": nombres.get(int(mejor["empleado_id"]), f"#{mejor['empleado_id']}") if mejor else "—",
+    }
+
+    ultimas_ventas = [
+        {
+            "fecha": _fecha_corta(v["creado_en"]),
+            "vendedor": nombres.get(int(v["empleado_id"]), "Cajero") if v["empleado_id"] else "Tienda en línea",
+            "total": float(v["total"] or 0),
+        }
+        for v in ventas
+    ]
+
+    ultimas_citas = [
+        {
+            "fecha": _fecha_cita(c["fecha_hora"]) + (f" · {c['sucursal']}" if c["sucursal"] else ""),
+            "cliente": c["nombre_usuario"] or f"Cliente #{c['id']}",
+            "producto": c["productos"] or "—",
+            "estado": (c["estado"] or "pendiente").capitalize(),
+        }
+        for c in proximas
+    ]
+
+    return datos_kpi, ultimas_ventas, ultimas_citas
+
+
+def datos_dashboard():
+    """(datos_kpi, ultimas_ventas, ultimas_citas) con cache de DASHBOARD_CACHE_TTL s."""
+    cache = current_app.extensions["dashboard_cache"]
+    ahora = time.monotonic()
+    with cache["lock"]:
+        if cache["valor"] is not None and ahora < cache["expira"]:
+            return cache["valor"]
+
+    valor = _calcular_dashboard()
+    with cache["lock"]:
+        cache["valor"] = valor
+        cache["expira"] = ahora + float(current_app.config["DASHBOARD_CACHE_TTL"])
+    return valor
+
+
+def init_app(app):
+    app.extensions["dashboard_cache"] = {"lock": threading.Lock(), "valor": None, "expira": 0.0}
+
+    @app.cli.command("reconstruir-resumenes")
+    def reconstruir_resumenes():
+        """Recalcula las tablas resumen_* desde ventas, detalle_venta e inventario."""
+        inicio = time.perf_counter()
+        reconstruir(app.config["DATABASE"])
+        click.echo(f"✔ Resúmenes reconstruidos en {time.perf_counter() - inicio:.2f}s")
@@ -1,168 +1,169 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, current_app, flash
+from flask import Blueprint, render_template, stream_template, request, redirect, url_for, session, current_app, flash, jsonify, abort, Response, send_file
+import hashlib
+import hmac
 import sqlite3
-import os
-from werkzeug.security import check_password_hash, generate_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from .db import get_conn, get_staff_conn, estadisticas_pools
+from .catalogo import obtener_snapshot, buscar_por_codigo, consultar, invalidar_catalogo, estadisticas_cache
+from .busqueda import sugerencias
+from .facetas import leer_filtros, clave_filtros, facetas
+from .paginacion import paginar
+from . import carrito_store
+from .resumenes import datos_dashboard
+from .checkout import registrar_venta, StockInsuficiente, ProductoNoDisponible
+from .auth import autenticar, generar_hash, estadisticas_auth, DemasiadosIntentos, ColaHashLlena
+from .metricas import exportar_metricas
+from .perfilador import perfilado, estadisticas_perfilador
+from .imagenes import procesar_producto as procesar_imagen, guardar_subida, ImagenNoDisponible
+from .condicional import condicional, args_normalizados
+from .agenda import agenda, estadisticas_agenda, CitaInvalida, CitaNoDisponible
+from .inventario import inventario, stock_total, estadisticas_inventario, MovimientoInvalido
+from .fragmentos import estadisticas_fragmentos
+from .proxy_imagenes import obtener_imagen, url_verificada, url_proxy, estadisticas_proxy, DestinoNoPermitido, ImagenRemotaNoDisponible
 
 main = Blueprint("main", __name__)
 
 # =========================================================
 # DB CONEXIONES
-# - gadget.db (productos, inventario, etc.) -> current_app.config["DATABASE"]
-# - empleados.db (staff login) -> database/empleados.db
+# - gadget.db (productos, inventario, etc.) -> get_conn()
+# - empleados.db (staff login) -> get_staff_conn()
+# Ambas salen del pool de app/db.py: una conexión por request,
+# se regresa al pool en teardown (NO cerrarlas aquí).
 # =========================================================
 
-def get_conn():
-    """Conexión a gadget.db (tu base principal)."""
-    conn = sqlite3.connect(current_app.config["DATABASE"])
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def get_staff_conn():
-    """Conexión a empleados.db (staff/admin)."""
-    db_path = os.path.join(current_app.root_path, "..", "database", "empleados.db")
-    db_path = os.path.abspath(db_path)
-
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
 # =========================================================
 # HELPERS PRODUCTOS / INVENTARIO (gadget.db)
 # =========================================================
 
+@perfilado
 def fetch_all_products(limit=None):
-    conn = get_conn()
-    cur = conn.cursor()
-    sql = """
-        SELECT id, nombre, marca, tipo, precio, descripcion, url_imagen, disponible
-        FROM productos
-        WHERE disponible = 1
-        ORDER BY id ASC
-    """
-    params = []
+    """Productos disponibles (desde el snapshot del catálogo, sin ir a la BD)."""
+    productos = obtener_snapshot().productos
     if limit:
-        sql += " LIMIT ?"
-        params.append(int(limit))
-
-    cur.execute(sql, params)
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+        productos = productos[:int(limit)]
+    return list(productos)
 
+@perfilado
 def fetch_marcas_disponibles():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT DISTINCT marca
-        FROM productos
-        WHERE disponible = 1
-        ORDER BY marca ASC
-    """)
-    rows = cur.fetchall()
-    conn.close()
-    return [r["marca"] for r in rows]
+    return list(obtener_snapshot().marcas)
 
+@perfilado
 def fetch_max_precio():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT COALESCE(MAX(precio), 0) AS max_precio
-        FROM productos
-        WHERE disponible = 1
-    """)
-    row = cur.fetchone()
-    conn.close()
-    try:
-        return int(float(row["max_precio"] or 0))
-    except:
-        return 0
+    return obtener_snapshot().max_precio
 
+@perfilado
 def get_stock_total(producto_id: int) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT COALESCE(SUM(stock), 0) AS stock_total
-        FROM inventario
-        WHERE producto_id = ?
-    """, (producto_id,))
-    row = cur.fetchone()
-    conn.close()
-    return int(row["stock_total"] or 0)
+    # total materializado por triggers (resumen_stock): una lectura por llave
+    return stock_total(get_conn(), producto_id)
 
+@perfilado
 def get_producto_basico(producto_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, nombre, marca, tipo, precio, url_imagen, disponible
-        FROM productos
-        WHERE id = ? AND disponible = 1
-    """, (producto_id,))
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    producto = obtener_snapshot().por_id.get(int(producto_id))
+    return dict(producto) if producto else None
+
+def _imagen_del_form():
+    """url_imagen del formulario de admin; un archivo subido tiene prioridad."""
+    archivo = request.files.get("imagen")
+    if archivo and archivo.filename:
+        return guardar_subida(archivo, current_app.static_folder)
+    return request.form["url_imagen"]
 # =========================================================
 # INVENTARIO ACCIONES
 # =========================================================
 @main.route("/admin/productos/nuevo", methods=["GET", "POST"])
 def admin_producto_nuevo():
+    if "user_id" not in session or session.get("tipo_usuario") != "staff":
+        return redirect(url_for("main.admin_login"))
+
+    inv = inventario()
+
+    def formulario(**kw):
+        return render_template("admin/producto_form.html", modo="nuevo", sucursales=inv.sucursales,
+                               sucursal_alta=current_app.config["INVENTARIO_SUCURSAL_ALTA"], **kw)
+
     if request.method == "POST":
         nombre = request.form["nombre"]
         marca = request.form["marca"]
         tipo = request.form["tipo"]
         precio = float(request.form["precio"])
         stock = int(request.form["stock"])
-        imagen = request.form["url_imagen"]
+        codigo = request.form.get("codigo_barras", "").strip() or None
+        try:
+            sucursal = inv.validar_sucursal(
+                request.form.get("sucursal") or current_app.config["INVENTARIO_SUCURSAL_ALTA"]
+            )
+            if stock < 0:
+                raise MovimientoInvalido("El stock inicial no puede ser negativo")
+            imagen = _imagen_del_form()
+        except (MovimientoInvalido, ImagenNoDisponible) as e:
+            return formulario(producto=request.form, error=str(e))
 
         conn = get_conn()
         cur = conn.cursor()
 
-        cur.execute("""
-            INSERT INTO productos (nombre, marca, tipo, precio, url_imagen, disponible)
-            VALUES (?, ?, ?, ?, ?, 1)
-        """, (nombre, marca, tipo, precio, imagen))
+        try:
+            cur.execute("""
+                INSERT INTO productos (nombre, marca, tipo, precio, url_imagen, disponible, codigo_barras)
+                VALUES (?, ?, ?, ?, ?, 1, ?)
+            """, (nombre, marca, tipo, precio, imagen, codigo))
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            return formulario(producto=request.form, error=f"El código de barras {codigo} ya está registrado")
 
         producto_id = cur.lastrowid
 
-        cur.execute("""
-            INSERT INTO inventario (producto_id, stock)
-            VALUES (?, ?)
-        """, (producto_id, stock))
+        # misma transacción que el INSERT del producto (fila de la sucursal + registro_inventario)
+        inv.mover(cur, producto_id, sucursal, stock, "alta de producto")
 
+        invalidar_catalogo(conn)
         conn.commit()
-        conn.close()
+        procesar_imagen(producto_id)
 
         return redirect(url_for("main.admin_productos"))
 
-    return render_template("admin/producto_form.html", modo="nuevo")
+    return formulario()
 @main.route("/admin/productos/editar/<int:producto_id>", methods=["GET", "POST"])
 def admin_producto_editar(producto_id):
+    if "user_id" not in session or session.get("tipo_usuario") != "staff":
+        return redirect(url_for("main.admin_login"))
+
     conn = get_conn()
     cur = conn.cursor()
 
     if request.method == "POST":
-        cur.execute("""
-            UPDATE productos
-            SET nombre=?, marca=?, tipo=?, precio=?, url_imagen=?
-            WHERE id=?
-        """, (
-            request.form["nombre"],
-            request.form["marca"],
-            request.form["tipo"],
-            request.form["precio"],
-            request.form["url_imagen"],
-            producto_id
-        ))
+        codigo = request.form.get("codigo_barras", "").strip() or None
+        try:
+            imagen = _imagen_del_form()
+        except ImagenNoDisponible as e:
+            return render_template("admin/producto_form.html", modo="editar", producto=request.form, error=str(e))
+        try:
+            cur.execute("""
+                UPDATE productos
+                SET nombre=?, marca=?, tipo=?, precio=?, url_imagen=?, codigo_barras=?
+                WHERE id=?
+            """, (
+                request.form["nombre"],
+                request.form["marca"],
+                request.form["tipo"],
+                request.form["precio"],
+                imagen,
+                codigo,
+                producto_id
+            ))
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            return render_template("admin/producto_form.html", modo="editar", producto=request.form,
+                                   error=f"El código de barras {codigo} ya está registrado")
+        invalidar_catalogo(conn)
         conn.commit()
-        conn.close()
+        procesar_imagen(producto_id)
         return redirect(url_for("main.admin_productos"))
 
     cur.execute("""
         SELECT * FROM productos WHERE id=?
     """, (producto_id,))
     producto = cur.fetchone()
-    conn.close()
 
     return render_template("admin/producto_form.html",
                            modo="editar",
@@ -173,16 +174,10 @@ def admin_producto_editar(producto_id):
 # HELPERS SESIÓN / CONTADORES
 # =========================================================
 
+@perfilado
 def get_cart_count():
-    """Total de piezas en carrito (suma cantidades)."""
-    carrito = session.get("carrito", [])
-    total = 0
-    for item in carrito:
-        try:
-            total += int(item.get("cantidad", 1))
-        except:
-            total += 1
-    return total
+    """Total de piezas en carrito (contador mantenido en la BD)."""
+    return carrito_store.contar_piezas()
 
 
 # =========================================================
@@ -190,6 +185,7 @@ def get_cart_count():
 # =========================================================
 
 @main.route("/")
+@condicional(args_normalizados)
 def index():
     productos_destacados = fetch_all_products(limit=8)
     return render_template(
@@ -200,8 +196,63 @@ def index():
 
 @main.route("/probar-producto", methods=["GET", "POST"])
 def probar_producto():
-    # Si luego quieres guardar la cita en DB, aquí es.
-    return render_template("citas.html", cart_count=get_cart_count())
+    # Agenda real: turnos por empleado/sucursal y reserva transaccional (app/agenda.py)
+    a = agenda()
+    hoy = a.ahora().date()
+    contexto = dict(
+        sucursales=a.sucursales,
+        fecha_min=hoy.isoformat(),
+        fecha_max=(hoy + timedelta(days=a.dias_max)).isoformat(),
+        max_productos=a.max_productos,
+        form={},
+        cart_count=get_cart_count(),
+    )
+    if request.method == "GET":
+        return render_template("citas.html", **contexto)
+
+    form = request.form
+    contexto["form"] = form
+    cliente = {
+        "nombre": (form.get("nombre") or "").strip(),
+        "correo": (form.get("email") or "").strip(),
+        "telefono": (form.get("telefono") or "").strip(),
+    }
+    try:
+        if not (cliente["nombre"] and cliente["correo"] and cliente["telefono"]):
+            raise CitaInvalida("Nombre, correo y teléfono son obligatorios")
+        notas = (form.get("productos") or "").strip() or None
+        cita_id = a.reservar(
+            get_conn(), form.get("sucursal"), form.get("fecha"), form.get("hora"),
+            cliente, productos=a.productos_de(notas), notas=notas,
+        )
+    except CitaNoDisponible as e:
+        flash(f"{e}. Elige otro horario.", "error")
+        return render_template("citas.html", **contexto), 409
+    except CitaInvalida as e:
+        flash(str(e), "error")
+        return render_template("citas.html", **contexto), 400
+
+    flash(f"✔ Cita #{cita_id} agendada en {form.get('sucursal')} el {form.get('fecha')} a las {form.get('hora')}.", "success")
+    return redirect(url_for("main.probar_producto"))
+
+
+@main.route("/probar-producto/disponibilidad")
+def citas_disponibilidad():
+    """Horarios libres de una sucursal en un día (JSON, cacheable unos segundos)."""
+    a = agenda()
+    conn = get_conn()
+    sucursal = request.args.get("sucursal") or a.sucursales[0]
+    fecha = request.args.get("fecha") or a.ahora().date().isoformat()
+    try:
+        horarios = a.disponibilidad(conn, sucursal, fecha)
+    except CitaInvalida as e:
+        return jsonify({"error": str(e)}), 400
+
+    resp = jsonify({"sucursal": sucursal, "fecha": fecha, "duracion_min": a.duracion, "horarios": horarios})
+    resp.set_etag(hashlib.blake2b(resp.get_data(), digest_size=12).hexdigest())
+    resp.cache_control.public = True
+    resp.cache_control.max_age = current_app.config["CITAS_CACHE_S"]
+    return resp.make_conditional(request)
 
 @main.route("/login", methods=["GET", "POST"])
 def login():
@@ -233,131 +284,148 @@ def empleados():
 # =========================================================
 
 @main.route("/productos")
+@condicional(args_normalizados)
 def productos_listado():
-    # Tipos “principales” (lo que NO debe caer en accesorios)
-    tipos_principales = ["Smartphone", "Laptop", "Tablet"]
-
-    categorias = request.args.getlist("categoria")  # checkboxes
-    marcas = request.args.getlist("marca")
-    q = (request.args.get("q") or "").strip()
-    precio_max = request.args.get("precio_max")
-
-    try:
-        precio_max_num = float(precio_max) if precio_max not in (None, "") else None
-    except ValueError:
-        precio_max_num = None
-
-    where = ["disponible = 1"]
-    params = []
-
-    # --- Categorías ---
-    # telefonos -> Smartphone
-    # laptops -> Laptop
-    # tablets -> Tablet
-    # wearables -> Wearable (si existe en BD)
-    # accesorios -> TODO lo demás (drones, cámaras, consolas, audio, etc.)
-    tipos_in = []
-    accesorios_activado = False
-
-    for cat in categorias:
-        if cat == "telefonos":
-            tipos_in.append("Smartphone")
-        elif cat == "laptops":
-            tipos_in.append("Laptop")
-        elif cat == "tablets":
-            tipos_in.append("Tablet")
-        elif cat == "wearables":
-            tipos_in.append("Wearable")
-        elif cat == "accesorios":
-            accesorios_activado = True
-
-    tipos_in = sorted(set(tipos_in))
-
-    # Caso especial: accesorios = "todo lo demás"
-    # Si usuario selecciona accesorios + alguna categoría principal -> OR
-    if accesorios_activado and tipos_in:
-        where.append(
-            "("
-            + f"tipo IN ({','.join(['?']*len(tipos_in))})"
-            + " OR "
-            + f"tipo NOT IN ({','.join(['?']*len(tipos_principales))})"
-            + ")"
-        )
-        params.extend(tipos_in)
-        params.extend(tipos_principales)
-
-    elif accesorios_activado and not tipos_in:
-        where.append(f"tipo NOT IN ({','.join(['?']*len(tipos_principales))})")
-        params.extend(tipos_principales)
-
-    elif (not accesorios_activado) and tipos_in:
-        where.append(f"tipo IN ({','.join(['?']*len(tipos_in))})")
-        params.extend(tipos_in)
-
-    # Si no seleccionó categoría -> no agregamos filtro y se muestra TODO.
-
-    # --- Marca ---
-    if marcas:
-        where.append(f"marca IN ({','.join(['?']*len(marcas))})")
-        params.extend(marcas)
-
-    # --- Búsqueda ---
-    if q:
-        where.append("(nombre LIKE ? OR marca LIKE ? OR tipo LIKE ?)")
-        like = f"%{q}%"
-        params.extend([like, like, like])
-
-    # --- Precio ---
-    if precio_max_num is not None:
-        where.append("precio <= ?")
-        params.append(precio_max_num)
-
-    sql = f"""
-        SELECT id, nombre, marca, tipo, precio, descripcion, url_imagen, disponible
-        FROM productos
-        WHERE {" AND ".join(where)}
-        ORDER BY id ASC
-    """
+    # Categorías (checkboxes):
+    # telefonos -> Smartphone, laptops -> Laptop, tablets -> Tablet,
+    # wearables -> Wearable, accesorios -> TODO lo demás (drones, cámaras, consolas, audio, etc.)
+    # Si no seleccionó categoría -> no se filtra y se muestra TODO.
+    # Resultado + conteos por marca/categoría en una sola pasada (app/facetas.py)
+    filtros_req = leer_filtros(request.args)
+    resultado = facetas(filtros_req)
+
+    # Paginación por cursor: ?cursor=<token>&orden=id|relevancia|precio_asc|precio_desc
+    orden = request.args.get("orden") or ("relevancia" if filtros_req["q"] else "id")
+    productos, siguiente = paginar(
+        resultado["productos"],
+        orden,
+        request.args.get("cursor"),
+        current_app.config["PRODUCTOS_POR_PAGINA"],
+        clave_filtros(filtros_req),
+    )
 
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(sql, params)
-    productos = [dict(r) for r in cur.fetchall()]
-    conn.close()
+    # en orden: la misma página da los mismos enlaces (y el mismo ETag, ver app/condicional.py)
+    args = {k: request.args.getlist(k) for k in sorted(request.args)}
+    args.pop("cursor", None)
+    url_inicio = url_for("main.productos_listado", **args) if request.args.get("cursor") else None
+    url_siguiente = url_for("main.productos_listado", **args, cursor=siguiente) if siguiente else None
 
     ui_data = {
         "marcas_disponibles": fetch_marcas_disponibles(),
-        "max_precio_real": max(fetch_max_precio(), 50000),
+        "max_precio_real": max(resultado["max_precio_catalogo"], 50000),
+        "conteo_marcas": resultado["marcas"],
+        "conteo_categorias": resultado["categorias"],
     }
 
     filtros = {
-        "categorias": categorias,
-        "marcas": marcas,
-        "q": q,
-        "precio_max": precio_max_num if precio_max_num is not None else ui_data["max_precio_real"],
+        "categorias": filtros_req["categorias"],
+        "marcas": filtros_req["marcas"],
+        "q": filtros_req["q"],
+        "precio_max": filtros_req["precio_max"] if filtros_req["precio_max"] is not None else ui_data["max_precio_real"],
+        "orden": orden,
     }
 
-    return render_template(
-        "producto_detalle.html",
+    contexto = dict(
         productos=productos,
+        total=resultado["total"],
+        url_siguiente=url_siguiente,
+        url_inicio=url_inicio,
         filtros=filtros,
         ui_data=ui_data,
+        clave_resultados=args_normalizados(),
         cart_count=get_cart_count()
     )
 
+    # Streaming opcional: los primeros bytes salen antes de renderizar todas las tarjetas
+    if current_app.config["PRODUCTOS_STREAMING"]:
+        return stream_template("producto_detalle.html", **contexto)
+    return render_template("producto_detalle.html", **contexto)
+
+
+@main.route("/productos/facetas")
+def productos_facetas():
+    """Mismo motor que /productos pero en JSON (para filtros dinámicos)."""
+    try:
+        limite = max(1, min(int(request.args.get("limite", 48)), 200))
+    except ValueError:
+        limite = 48
+
+    filtros_req = leer_filtros(request.args)
+    resultado = facetas(filtros_req)
+    orden = request.args.get("orden") or ("relevancia" if filtros_req["q"] else "id")
+    pagina, siguiente = paginar(
+        resultado["productos"], orden, request.args.get("cursor"), limite, clave_filtros(filtros_req)
+    )
+
+    return jsonify({
+        "total": resultado["total"],
+        "productos": [dict(p) for p in pagina],
+        "siguiente": siguiente,
+        "facetas": {
+            "marcas": resultado["marcas"],
+            "categorias": resultado["categorias"],
+            "precio": {"min": resultado["precio_min"], "max": resultado["precio_max"]},
+        },
+    })
+
+
+@main.route("/productos/sugerencias")
+def productos_sugerencias():
+    """Autocompletado del buscador (JSON)."""
+    q = (request.args.get("q") or "").strip()
+    if len(q) < 2:
+        return jsonify([])
+
+    resultados = consultar(("sugerencias", q.lower()), lambda: tuple(sugerencias(q)), region="sugerencias")
+    return jsonify(list(resultados))
+
 
 # =========================================================
 # ✅ CARRITO (gadget.db)
 # =========================================================
 
+def items_carrito():
+    """Renglones del carrito con datos del catálogo (para carrito.html)."""
+    por_id = obtener_snapshot().por_id
+    carrito = []
+    for producto_id, cantidad in carrito_store.obtener_items(carrito_store.carrito_id_actual()).items():
+        producto = por_id.get(producto_id)
+        if not producto:
+            continue  # ya no está disponible
+        carrito.append({
+            "id": producto_id,
+            "nombre": producto["nombre"],
+            "marca": producto["marca"],
+            "tipo": producto["tipo"],
+            "precio": float(producto["precio"] or 0),
+            "url_imagen": producto["url_imagen"],
+            "imagen": producto["imagen"],
+            "cantidad": cantidad,
+        })
+    return carrito
+
+@main.route("/img/r/<firma>/<datos>")
+def imagen_remota(firma, datos):
+    """Imagen de un CDN externo desde el cache local (app/proxy_imagenes.py)."""
+    url = url_verificada(firma, datos)
+    if not url:
+        abort(404)
+    ancho = request.args.get("w", type=int)
+    try:
+        meta, ruta = obtener_imagen(url, ancho, webp="image/webp" in request.headers.get("Accept", ""))
+    except DestinoNoPermitido:
+        abort(404)
+    except ImagenRemotaNoDisponible:
+        return redirect(url)  # que el navegador lo intente directo
+    resp = send_file(ruta, mimetype=meta["tipo"], etag=meta["hash"], last_modified=meta.get("modificado"),
+                     max_age=current_app.config["PROXY_IMAGENES_MAX_AGE"], conditional=True)
+    if ancho:
+        resp.vary.add("Accept")
+    return resp
+
 @main.route("/carrito", methods=["GET"])
 def carrito():
-    carrito = session.get("carrito", [])
-
-    # normalizar
-    for item in carrito:
-        item["precio"] = float(item.get("precio", 0))
-        item["cantidad"] = int(item.get("cantidad", 1))
+    carrito = items_carrito()
 
     subtotal = sum(item["precio"] * item["cantidad"] for item in carrito)
     total = subtotal
@@ -381,70 +449,96 @@ def agregar_carrito(producto_id):
         flash("Sin stock disponible para este producto.", "warning")
         return redirect(url_for("main.productos_listado"))
 
-    carrito = session.get("carrito", [])
-
-    # normalizar
-    for item in carrito:
-        item["cantidad"] = int(item.get("cantidad", 1))
-        item["precio"] = float(item.get("precio", 0))
-
-    # si ya existe, sumar (con límite)
-    for item in carrito:
-        if item["id"] == producto_id:
-            nuevo = item["cantidad"] + 1
-            if nuevo <= min(10, stock_total):
-                item["cantidad"] = nuevo
-            session["carrito"] = carrito
-            return redirect(url_for("main.carrito"))
-
-    # si no existe, agregar
-    carrito.append({
-        "id": int(producto["id"]),
-        "nombre": producto["nombre"],
-        "marca": producto["marca"],
-        "tipo": producto["tipo"],
-        "precio": float(producto["precio"] or 0),
-        "url_imagen": producto.get("url_imagen"),
-        "cantidad": 1,
-    })
+    carrito_id = carrito_store.carrito_id_actual(crear=True)
+    actual = carrito_store.cantidad_de(carrito_id, producto_id)
+
+    # si ya existe, sumar (con límite); si no existe, agregar
+    nuevo = actual + 1
+    if nuevo <= min(carrito_store.MAX_POR_PRODUCTO, stock_total):
+        carrito_store.actualizar_items(carrito_id, {producto_id: nuevo})
 
-    session["carrito"] = carrito
     return redirect(url_for("main.carrito"))
 
 @main.route("/carrito/actualizar/<int:producto_id>", methods=["POST"])
 def actualizar_carrito(producto_id):
     accion = request.form.get("accion")  # sumar/restar
-    carrito = session.get("carrito", [])
-    stock_total = get_stock_total(producto_id)
+    carrito_id = carrito_store.carrito_id_actual()
+    actual = carrito_store.cantidad_de(carrito_id, producto_id)
+
+    if actual:
+        if accion == "sumar":
+            if actual < min(carrito_store.MAX_POR_PRODUCTO, get_stock_total(producto_id)):
+                carrito_store.actualizar_items(carrito_id, {producto_id: actual + 1})
 
-    for item in carrito:
-        if item["id"] == producto_id:
-            item["cantidad"] = int(item.get("cantidad", 1))
+        elif accion == "restar":
+            if actual > 1:
+                carrito_store.actualizar_items(carrito_id, {producto_id: actual - 1})
 
-            if accion == "sumar":
-                if item["cantidad"] < min(10, stock_total):
-                    item["cantidad"] += 1
+    return redirect(url_for("main.carrito"))
 
-            elif accion == "restar":
-                if item["cantidad"] > 1:
-                    item["cantidad"] -= 1
-            break
+@main.route("/carrito/lote", methods=["POST"])
+def actualizar_carrito_lote():
+    """Varias cantidades en una sola transacción.
 
-    session["carrito"] = carrito
+    JSON {"items": {"<producto_id>": cantidad, ...}} o form cantidad_<id>=n.
+    Cantidad 0 elimina. Regresa el nuevo total de piezas.
+    """
+    if request.is_json:
+        pedidos = (request.get_json(silent=True) or {}).get("items") or {}
+    else:
+        pedidos = {
+            k[len("cantidad_"):]: v for k, v in request.form.items() if k.startswith("cantidad_")
+        }
+
+    por_id = obtener_snapshot().por_id
+    cambios = {}
+    for pid, cant in pedidos.items():
+        try:
+            pid, cant = int(pid), int(cant)
+        except (TypeError, ValueError):
+            continue
+        if cant > 0:
+            if pid not in por_id:
+                continue
+            cant = min(cant, carrito_store.MAX_POR_PRODUCTO, get_stock_total(pid))
+        cambios[pid] = cant
+
+    if cambios:
+        carrito_store.actualizar_items(carrito_store.carrito_id_actual(crear=True), cambios)
+
+    if request.is_json:
+        return jsonify({"cart_count": get_cart_count()})
     return redirect(url_for("main.carrito"))
 
 @main.route("/carrito/eliminar/<int:producto_id>", methods=["POST"])
 def eliminar_carrito(producto_id):
-    carrito = session.get("carrito", [])
-    carrito = [item for item in carrito if item["id"] != producto_id]
-    session["carrito"] = carrito
+    carrito_id = carrito_store.carrito_id_actual()
+    if carrito_id:
+        carrito_store.actualizar_items(carrito_id, {producto_id: 0})
     return redirect(url_for("main.carrito"))
 
 @main.route("/carrito/pagar", methods=["POST"])
 def pagar():
-    # Simulación (luego aquí insertas venta + detalle_venta)
-    session["carrito"] = []
-    return "<h1>¡Pago procesado! (Simulación)</h1>"
+    carrito_id = carrito_store.carrito_id_actual()
+    items = carrito_store.obtener_items(carrito_id)
+    if not items:
+        return redirect(url_for("main.carrito"))
+
+    # venta + detalle_venta + inventario en una sola transacción (app/checkout.py)
+    try:
+        venta_id = registrar_venta(get_conn(), items.items(), metodo_pago="en_linea")
+    except StockInsuficiente as e:
+        producto = get_producto_basico(e.producto_id)
+        nombre = producto["nombre"] if producto else f"#{e.producto_id}"
+        flash(f"Solo quedan {e.disponible} piezas de {nombre}.", "warning")
+        return redirect(url_for("main.carrito"))
+    except ProductoNoDisponible:
+        carrito_store.actualizar_items(carrito_id, {pid: 0 for pid in items if not get_producto_basico(pid)})
+        flash("Algunos productos ya no están disponibles y se quitaron del carrito.", "warning")
+        return redirect(url_for("main.carrito"))
+
+    carrito_store.vaciar(carrito_id)
+    return f"<h1>¡Pago procesado! Folio de venta #{venta_id}</h1>"
 
 
 # =========================================================
@@ -458,13 +552,10 @@ def admin_login():
         password = request.form.get("contraseña", "")
 
         try:
-            conn = get_staff_conn()
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM empleados WHERE username = ?", (usuario,))
-            user = cur.fetchone()
-            conn.close()
+            # hash en el pool acotado + límite de intentos (app/auth.py)
+            user = autenticar(usuario, password, request.remote_addr or "-")
 
-            if user and check_password_hash(user["password_hash"], password):
+            if user:
                 session["user_id"] = user["id"]
                 session["username"] = user["username"]
                 session["nombre_completo"] = user["nombre_completo"] if "nombre_completo" in user.keys() else user["username"]
@@ -479,8 +570,14 @@ def admin_login():
 
             flash("Credenciales incorrectas", "error")
 
-        except Exception as e:
-            print(f"Error Login: {e}")
+        except DemasiadosIntentos as e:
+            flash(f"Demasiados intentos fallidos. Intenta de nuevo en {int(e.reintentar_en) + 1} s", "error")
+            return render_template("admin/login.html", cart_count=get_cart_count()), 429
+        except ColaHashLlena:
+            flash("Hay muchos inicios de sesión en este momento, intenta de nuevo", "error")
+            return render_template("admin/login.html", cart_count=get_cart_count()), 503
+        except Exception:
+            current_app.logger.exception("Error en login del staff")
             flash("Error de conexión", "error")
 
     return render_template("admin/login.html", cart_count=get_cart_count())
@@ -495,24 +592,9 @@ def admin_dashboard():
     if "user_id" not in session or session.get("tipo_usuario") != "staff":
         return redirect(url_for("main.admin_login"))
 
-    # KPIs simulados
-    datos_kpi = {
-        "ventas_dia": 45230,
-        "citas_hoy": 8,
-        "stock_bajo": 5,
-        "empleado_mes": "Leo Cruz",
-        "fecha_hoy": datetime.now().strftime("%d/%m/%Y"),
-    }
-
-    ultimas_ventas = [
-        {"fecha": "11/12/2025", "vendedor": "Cajero 1", "producto": "iPhone 15", "total": 28999},
-        {"fecha": "11/12/2025", "vendedor": "Leo Cruz", "producto": "AirPods Pro", "total": 5999},
-    ]
-
-    ultimas_citas = [
-        {"hora": "10:00 AM", "cliente": "Ana López", "producto": "MacBook Air", "estado": "Confirmada"},
-        {"hora": "12:30 PM", "cliente": "Carlos Ruiz", "producto": "Galaxy S24", "estado": "Pendiente"},
-    ]
+    # KPIs reales desde las tablas resumen_* (app/resumenes.py)
+    datos_kpi, ultimas_ventas, ultimas_citas = datos_dashboard()
+    datos_kpi = dict(datos_kpi, fecha_hoy=datetime.now().strftime("%d/%m/%Y"))
 
     return render_template(
         "admin/dashboard.html",
@@ -522,57 +604,80 @@ def admin_dashboard():
         cart_count=get_cart_count()
     )
 
+# =========================================================
+# PUNTO DE VENTA (mostrador)
+# La canasta vive en session["venta_fisica"] = {"<producto_id>": cantidad};
+# nombre, precio e imagen salen del snapshot al mostrar. Cada escaneo es
+# una búsqueda en diccionario (catalogo.buscar_por_codigo), sin SQL.
+# =========================================================
+
+def _venta_fisica():
+    venta = session.get("venta_fisica") or {}
+    if isinstance(venta, list):  # formato anterior: lista de dicts
+        convertida = {}
+        for item in venta:
+            clave = str(int(item["id"]))
+            convertida[clave] = convertida.get(clave, 0) + int(item.get("cantidad", 1))
+        venta = convertida
+    return venta
+
+
+def _renglon_venta(producto_id, cantidad):
+    producto = obtener_snapshot().por_id.get(int(producto_id))
+    if producto is None:
+        # dejó de estar disponible: se muestra para poder quitarlo
+        return {"id": int(producto_id), "nombre": f"Producto #{producto_id}", "marca": "",
+                "tipo": "No disponible", "precio": 0.0, "url_imagen": None, "cantidad": cantidad}
+    return dict(producto, precio=float(producto["precio"] or 0), cantidad=cantidad)
+
+
+def _total_venta(renglones):
+    return sum(r["precio"] * r["cantidad"] for r in renglones)
+
+
+ROLES_CAJA = ("admin", "empleado", "cajero")
+
+
 @main.route("/admin/punto-venta", methods=["GET", "POST"])
 def punto_venta():
-    roles_permitidos = ["admin", "empleado", "cajero"]
-    if session.get("user_rol") not in roles_permitidos:
+    if session.get("user_rol") not in ROLES_CAJA:
         flash("No tienes permiso para acceder a la caja", "error")
         return redirect(url_for("main.admin_dashboard"))
 
     # venta física en sesión (independiente del carrito web)
-    venta_actual = session.get("venta_fisica", [])
-
-    # productos desde gadget.db (misma fuente real)
-    productos_db = fetch_all_products(limit=None)
-    total = sum(float(p.get("precio", 0)) * int(p.get("cantidad", 1)) for p in venta_actual)
+    venta_actual = _venta_fisica()
 
     if request.method == "POST":
         codigo = (request.form.get("codigo_barras") or "").strip()
         accion = request.form.get("accion")
 
-        # 1) ESCANEAR (usamos ID como código)
+        # 1) ESCANEAR (código de barras, o ID si el producto no tiene código)
         if codigo:
-            try:
-                pid = int(codigo)
-            except:
-                pid = None
-
-            if pid:
-                prod = next((p for p in productos_db if int(p["id"]) == pid), None)
-                if prod:
-                    found = False
-                    for item in venta_actual:
-                        if int(item["id"]) == int(prod["id"]):
-                            item["cantidad"] = int(item.get("cantidad", 1)) + 1
-                            found = True
-                            break
-                    if not found:
-                        nuevo = {
-                            "id": int(prod["id"]),
-                            "nombre": prod["nombre"],
-                            "precio": float(prod["precio"] or 0),
-                            "cantidad": 1,
-                        }
-                        venta_actual.append(nuevo)
-
-                    session["venta_fisica"] = venta_actual
-                else:
-                    flash("Producto no encontrado", "error")
-
-        # 2) FINALIZAR
+            prod = buscar_por_codigo(codigo)
+            if prod:
+                clave = str(int(prod["id"]))
+                venta_actual[clave] = venta_actual.get(clave, 0) + 1
+                session["venta_fisica"] = venta_actual
+            else:
+                flash("Producto no encontrado", "error")
+
+        # 2) FINALIZAR (registra la venta y descuenta inventario)
         elif accion == "finalizar":
+            if not venta_actual:
+                return redirect(url_for("main.punto_venta"))
+            try:
+                venta_id = registrar_venta(
+                    get_conn(),
+                    [(int(pid), cantidad) for pid, cantidad in venta_actual.items()],
+                    empleado_id=session.get("user_id"),
+                    metodo_pago="mostrador",
+                )
+            except (StockInsuficiente, ProductoNoDisponible) as e:
+                flash(f"No se pudo cobrar: {e}", "error")
+                return redirect(url_for("main.punto_venta"))
+
             session.pop("venta_fisica", None)
-            flash("¡Venta cobrada con éxito!", "success")
+            flash(f"¡Venta #{venta_id} cobrada con éxito!", "success")
             return redirect(url_for("main.punto_venta"))
 
         # 3) LIMPIAR
@@ -582,21 +687,103 @@ def punto_venta():
 
         # 4) ELIMINAR ITEM
         elif accion == "eliminar_item":
-            item_id = int(request.form.get("item_id"))
-            venta_actual = [i for i in venta_actual if int(i["id"]) != item_id]
+            venta_actual.pop(str(request.form.get("item_id", type=int)), None)
             session["venta_fisica"] = venta_actual
             return redirect(url_for("main.punto_venta"))
 
-        total = sum(float(p.get("precio", 0)) * int(p.get("cantidad", 1)) for p in session.get("venta_fisica", []))
+    renglones = [_renglon_venta(pid, cantidad) for pid, cantidad in venta_actual.items()]
 
     return render_template(
         "admin/venta_fisica.html",
-        venta=session.get("venta_fisica", []),
-        total=total,
-        productos_disponibles=productos_db,
+        venta=renglones,
+        total=_total_venta(renglones),
+        productos_disponibles=obtener_snapshot().productos[:12],
         cart_count=get_cart_count()
     )
 
+# ---------- API JSON de la caja (sin recargar la página) ----------
+# Cada respuesta trae solo el renglón que cambió y el total nuevo.
+
+def _pos_respuesta(venta, **extra):
+    total = _total_venta([_renglon_venta(pid, cantidad) for pid, cantidad in venta.items()])
+    return jsonify(ok=True, total=total, piezas=sum(venta.values()), **extra)
+
+
+def _pos_error(mensaje, status):
+    return jsonify(ok=False, error=mensaje), status
+
+
+def _pos_datos():
+    return request.get_json(silent=True) or request.form
+
+
+@main.route("/admin/punto-venta/api/escanear", methods=["POST"])
+def punto_venta_api_escanear():
+    if session.get("user_rol") not in ROLES_CAJA:
+        return _pos_error("No tienes permiso para usar la caja", 403)
+
+    prod = buscar_por_codigo(str(_pos_datos().get("codigo") or ""))
+    if not prod:
+        return _pos_error("Producto no encontrado", 404)
+
+    venta = _venta_fisica()
+    clave = str(int(prod["id"]))
+    venta[clave] = venta.get(clave, 0) + 1
+    session["venta_fisica"] = venta
+
+    r = _renglon_venta(clave, venta[clave])
+    renglon = {k: r[k] for k in ("id", "nombre", "marca", "tipo", "precio", "url_imagen", "cantidad")}
+    renglon["url_imagen"] = url_proxy(renglon["url_imagen"], 160)
+    renglon["subtotal"] = r["precio"] * r["cantidad"]
+    return _pos_respuesta(venta, renglon=renglon)
+
+
+@main.route("/admin/punto-venta/api/quitar", methods=["POST"])
+def punto_venta_api_quitar():
+    if session.get("user_rol") not in ROLES_CAJA:
+        return _pos_error("No tienes permiso para usar la caja", 403)
+
+    try:
+        producto_id = int(_pos_datos().get("producto_id"))
+    except (TypeError, ValueError):
+        return _pos_error("producto_id inválido", 400)
+
+    venta = _venta_fisica()
+    venta.pop(str(producto_id), None)
+    session["venta_fisica"] = venta
+    return _pos_respuesta(venta, producto_id=producto_id)
+
+
+@main.route("/admin/punto-venta/api/limpiar", methods=["POST"])
+def punto_venta_api_limpiar():
+    if session.get("user_rol") not in ROLES_CAJA:
+        return _pos_error("No tienes permiso para usar la caja", 403)
+
+    session.pop("venta_fisica", None)
+    return _pos_respuesta({})
+
+
+@main.route("/admin/punto-venta/api/finalizar", methods=["POST"])
+def punto_venta_api_finalizar():
+    if session.get("user_rol") not in ROLES_CAJA:
+        return _pos_error("No tienes permiso para usar la caja", 403)
+
+    venta = _venta_fisica()
+    if not venta:
+        return _pos_error("La venta no tiene productos", 400)
+    try:
+        venta_id = registrar_venta(
+            get_conn(),
+            [(int(pid), cantidad) for pid, cantidad in venta.items()],
+            empleado_id=session.get("user_id"),
+            metodo_pago="mostrador",
+        )
+    except (StockInsuficiente, ProductoNoDisponible) as e:
+        return _pos_error(f"No se pudo cobrar: {e}", 409)
+
+    session.pop("venta_fisica", None)
+    return _pos_respuesta({}, venta_id=venta_id, mensaje=f"¡Venta #{venta_id} cobrada con éxito!")
+
 @main.route("/admin/usuarios", methods=["GET", "POST"])
 def admin_usuarios():
     if session.get("user_rol") != "admin":
@@ -611,26 +798,28 @@ def admin_usuarios():
         r = request.form.get("nuevo_rol", "").strip()
 
         try:
+            password_hash = generar_hash(p)
             # intentamos nombre_completo si existe
             try:
                 cur.execute(
                     "INSERT INTO empleados (username, password_hash, rol, nombre_completo) VALUES (?, ?, ?, ?)",
-                    (u, generate_password_hash(p), r, u.capitalize())
+                    (u, password_hash, r, u.capitalize())
                 )
             except:
                 cur.execute(
                     "INSERT INTO empleados (username, password_hash, rol) VALUES (?, ?, ?)",
-                    (u, generate_password_hash(p), r)
+                    (u, password_hash, r)
                 )
 
             conn.commit()
             flash("Usuario creado", "success")
         except sqlite3.IntegrityError:
             flash("Error: Usuario duplicado", "error")
+        except ColaHashLlena:
+            flash("Servidor ocupado, intenta de nuevo", "error")
 
     cur.execute("SELECT * FROM empleados")
     usuarios = cur.fetchall()
-    conn.close()
 
     return render_template("admin/usuarios_admin.html", usuarios=usuarios, cart_count=get_cart_count())
 
@@ -651,14 +840,147 @@ def admin_productos():
             p.precio,
             p.url_imagen,
             p.disponible,
-            COALESCE(SUM(i.stock), 0) AS stock
+            COALESCE(r.stock_total, 0) AS stock
         FROM productos p
-        LEFT JOIN inventario i ON i.producto_id = p.id
-        GROUP BY p.id
+        LEFT JOIN resumen_stock r ON r.producto_id = p.id
         ORDER BY p.id ASC
     """)
 
     productos = [dict(r) for r in cur.fetchall()]
-    conn.close()
 
     return render_template("admin/productos_admin.html", productos=productos)
+
+
+# =========================================================
+# INVENTARIO POR SUCURSAL (app/inventario.py)
+# Ver el stock por sucursal lo puede cualquier staff; ajustes y
+# traspasos solo ROLES_INVENTARIO. Con JSON responden JSON, con
+# formulario regresan a la tabla con un flash.
+# =========================================================
+
+ROLES_INVENTARIO = ("admin", "gerente", "empleado")
+
+
+@main.route("/admin/inventario")
+def admin_inventario():
+    if "user_id" not in session or session.get("tipo_usuario") != "staff":
+        return redirect(url_for("main.admin_login"))
+
+    sucursales, renglones = inventario().tabla(get_conn())
+    totales = {s: sum(r["por_sucursal"][s] for r in renglones) for s in sucursales}
+    return render_template(
+        "admin/inventario_sucursales.html",
+        sucursales=sucursales,
+        renglones=renglones,
+        totales=totales,
+        seleccionado=request.args.get("producto", type=int),
+        puede_mover=session.get("user_rol") in ROLES_INVENTARIO,
+    )
+
+
+@main.route("/admin/inventario/<int:producto_id>")
+def admin_inventario_producto(producto_id):
+    """Stock de un producto por sucursal (JSON)."""
+    if "user_id" not in session or session.get("tipo_usuario") != "staff":
+        abort(401)
+    conn = get_conn()
+    return jsonify({
+        "producto_id": producto_id,
+        "stock_total": stock_total(conn, producto_id),
+        "por_sucursal": inventario().por_sucursal(conn, producto_id),
+    })
+
+
+def _respuesta_inventario(producto_id, mensaje, categoria="success", status=200):
+    if request.is_json:
+        datos = {"ok": status == 200, "mensaje": mensaje}
+        if status == 200:
+            conn = get_conn()
+            datos.update(stock_total=stock_total(conn, producto_id),
+                         por_sucursal=inventario().por_sucursal(conn, producto_id))
+        return jsonify(datos), status
+    flash(mensaje, categoria)
+    return redirect(url_for("main.admin_inventario", producto=producto_id or None,
+                            _anchor=f"producto-{producto_id}" if producto_id else None))
+
+
+def _datos_inventario():
+    datos = (request.get_json(silent=True) or {}) if request.is_json else request.form
+    try:
+        producto_id = int(datos.get("producto_id"))
+    except (TypeError, ValueError):
+        raise MovimientoInvalido("Falta el producto")
+    return producto_id, datos
+
+
+@main.route("/admin/inventario/traspaso", methods=["POST"])
+def admin_inventario_traspaso():
+    if session.get("user_rol") not in ROLES_INVENTARIO:
+        abort(403)
+    producto_id = 0
+    try:
+        producto_id, datos = _datos_inventario()
+        origen, destino = inventario().transferir(
+            get_conn(), producto_id, datos.get("origen"), datos.get("destino"),
+            int(datos.get("cantidad") or 0), motivo=(datos.get("motivo") or "").strip() or None,
+        )
+    except MovimientoInvalido as e:
+        return _respuesta_inventario(producto_id, str(e), "error", 400)
+    except (TypeError, ValueError):
+        return _respuesta_inventario(producto_id, "Cantidad inválida", "error", 400)
+    except StockInsuficiente as e:
+        return _respuesta_inventario(producto_id, f"No alcanza en {datos.get('origen')}: hay {e.disponible}", "error", 409)
+    return _respuesta_inventario(
+        producto_id, f"Traspaso listo: {datos.get('origen')} queda con {origen}, {datos.get('destino')} con {destino}"
+    )
+
+
+@main.route("/admin/inventario/ajuste", methods=["POST"])
+def admin_inventario_ajuste():
+    """Conteo físico: deja la sucursal en `stock` piezas y registra la diferencia."""
+    if session.get("user_rol") not in ROLES_INVENTARIO:
+        abort(403)
+    producto_id = 0
+    try:
+        producto_id, datos = _datos_inventario()
+        quedan = inventario().fijar(
+            get_conn(), producto_id, datos.get("sucursal"), int(datos.get("stock")),
+            motivo=(datos.get("motivo") or "").strip() or "conteo físico",
+        )
+    except MovimientoInvalido as e:
+        return _respuesta_inventario(producto_id, str(e), "error", 400)
+    except (TypeError, ValueError):
+        return _respuesta_inventario(producto_id, "Stock inválido", "error", 400)
+    return _respuesta_inventario(producto_id, f"{datos.get('sucursal')} queda con {quedan} piezas")
+
+
+@main.route("/admin/db/estadisticas")
+def admin_db_estadisticas():
+    """Contadores de los pools SQLite y del cache del catálogo (JSON, solo staff)."""
+    if "user_id" not in session or session.get("tipo_usuario") != "staff":
+        return redirect(url_for("main.admin_login"))
+    return jsonify({**estadisticas_pools(), "catalogo": estadisticas_cache(), "auth": estadisticas_auth(),
+                    "consultas": estadisticas_perfilador(), "proxy_imagenes": estadisticas_proxy(),
+                    "fragmentos": estadisticas_fragmentos(), "agenda": estadisticas_agenda(),
+                    "inventario": estadisticas_inventario()})
+
+
+def _peticion_local():
+    """Directo desde esta máquina (Prometheus local); lo que llega por un proxy trae X-Forwarded-For."""
+    if request.headers.get("X-Forwarded-For") or request.headers.get("Forwarded"):
+        return False
+    return request.remote_addr in ("127.0.0.1", "::1")
+
+
+@main.route("/metrics")
+def metricas():
+    """Métricas de todos los workers en formato de texto de Prometheus."""
+    if "metricas" not in current_app.extensions:
+        abort(404)
+    token = current_app.config["METRICAS_TOKEN"]
+    if token:
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            abort(401)
+    elif not (current_app.debug or session.get("tipo_usuario") == "staff" or _peticion_local()):
+        abort(403)
+    return Response(exportar_metricas(), content_type="text/plain; version=0.0.4; charset=utf-8")
\ No newline at end of file
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+import click
+
+from .catalogo import invalidar_catalogo
+from .importacion import COLUMNAS, LECTORES, REQUERIDAS, RenglonInvalido, _abrir, formato_de, normalizar
+
+# =========================================================
+# SINCRONIZACIÓN INCREMENTAL DEL CATÁLOGO CONTRA UN FEED
+#   flask sincronizar-catalogo proveedor.jsonl [--simular]
+# - El feed es el catálogo COMPLETO del proveedor (JSONL/CSV/JSON).
+# - Cada renglón se resume en un hash de su contenido; productos guarda
+#   el hash de lo último que se sincronizó (hash_contenido, migración 7).
+#   Solo se escribe lo que cambió: altas, cambios y bajas lógicas
+#   (disponible = 0) de lo que ya no viene en el feed.
+# - El inventario no se toca, y catalogo_version solo sube si hubo
+#   algún cambio: un feed igual al de ayer no invalida ninguna cache.
+# =========================================================
+
+MUESTRA = 10  # ids de ejemplo por tipo de cambio en el resumen
+
+
+def hash_contenido(renglon):
+    datos = [(c, renglon[c]) for c in COLUMNAS if c != "id" and c in renglon]
+    texto = json.dumps(datos, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(texto.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ResumenSync:
+    def __init__(self):
+        self.nuevos = []
+        self.actualizados = []
+        self.bajas = []
+        self.total_nuevos = 0
+        self.total_actualizados = 0
+        self.total_bajas = 0
+        self.sin_cambio = 0
+        self.invalidos = 0
+        self.segundos = 0.0
+
+    @property
+    def hubo_cambios(self):
+        return bool(self.total_nuevos or self.total_actualizados or self.total_bajas)
+
+    def anotar(self, lista, total, claves):
+        faltan = MUESTRA - len(getattr(self, lista))
+        if faltan > 0:
+            getattr(self, lista).extend(claves[:faltan])
+        setattr(self, total, getattr(self, total) + len(claves))
+
+    def como_dict(self):
+        return {
+            "nuevos": self.total_nuevos,
+            "actualizados": self.total_actualizados,
+            "bajas": self.total_bajas,
+            "sin_cambio": self.sin_cambio,
+            "invalidos": self.invalidos,
+            "segundos": round(self.segundos, 3),
+            "ejemplos": {"nuevos": self.nuevos, "actualizados": self.actualizados, "bajas": self.bajas},
+        }
+
+
+def _en_grupos(valores, tam=900):
+    for i in range(0, len(valores), tam):
+        yield valores[i:i + tam]
+
+
+def _existentes(conn, lote):
+    """{("id", id) | ("codigo", codigo): (id, hash_contenido)} de los renglones del lote."""
+    encontrados = {}
+    ids = [r["id"] for r, _ in lote if "id" in r]
+    codigos = [r["codigo_barras"] for r, _ in lote if "id" not in r]
+    for grupo in _en_grupos(ids):
+        for pid, h in conn.execute(
+            f"SELECT id, hash_contenido FROM productos WHERE id IN ({','.join('?' * len(grupo))})", grupo
+        ):
+            encontrados[("id", pid)] = (pid, h)
+    for grupo in _en_grupos(codigos):
+        for pid, codigo, h in conn.execute(
+            f"SELECT id, codigo_barras, hash_contenido FROM productos "
+            f"WHERE codigo_barras IN ({','.join('?' * len(grupo))})", grupo
+        ):
+            encontrados[("codigo", codigo)] = (pid, h)
+    return encontrados
+
+
+def _clave(renglon):
+    return ("id", renglon["id"]) if "id" in renglon else ("codigo", renglon["codigo_barras"])
+
+
+def _insertar(conn, renglones):
+    grupos = {}
+    for r, h in renglones:
+        grupos.setdefault(tuple(r), []).append(tuple(r.values()) + (h,))
+    for columnas, valores in grupos.items():
+        conn.executemany(f"""
+            INSERT INTO productos ({", ".join(columnas)}, hash_contenido)
+            VALUES ({", ".join("?" * (len(columnas) + 1))})
+        """, valores)
+
+
+def _actualizar(conn, renglones):
+    grupos = {}
+    for r, h, pid in renglones:
+        columnas = tuple(c for c in r if c != "id")
+        grupos.setdefault(columnas, []).append(tuple(r[c] for c in columnas) + (h, pid))
+    for columnas, valores in grupos.items():
+        asignar = ", ".join(f"{c} = ?" for c in columnas)
+        conn.executemany(f"""
+            UPDATE productos
+            SET {asignar}, hash_contenido = ?, actualizado_en = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, valores)
+
+
+def _procesar_lote(conn, lote, resumen, simular):
+    # el último renglón con la misma clave gana
+    unicos = {}
+    for r, h in lote:
+        unicos[_clave(r)] = (r, h)
+    lote = list(unicos.values())
+
+    existentes = _existentes(conn, lote)
+    nuevos, cambios, vistos = [], [], []
+    for r, h in lote:
+        actual = existentes.get(_clave(r))
+        if actual is None:
+            nuevos.append((r, h))
+            continue
+        vistos.append((actual[0],))
+        if actual[1] == h:
+            resumen.sin_cambio += 1
+        else:
+            cambios.append((r, h, actual[0]))
+
+    if not simular and (nuevos or cambios):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _insertar(conn, nuevos)
+            _actualizar(conn, cambios)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        # ids de las altas sin id en el feed
+        codigos = [r["codigo_barras"] for r, _ in nuevos if "id" not in r]
+        for grupo in _en_grupos(codigos):
+            vistos.extend(conn.execute(
+                f"SELECT id FROM productos WHERE codigo_barras IN ({','.join('?' * len(grupo))})", grupo
+            ).fetchall())
+
+    vistos.extend((r["id"],) for r, _ in nuevos if "id" in r)
+    conn.executemany("INSERT OR IGNORE INTO temp.sync_vistos (id) VALUES (?)", vistos)
+
+    resumen.anotar("nuevos", "total_nuevos", [r.get("id", r.get("codigo_barras")) for r, _ in nuevos])
+    resumen.anotar("actualizados", "total_actualizados", [pid for _, _, pid in cambios])
+
+
+def _dar_de_baja(conn, resumen, simular):
+    faltantes = """
+        FROM productos
+        WHERE disponible = 1 AND id NOT IN (SELECT id FROM temp.sync_vistos)
+    """
+    ejemplos = [r[0] for r in conn.execute(f"SELECT id {faltantes} ORDER BY id LIMIT {MUESTRA}")]
+    if simular:
+        total = conn.execute(f"SELECT COUNT(*) {faltantes}").fetchone()[0]
+    else:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            total = conn.execute(f"""
+                UPDATE productos
+                SET disponible = 0, hash_contenido = NULL, actualizado_en = CURRENT_TIMESTAMP
+                WHERE disponible = 1 AND id NOT IN (SELECT id FROM temp.sync_vistos)
+            """).rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    resumen.bajas = ejemplos
+    resumen.total_bajas = total
+
+
+def sincronizar(db_path, renglones, lote=5000, bajas=True, simular=False, progreso=None):
+    """Aplica el feed `renglones` (iterable de dicts). Regresa un ResumenSync."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("CREATE TEMP TABLE sync_vistos (id INTEGER PRIMARY KEY)")
+
+    resumen = ResumenSync()
+    inicio = time.perf_counter()
+    try:
+        pendiente = []
+        for n, crudo in enumerate(renglones, 1):
+            try:
+                r = normalizar(crudo)
+                if not all(r.get(c) for c in REQUERIDAS):
+                    raise RenglonInvalido("faltan " + ", ".join(c for c in REQUERIDAS if not r.get(c)))
+            except RenglonInvalido as e:
+                resumen.invalidos += 1
+                if progreso:
+                    progreso(f"  renglón {n} ignorado: {e}")
+                continue
+            r.setdefault("disponible", 1)  # si vuelve a venir en el feed, se reactiva
+            pendiente.append((r, hash_contenido(r)))
+            if len(pendiente) >= lote:
+                _procesar_lote(conn, pendiente, resumen, simular)
+                pendiente = []
+        if pendiente:
+            _procesar_lote(conn, pendiente, resumen, simular)
+
+        if bajas:
+            _dar_de_baja(conn, resumen, simular)
+
+        if resumen.hubo_cambios and not simular:
+            invalidar_catalogo(conn)
+    finally:
+        conn.close()
+    resumen.segundos = time.perf_counter() - inicio
+    return resumen
+
+
+def init_app(app):
+    @app.cli.command("sincronizar-catalogo")
+    @click.argument("archivo", type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+    @click.option("--formato", type=click.Choice(sorted(LECTORES)), help="Por defecto, según la extensión.")
+    @click.option("--lote", default=5000, show_default=True, help="Renglones por transacción.")
+    @click.option("--sin-bajas", is_flag=True, help="No dar de baja lo que falte en el feed.")
+    @click.option("--simular", is_flag=True, help="Solo reportar qué cambiaría.")
+    @click.option("--json", "como_json", is_flag=True, help="Resumen en JSON.")
+    def sincronizar_catalogo(archivo, formato, lote, sin_bajas, simular, como_json):
+        """Aplica un feed completo: altas, cambios y bajas lógicas solo donde haga falta."""
+        formato = formato_de(archivo, formato) if archivo != "-" else (formato or "jsonl")
+        with _abrir(archivo, "r") as f:
+            try:
+                resumen = sincronizar(
+                    app.config["DATABASE"],
+                    LECTORES[formato](f),
+                    lote=max(1, lote),
+                    bajas=not sin_bajas,
+                    simular=simular,
+                    progreso=lambda m: click.echo(m, err=True),
+                )
+            except sqlite3.IntegrityError as e:
+                raise click.ClickException(f"Lote rechazado: {e}")
+
+        if como_json:
+            click.echo(json.dumps(resumen.como_dict(), ensure_ascii=False))
+            return
+
+        prefijo = "(simulación) " if simular else ""
+        click.echo(
+            f"✔ {prefijo}+{resumen.total_nuevos} nuevos, ~{resumen.total_actualizados} actualizados, "
+            f"-{resumen.total_bajas} bajas, {resumen.sin_cambio} sin cambio en {resumen.segundos:.2f}s"
+            + (f", {resumen.invalidos} ignorados" if resumen.invalidos else "")
+        )
+        for titulo, ids in (("nuevos", resumen.nuevos), ("actualizados", resumen.actualizados), ("bajas", resumen.bajas)):
+            if ids:
+                click.echo(f"  {titulo}: {', '.join(map(str, ids))}")
+        if not resumen.hubo_cambios:
+            click.echo("  sin cambios: catalogo_version no se tocó")
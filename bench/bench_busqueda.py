@@ -0,0 +1,101 @@
+"""Compara la búsqueda LIKE '%q%' contra FTS5 sobre un catálogo sintético.
+
+Uso:
+    python bench/bench_busqueda.py --filas 100000 --repeticiones 20
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import datos_sinteticos  # noqa: E402
+
+from app.busqueda import consulta_fts  # noqa: E402
+
+MARCAS = ["Apple", "Samsung", "Xiaomi", "Google", "Sony", "Bose", "Dell", "HP", "ASUS", "Lenovo", "JBL", "Anker"]
+TIPOS = ["Smartphone", "Laptop", "Tablet", "Wearable", "Audio", "Cámara", "Consola", "Drone", "Accesorio"]
+PALABRAS = [
+    "Audífonos", "Bluetooth", "Pro", "Max", "Ultra", "Cargador", "Rápido", "Teclado", "Mecánico",
+    "Cámara", "Inalámbrico", "Batería", "Pantalla", "Smartwatch", "Fit", "Galaxy", "Mini", "Lite",
+    "Edición", "Estéreo", "Portátil", "Gamer", "Híbrida", "Óptico", "Carga", "Magnético",
+]
+
+RELLENO = ["con", "para", "de", "alta", "calidad", "diseño", "nuevo", "modelo", "color", "negro", "blanco", "garantía"]
+
+CONSULTAS = ["audifonos", "Galaxy", "cam", "teclado mecanico", "pro max", "bluetooth inalambrico", "zzz"]
+
+
+def crear_catalogo(path, filas, semilla=42):
+    datos_sinteticos.crear_bd(path)
+
+    rnd = random.Random(semilla)
+    conn = sqlite3.connect(path)
+    datos = []
+    for i in range(filas):
+        nombre = " ".join(rnd.sample(PALABRAS, 3)) + f" {i}"
+        descripcion = " ".join(rnd.choices(RELLENO, k=8) + [rnd.choice(PALABRAS)])
+        datos.append((nombre, rnd.choice(MARCAS), rnd.choice(TIPOS), rnd.randint(199, 60000), descripcion))
+    conn.executemany(
+        "INSERT INTO productos (nombre, marca, tipo, precio, descripcion, disponible) VALUES (?, ?, ?, ?, ?, 1)",
+        datos,
+    )
+    conn.commit()
+    conn.close()
+
+
+def medir(conn, sql, params, repeticiones):
+    tiempos = []
+    filas = 0
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        filas = len(conn.execute(sql, params).fetchall())
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos), filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=100_000)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        inicio = time.perf_counter()
+        crear_catalogo(path, args.filas)
+        print(f"Catálogo sintético: {args.filas} filas en {time.perf_counter() - inicio:.1f}s\n")
+
+        conn = sqlite3.connect(path)
+        sql_like = """
+            SELECT id FROM productos
+            WHERE disponible = 1 AND (nombre LIKE ? OR marca LIKE ? OR tipo LIKE ?)
+            ORDER BY id ASC
+        """
+        sql_fts = """
+            SELECT p.id
+            FROM (SELECT rowid, rank FROM productos_fts WHERE productos_fts MATCH ?) f
+            JOIN productos p ON p.id = f.rowid
+            WHERE p.disponible = 1
+            ORDER BY f.rank
+        """
+
+        print(f"{'consulta':<24}{'LIKE ms':>10}{'filas':>9}{'FTS5 ms':>10}{'filas':>9}{'x':>8}")
+        for q in CONSULTAS:
+            like = f"%{q}%"
+            t_like, n_like = medir(conn, sql_like, (like, like, like), args.repeticiones)
+            t_fts, n_fts = medir(conn, sql_fts, (consulta_fts(q),), args.repeticiones)
+            factor = t_like / t_fts if t_fts else float("inf")
+            print(f"{q:<24}{t_like:>10.2f}{n_like:>9}{t_fts:>10.2f}{n_fts:>9}{factor:>8.1f}")
+        conn.close()
+
+        print("\nNota: LIKE no encuentra 'audifonos' en 'Audífonos'; FTS5 sí (remove_diacritics).")
+
+
+if __name__ == "__main__":
+    main()
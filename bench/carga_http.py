@@ -0,0 +1,398 @@
+"""Benchmark de carga por ruta: in-process (test client) y HTTP local.
+
+Reporta p50/p95/p99, throughput y RSS pico como JSON para comparar
+corridas entre commits.
+
+Uso:
+    python bench/carga_http.py --productos 50000 --usuarios 50 --duracion 20 --salida bench/tmp/r.json
+    python bench/carga_http.py --modo http --usuarios 200 --comparar bench/tmp/anterior.json
+    python bench/carga_http.py --modo http --url http://127.0.0.1:8000   # servidor ya levantado
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import datos_sinteticos  # noqa: E402
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# (nombre, peso) -- cada usuario virtual escoge la siguiente petición al azar
+ESCENARIOS = [
+    ("GET /", 5),
+    ("GET /productos", 30),
+    ("GET /productos?q", 15),
+    ("GET /productos/facetas", 5),
+    ("GET /productos/sugerencias", 10),
+    ("POST /carrito/agregar", 15),
+    ("GET /carrito", 5),
+    ("GET /admin/punto-venta", 3),
+    ("POST /admin/punto-venta/api/escanear", 12),
+    ("POST /admin/punto-venta/api/limpiar", 2),  # que la canasta no crezca sin límite
+]
+
+CATEGORIAS = ["telefonos", "laptops", "tablets", "wearables", "accesorios"]
+ORDENES = ["id", "precio_asc", "precio_desc"]
+BUSQUEDAS = ["pro", "max", "galaxy", "apple ultra", "bateria", "sony", "lite 12", "camara"]
+
+
+def config_bench(db_path):
+    return {
+        "DATABASE": db_path,
+        "STAFF_DATABASE": os.path.join(os.path.dirname(db_path), "empleados.db"),
+        "AUTH_HASH_METODO": datos_sinteticos.HASH_METODO,
+        "AUTH_INTENTOS_MAX": 10 ** 6,
+        "TESTING": True,
+    }
+
+
+# =========================================================
+# PETICIONES
+# =========================================================
+
+def armar_peticion(nombre, rnd, escala):
+    """(método, ruta, datos) para el escenario `nombre`."""
+    pid = rnd.randint(1, escala["productos"])
+    if nombre == "GET /":
+        return "GET", "/", None
+    if nombre == "GET /productos":
+        args = [("orden", rnd.choice(ORDENES))]
+        if rnd.random() < 0.6:
+            args.append(("categoria", rnd.choice(CATEGORIAS)))
+        if rnd.random() < 0.4:
+            args.append(("marca", rnd.choice(datos_sinteticos.MARCAS)))
+        if rnd.random() < 0.3:
+            args.append(("precio_max", rnd.choice((2000, 10000, 30000))))
+        return "GET", "/productos?" + urllib.parse.urlencode(args), None
+    if nombre == "GET /productos?q":
+        return "GET", "/productos?" + urllib.parse.urlencode({"q": rnd.choice(BUSQUEDAS)}), None
+    if nombre == "GET /productos/facetas":
+        return "GET", "/productos/facetas?" + urllib.parse.urlencode({"categoria": rnd.choice(CATEGORIAS)}), None
+    if nombre == "GET /productos/sugerencias":
+        return "GET", "/productos/sugerencias?" + urllib.parse.urlencode({"q": rnd.choice(BUSQUEDAS)[:3]}), None
+    if nombre == "POST /carrito/agregar":
+        return "POST", f"/carrito/agregar/{pid}", {}
+    if nombre == "GET /carrito":
+        return "GET", "/carrito", None
+    if nombre == "GET /admin/punto-venta":
+        return "GET", "/admin/punto-venta", None
+    if nombre == "POST /admin/punto-venta/api/escanear":
+        return "POST", "/admin/punto-venta/api/escanear", {"codigo": f"750{pid:010d}"}
+    if nombre == "POST /admin/punto-venta/api/limpiar":
+        return "POST", "/admin/punto-venta/api/limpiar", {}
+    raise ValueError(nombre)
+
+
+class ClienteProceso:
+    """Usuario virtual sobre el test client de Flask (sin red)."""
+
+    def __init__(self, app):
+        self.c = app.test_client()
+
+    def login(self, usuario):
+        self.c.post("/admin/login", data={"usuario": usuario, "contraseña": datos_sinteticos.BENCH_PASSWORD})
+
+    def pedir(self, metodo, ruta, datos):
+        if metodo == "GET":
+            r = self.c.get(ruta)
+        elif ruta.startswith("/admin/punto-venta/api/"):
+            r = self.c.post(ruta, json=datos)
+        else:
+            r = self.c.post(ruta, data=datos)
+        r.close()
+        return r.status_code
+
+
+class ClienteHTTP:
+    """Usuario virtual sobre HTTP real, con sus propias cookies."""
+
+    def __init__(self, base):
+        self.base = base.rstrip("/")
+        self.abridor = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            _SinRedirecciones(),
+        )
+
+    def login(self, usuario):
+        self.pedir("POST", "/admin/login", {"usuario": usuario, "contraseña": datos_sinteticos.BENCH_PASSWORD})
+
+    def pedir(self, metodo, ruta, datos):
+        cuerpo, headers = None, {}
+        if metodo == "POST":
+            if ruta.startswith("/admin/punto-venta/api/"):
+                cuerpo, headers = json.dumps(datos).encode(), {"Content-Type": "application/json"}
+            else:
+                cuerpo = urllib.parse.urlencode(datos or {}).encode()
+        req = urllib.request.Request(self.base + ruta, data=cuerpo, headers=headers, method=metodo)
+        try:
+            with self.abridor.open(req, timeout=30) as r:
+                r.read()
+                return r.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+class _SinRedirecciones(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+# =========================================================
+# CORRIDA
+# =========================================================
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    orden = sorted(valores)
+    k = max(0, min(len(orden) - 1, int(round(p / 100 * len(orden) + 0.5)) - 1))
+    return round(orden[k], 3)
+
+
+def correr(crear_cliente, escala, usuarios, duracion, semilla, calentamiento=2.0):
+    nombres = [n for n, _ in ESCENARIOS]
+    pesos = [p for _, p in ESCENARIOS]
+    muestras = {n: [] for n in nombres}
+    errores = {n: 0 for n in nombres}
+    causas = {n: {} for n in nombres}  # excepción o status -> veces
+    lock = threading.Lock()
+    listos = threading.Barrier(usuarios + 1)
+    estado = {"medir": False, "fin": False}
+
+    def usuario(i):
+        rnd = random.Random(semilla * 1000 + i)
+        cliente = crear_cliente()
+        cliente.login(f"bench_cajero{i % 10 + 1}")
+        listos.wait()
+        while not estado["fin"]:
+            nombre = rnd.choices(nombres, pesos)[0]
+            metodo, ruta, datos = armar_peticion(nombre, rnd, escala)
+            t = time.perf_counter()
+            causa = None
+            try:
+                status = cliente.pedir(metodo, ruta, datos)
+            except Exception as e:  # noqa: BLE001
+                status, causa = 0, type(e).__name__
+            ms = (time.perf_counter() - t) * 1000
+            if estado["medir"]:
+                with lock:
+                    muestras[nombre].append(ms)
+                    if status == 0 or status >= 500:
+                        errores[nombre] += 1
+                        causa = causa or str(status)
+                        causas[nombre][causa] = causas[nombre].get(causa, 0) + 1
+
+    hilos = [threading.Thread(target=usuario, args=(i,), daemon=True) for i in range(usuarios)]
+    for h in hilos:
+        h.start()
+    listos.wait()
+    time.sleep(calentamiento)
+    estado["medir"] = True
+    inicio = time.perf_counter()
+    time.sleep(duracion)
+    estado["fin"] = True
+    transcurrido = time.perf_counter() - inicio
+    estado["medir"] = False
+    for h in hilos:
+        h.join(timeout=30)
+
+    rutas = {}
+    for n in nombres:
+        v = muestras[n]
+        rutas[n] = {
+            "n": len(v),
+            "errores": errores[n],
+            "causas": causas[n],
+            "p50_ms": percentil(v, 50),
+            "p95_ms": percentil(v, 95),
+            "p99_ms": percentil(v, 99),
+            "rps": round(len(v) / transcurrido, 1),
+        }
+    todas = [x for v in muestras.values() for x in v]
+    return {
+        "usuarios": usuarios,
+        "duracion_s": round(transcurrido, 2),
+        "total": {
+            "n": len(todas),
+            "errores": sum(errores.values()),
+            "p50_ms": percentil(todas, 50),
+            "p95_ms": percentil(todas, 95),
+            "p99_ms": percentil(todas, 99),
+            "rps": round(len(todas) / transcurrido, 1),
+        },
+        "rutas": rutas,
+    }
+
+
+def _rss_pico_mb(pid=None):
+    if pid is None:
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # KB en Linux
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linea in f:
+                if linea.startswith("VmHWM:"):
+                    return round(int(linea.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def modo_proceso(db_path, escala, args):
+    from app import create_app
+
+    app = create_app(config_bench(db_path))
+    resultado = correr(lambda: ClienteProceso(app), escala, args.usuarios, args.duracion, args.semilla)
+    resultado["rss_pico_mb"] = _rss_pico_mb()
+    return resultado
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def modo_http(db_path, escala, args):
+    servidor = None
+    base = args.url
+    if not base:
+        puerto = _puerto_libre()
+        servidor = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--servir", db_path, "--puerto", str(puerto)],
+            cwd=RAIZ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        base = f"http://127.0.0.1:{puerto}"
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(base + "/", timeout=1).read()
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            servidor.kill()
+            raise SystemExit("El servidor de pruebas no levantó")
+    try:
+        resultado = correr(lambda: ClienteHTTP(base), escala, args.usuarios, args.duracion, args.semilla)
+        resultado["url"] = base
+        resultado["rss_pico_mb"] = _rss_pico_mb(servidor.pid) if servidor else None
+    finally:
+        if servidor:
+            servidor.terminate()
+            servidor.wait(timeout=10)
+    return resultado
+
+
+def servir(db_path, puerto):
+    """Servidor WSGI con hilos (werkzeug) sobre la BD de pruebas."""
+    from werkzeug.serving import make_server
+
+    from app import create_app
+
+    app = create_app(config_bench(db_path))
+    make_server("127.0.0.1", puerto, app, threaded=True).serve_forever()
+
+
+def comparar(anterior, actual):
+    for modo, r in actual["modos"].items():
+        previo = anterior.get("modos", {}).get(modo)
+        if not previo:
+            continue
+        print(f"\n{modo}: {anterior.get('commit')} -> {actual.get('commit')}")
+        print(f"  {'ruta':40} {'p95 antes':>10} {'p95 ahora':>10} {'rps antes':>10} {'rps ahora':>10}")
+        for ruta, datos in list(r["rutas"].items()) + [("TOTAL", r["total"])]:
+            a = previo["rutas"].get(ruta, {}) if ruta != "TOTAL" else previo["total"]
+            print(f"  {ruta:40} {a.get('p95_ms') or '-':>10} {datos['p95_ms'] or '-':>10} "
+                  f"{a.get('rps', '-'):>10} {datos['rps']:>10}")
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modo", choices=("proceso", "http", "ambos"), default="ambos")
+    parser.add_argument("--db", default=os.path.join(RAIZ, "bench", "tmp", "gadget.db"))
+    parser.add_argument("--regenerar", action="store_true", help="Volver a generar la BD aunque exista.")
+    parser.add_argument("--productos", type=int, default=50000)
+    parser.add_argument("--sucursales", type=int, default=3)
+    parser.add_argument("--ventas", type=int, default=50000)
+    parser.add_argument("--citas", type=int, default=5000)
+    parser.add_argument("--usuarios", type=int, default=50, help="Usuarios virtuales concurrentes.")
+    parser.add_argument("--duracion", type=float, default=20.0, help="Segundos medidos por modo.")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--url", help="Servidor ya levantado (solo modo http).")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto stdout).")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior.")
+    parser.add_argument("--servir", metavar="DB", help=argparse.SUPPRESS)
+    parser.add_argument("--puerto", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.servir:
+        servir(args.servir, args.puerto)
+        return
+
+    escala_path = args.db + ".escala.json"
+    if args.regenerar or not os.path.exists(args.db) or not os.path.exists(escala_path):
+        print(f"Generando datos sintéticos en {args.db} ...", file=sys.stderr)
+        escala = datos_sinteticos.generar(
+            args.db, args.productos, args.sucursales, clientes=max(100, args.productos // 10),
+            ventas=args.ventas, citas=args.citas, semilla=args.semilla,
+            log=lambda m: print(m, file=sys.stderr),
+        )
+        with open(escala_path, "w") as f:
+            json.dump(escala, f)
+    else:
+        with open(escala_path) as f:
+            escala = json.load(f)
+
+    resultado = {
+        "commit": _commit(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "escala": escala,
+        "modos": {},
+    }
+    if args.modo in ("proceso", "ambos"):
+        print(f"Modo proceso: {args.usuarios} usuarios, {args.duracion}s ...", file=sys.stderr)
+        resultado["modos"]["proceso"] = modo_proceso(args.db, escala, args)
+    if args.modo in ("http", "ambos"):
+        print(f"Modo http: {args.usuarios} usuarios, {args.duracion}s ...", file=sys.stderr)
+        resultado["modos"]["http"] = modo_http(args.db, escala, args)
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+        print(f"✔ Resultados en {args.salida}", file=sys.stderr)
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(json.load(f), resultado)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Muchos hilos intentan comprar la última pieza al mismo tiempo.
+
+Verifica que registrar_venta nunca sobrevende: exactamente una venta
+gana, el stock queda en 0 y no hay ventas/detalles huérfanos.
+
+Uso:
+    python bench/concurrencia_checkout.py --hilos 32 --rondas 5
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import datos_sinteticos  # noqa: E402
+
+from app.checkout import StockInsuficiente, registrar_venta  # noqa: E402
+
+
+def preparar(path, stock_por_sucursal):
+    datos_sinteticos.crear_bd(path)
+
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "INSERT INTO productos (id, nombre, marca, tipo, precio, disponible) "
+        "VALUES (1, 'Última pieza', 'Test', 'Smartphone', 999, 1)"
+    )
+    conn.executemany(
+        "INSERT INTO inventario (producto_id, sucursal, stock) VALUES (1, ?, ?)",
+        [(suc, n) for suc, n in stock_por_sucursal],
+    )
+    conn.commit()
+    conn.close()
+
+
+def ronda(hilos, stock_por_sucursal, piezas_por_compra=1):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "checkout.db")
+        preparar(path, stock_por_sucursal)
+
+        barrera = threading.Barrier(hilos)
+        ganadores, rechazados, errores = [], [], []
+        lock = threading.Lock()
+
+        def comprar():
+            conn = sqlite3.connect(path, timeout=10)
+            conn.execute("PRAGMA busy_timeout = 10000")
+            try:
+                barrera.wait()
+                venta_id = registrar_venta(conn, [(1, piezas_por_compra)], reintentos=8)
+                with lock:
+                    ganadores.append(venta_id)
+            except StockInsuficiente:
+                with lock:
+                    rechazados.append(1)
+            except Exception as e:  # noqa: BLE001
+                with lock:
+                    errores.append(repr(e))
+            finally:
+                conn.close()
+
+        ts = [threading.Thread(target=comprar) for _ in range(hilos)]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+
+        conn = sqlite3.connect(path)
+        stock = conn.execute("SELECT SUM(stock) FROM inventario WHERE producto_id = 1").fetchone()[0]
+        minimo = conn.execute("SELECT MIN(stock) FROM inventario").fetchone()[0]
+        ventas = conn.execute("SELECT COUNT(*) FROM ventas").fetchone()[0]
+        detalles = conn.execute("SELECT COALESCE(SUM(cantidad), 0) FROM detalle_venta").fetchone()[0]
+        movimientos = conn.execute("SELECT COALESCE(-SUM(cambio), 0) FROM registro_inventario").fetchone()[0]
+        conn.close()
+        return {
+            "ganadores": len(ganadores),
+            "rechazados": len(rechazados),
+            "errores": errores,
+            "stock_final": stock,
+            "stock_minimo": minimo,
+            "ventas": ventas,
+            "piezas_vendidas": detalles,
+            "piezas_descontadas": movimientos,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hilos", type=int, default=32)
+    parser.add_argument("--rondas", type=int, default=5)
+    args = parser.parse_args()
+
+    escenarios = [
+        ("última pieza en una sucursal", [("Centro", 1), ("Polanco", 0)], 1),
+        ("3 piezas repartidas, compras de 2", [("Centro", 1), ("Polanco", 1), ("Satélite", 1)], 2),
+    ]
+
+    fallas = 0
+    for nombre, stock, piezas in escenarios:
+        total = sum(n for _, n in stock)
+        esperados = total // piezas
+        for i in range(args.rondas):
+            r = ronda(args.hilos, stock, piezas)
+            ok = (
+                not r["errores"]
+                and r["ganadores"] == esperados
+                and r["ventas"] == esperados
+                and r["stock_minimo"] >= 0
+                and r["stock_final"] == total - esperados * piezas
+                and r["piezas_vendidas"] == r["piezas_descontadas"] == esperados * piezas
+            )
+            fallas += 0 if ok else 1
+            print(f"{'OK   ' if ok else 'FALLA'} {nombre} (ronda {i + 1}): {r}")
+
+    if fallas:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Muchos visitantes intentan apartar el mismo horario al mismo tiempo.
+
+Verifica que Agenda.reservar nunca empalma citas: con E empleados en
+turno ganan exactamente E reservas y ningún empleado queda con dos citas
+encimadas. Después mide la disponibilidad de un día con pocas y con
+muchas citas en la tabla (debe costar casi lo mismo: rango sobre índice
++ bisect, no un recorrido de citas).
+
+Uso:
+    python bench/concurrencia_citas.py --hilos 32 --empleados 3 --rondas 5
+    python bench/concurrencia_citas.py --citas 200000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import datos_sinteticos  # noqa: E402
+
+from app.agenda import Agenda, CitaNoDisponible, _a_bd  # noqa: E402
+
+HORARIO = {dia: ("10:00", "20:00") for dia in range(7)}
+
+
+def preparar(path, empleados):
+    datos_sinteticos.crear_bd(path)
+
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO horarios_empleado (empleado_id, sucursal, dia_semana, inicio, fin) VALUES (?, 'Centro', ?, ?, ?)",
+        [(e, dia, a, b) for e in range(1, empleados + 1) for dia, (a, b) in HORARIO.items()],
+    )
+    conn.commit()
+    conn.close()
+
+
+def nueva_agenda():
+    return Agenda(("Centro",), horario_tienda=HORARIO, dias_max=400)
+
+
+def ronda(hilos, empleados):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "citas.db")
+        preparar(path, empleados)
+        agenda = nueva_agenda()
+        fecha = agenda.ahora().date() + timedelta(days=1)
+
+        barrera = threading.Barrier(hilos)
+        ganadores, rechazados, errores = [], [], []
+        lock = threading.Lock()
+
+        def apartar(i):
+            conn = sqlite3.connect(path, timeout=10)
+            conn.execute("PRAGMA busy_timeout = 10000")
+            try:
+                barrera.wait()
+                cita_id = agenda.reservar(conn, "Centro", fecha, "10:00", {"nombre": f"visitante {i}"}, reintentos=8)
+                with lock:
+                    ganadores.append(cita_id)
+            except CitaNoDisponible:
+                with lock:
+                    rechazados.append(i)
+            except Exception as e:  # noqa: BLE001
+                with lock:
+                    errores.append(repr(e))
+            finally:
+                conn.close()
+
+        ts = [threading.Thread(target=apartar, args=(i,)) for i in range(hilos)]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+
+        conn = sqlite3.connect(path)
+        citas = conn.execute("SELECT COUNT(*) FROM citas").fetchone()[0]
+        encimadas = conn.execute("""
+            SELECT COUNT(*) FROM citas a JOIN citas b
+              ON a.empleado_id = b.empleado_id AND a.id < b.id
+             AND a.fecha_hora < b.fin AND b.fecha_hora < a.fin
+        """).fetchone()[0]
+        libres = nueva_agenda().disponibilidad(conn, "Centro", fecha)
+        conn.close()
+        return {
+            "ganadores": len(ganadores),
+            "rechazados": len(rechazados),
+            "errores": errores,
+            "citas": citas,
+            "encimadas": encimadas,
+            "libres_10h": next((h["libres"] for h in libres if h["hora"] == "10:00"), 0),
+        }
+
+
+def medir_disponibilidad(total_citas, empleados, repeticiones=200, por_dia=50):
+    """ms promedio del cálculo de un día (sin cache); siempre ~`por_dia` citas por día, solo crece la tabla."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "citas.db")
+        preparar(path, empleados)
+        agenda = nueva_agenda()
+        hoy = agenda.ahora().date()
+        conn = sqlite3.connect(path)
+        dias = max(1, total_citas // por_dia)
+        filas = []
+        for _ in range(total_citas):
+            inicio = agenda._inicio(hoy + timedelta(days=random.randrange(dias)), random.randrange(10, 20) * 60)
+            filas.append((random.randint(1, empleados), _a_bd(inicio), _a_bd(inicio + timedelta(hours=1))))
+        conn.executemany(
+            "INSERT INTO citas (usuario_id, empleado_id, fecha_hora, fin, sucursal) VALUES (0, ?, ?, ?, 'Centro')", filas
+        )
+        conn.commit()
+        conn.execute("ANALYZE")
+
+        fechas = [hoy + timedelta(days=random.randrange(dias)) for _ in range(repeticiones)]
+        inicio = time.perf_counter()
+        for fecha in fechas:
+            agenda._calcular_dia(conn, "Centro", fecha, agenda.version(conn))
+        ms = (time.perf_counter() - inicio) / repeticiones * 1000
+        conn.close()
+        return ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hilos", type=int, default=32)
+    parser.add_argument("--empleados", type=int, default=3)
+    parser.add_argument("--rondas", type=int, default=5)
+    parser.add_argument("--citas", type=int, default=100_000, help="Citas para la medición de disponibilidad.")
+    args = parser.parse_args()
+
+    fallas = 0
+    for i in range(args.rondas):
+        r = ronda(args.hilos, args.empleados)
+        ok = (
+            not r["errores"]
+            and r["ganadores"] == r["citas"] == args.empleados
+            and r["rechazados"] == args.hilos - args.empleados
+            and r["encimadas"] == 0
+            and r["libres_10h"] == 0
+        )
+        fallas += 0 if ok else 1
+        print(f"{'OK   ' if ok else 'FALLA'} mismo horario, {args.empleados} empleados (ronda {i + 1}): {r}")
+
+    for total in (1_000, args.citas):
+        ms = medir_disponibilidad(total, max(args.empleados, 10))
+        print(f"disponibilidad de un día con {total:>9,} citas en la tabla: {ms:.3f} ms")
+
+    if fallas:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
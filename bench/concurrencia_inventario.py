@@ -0,0 +1,178 @@
+"""Traspasos entre sucursales y ventas al mismo tiempo sobre el mismo producto.
+
+Verifica que el total materializado (resumen_stock) siempre cuadra con
+SUM(inventario.stock), que ninguna sucursal queda negativa y que
+registro_inventario explica cada pieza que se movió. Después compara las
+lecturas de los caminos calientes antes (SUM / GROUP BY sobre inventario)
+y después (resumen_stock por llave primaria).
+
+Uso:
+    python bench/concurrencia_inventario.py --hilos 16 --operaciones 200 --rondas 3
+    python bench/concurrencia_inventario.py --productos 50000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import datos_sinteticos  # noqa: E402
+
+from app.checkout import StockInsuficiente, registrar_venta  # noqa: E402
+from app.inventario import Inventario, MovimientoInvalido, stock_total  # noqa: E402
+
+SUCURSALES = ("Centro", "Polanco", "Satélite")
+
+
+def preparar(path, productos, stock):
+    datos_sinteticos.crear_bd(path)
+
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO productos (id, nombre, marca, tipo, precio, disponible) VALUES (?, ?, 'Test', 'Gadget', 100, 1)",
+        [(i, f"Producto {i}") for i in range(1, productos + 1)],
+    )
+    conn.executemany(
+        "INSERT INTO inventario (producto_id, sucursal, stock) VALUES (?, ?, ?)",
+        [(i, s, stock) for i in range(1, productos + 1) for s in SUCURSALES],
+    )
+    conn.commit()
+    conn.close()
+
+
+def cuadra(conn):
+    """(productos con total distinto a la suma, filas negativas)."""
+    distintos = conn.execute("""
+        SELECT COUNT(*) FROM productos p
+        LEFT JOIN resumen_stock r ON r.producto_id = p.id
+        WHERE r.producto_id IS NULL
+           OR r.stock_total != (SELECT COALESCE(SUM(stock), 0) FROM inventario i WHERE i.producto_id = p.id)
+    """).fetchone()[0]
+    negativos = conn.execute("SELECT COUNT(*) FROM inventario WHERE stock < 0").fetchone()[0]
+    return distintos, negativos
+
+
+def ronda(hilos, operaciones, stock):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "inventario.db")
+        preparar(path, 1, stock)
+        inv = Inventario(SUCURSALES)
+        inicial = stock * len(SUCURSALES)
+
+        barrera = threading.Barrier(hilos)
+        conteo = {"traspasos": 0, "ventas": 0, "rechazos": 0}
+        errores = []
+        lock = threading.Lock()
+
+        def trabajar(semilla):
+            azar = random.Random(semilla)
+            conn = sqlite3.connect(path, timeout=10)
+            conn.execute("PRAGMA busy_timeout = 10000")
+            try:
+                barrera.wait()
+                for _ in range(operaciones):
+                    try:
+                        if azar.random() < 0.8:
+                            origen, destino = azar.sample(SUCURSALES, 2)
+                            inv.transferir(conn, 1, origen, destino, azar.randint(1, 3), reintentos=8)
+                            clave = "traspasos"
+                        else:
+                            registrar_venta(conn, [(1, 1)], reintentos=8)
+                            clave = "ventas"
+                    except StockInsuficiente:
+                        clave = "rechazos"
+                    with lock:
+                        conteo[clave] += 1
+            except (MovimientoInvalido, sqlite3.Error) as e:
+                with lock:
+                    errores.append(repr(e))
+            finally:
+                conn.close()
+
+        ts = [threading.Thread(target=trabajar, args=(i,)) for i in range(hilos)]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+
+        conn = sqlite3.connect(path)
+        distintos, negativos = cuadra(conn)
+        total = stock_total(conn, 1)
+        vendidas = conn.execute("SELECT COALESCE(SUM(cantidad), 0) FROM detalle_venta").fetchone()[0]
+        movido = conn.execute("SELECT COALESCE(SUM(cambio), 0) FROM registro_inventario").fetchone()[0]
+        conn.close()
+        return {
+            **conteo,
+            "errores": errores,
+            "distintos": distintos,
+            "negativos": negativos,
+            "total_ok": total == inicial - vendidas,
+            "registro_ok": movido == total - inicial,
+        }
+
+
+def _ms(fn, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        fn()
+    return (time.perf_counter() - inicio) / repeticiones * 1000
+
+
+def medir_lecturas(productos, repeticiones=2000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "inventario.db")
+        preparar(path, productos, 5)
+        conn = sqlite3.connect(path)
+        conn.execute("ANALYZE")
+        ids = [random.randint(1, productos) for _ in range(repeticiones)]
+        it = iter(ids * 2)
+
+        antes = _ms(lambda: conn.execute(
+            "SELECT COALESCE(SUM(stock), 0) FROM inventario WHERE producto_id = ?", (next(it),)
+        ).fetchone(), repeticiones)
+        despues = _ms(lambda: stock_total(conn, next(it)), repeticiones)
+        print(f"get_stock_total  SUM(inventario): {antes * 1000:7.1f} µs   resumen_stock: {despues * 1000:7.1f} µs")
+
+        antes = _ms(lambda: conn.execute("""
+            SELECT p.id, COALESCE(SUM(i.stock), 0) FROM productos p
+            LEFT JOIN inventario i ON i.producto_id = p.id
+            GROUP BY p.id ORDER BY p.id
+        """).fetchall(), 10)
+        despues = _ms(lambda: conn.execute("""
+            SELECT p.id, COALESCE(r.stock_total, 0) FROM productos p
+            LEFT JOIN resumen_stock r ON r.producto_id = p.id
+            ORDER BY p.id
+        """).fetchall(), 10)
+        print(f"admin_productos  GROUP BY: {antes:7.1f} ms   resumen_stock: {despues:7.1f} ms   ({productos:,} productos)")
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--operaciones", type=int, default=200, help="Operaciones por hilo.")
+    parser.add_argument("--stock", type=int, default=100, help="Piezas iniciales por sucursal.")
+    parser.add_argument("--rondas", type=int, default=3)
+    parser.add_argument("--productos", type=int, default=20_000, help="Productos para medir las lecturas.")
+    args = parser.parse_args()
+
+    fallas = 0
+    for i in range(args.rondas):
+        r = ronda(args.hilos, args.operaciones, args.stock)
+        ok = not r["errores"] and not r["distintos"] and not r["negativos"] and r["total_ok"] and r["registro_ok"]
+        fallas += 0 if ok else 1
+        print(f"{'OK   ' if ok else 'FALLA'} traspasos + ventas concurrentes (ronda {i + 1}): {r}")
+
+    medir_lecturas(args.productos)
+
+    if fallas:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
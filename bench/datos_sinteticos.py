@@ -0,0 +1,218 @@
+"""Genera una gadget.db (y empleados.db) de pruebas con datos sintéticos.
+
+Misma semilla = mismos datos, para comparar corridas entre commits.
+
+Uso:
+    python bench/datos_sinteticos.py --productos 50000 --salida /tmp/bench/gadget.db
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.migraciones import aplicar_migraciones  # noqa: E402
+
+INIT_SQL = os.path.join(os.path.dirname(__file__), "..", "database", "init_db.sql")
+
+MARCAS = ["Apple", "Samsung", "Xiaomi", "Google", "Sony", "Bose", "Dell", "HP", "ASUS", "Lenovo", "JBL", "Anker",
+          "Motorola", "Huawei", "DJI", "Garmin", "Nintendo", "Microsoft", "Logitech", "Razer"]
+TIPOS = ["Smartphone", "Laptop", "Tablet", "Wearable", "Audio", "Cámara", "Consola", "Drone", "Accesorio"]
+PALABRAS = ["Pro", "Max", "Ultra", "Mini", "Lite", "Plus", "Air", "Edge", "Fit", "Gamer", "Neo", "One", "X", "S"]
+DESCRIPCION = ["con", "para", "de", "alta", "calidad", "diseño", "nuevo", "modelo", "batería", "pantalla",
+               "inalámbrico", "carga", "rápida", "garantía", "bluetooth", "cámara"]
+SUCURSALES = ["Centro", "Polanco", "Satélite", "Coyoacán", "Santa Fe", "Interlomas", "Lindavista", "Roma"]
+ESTADOS_CITA = ["pendiente", "pendiente", "confirmada", "completada", "cancelada"]
+
+# Usuarios del staff para los escenarios de caja (password: BENCH_PASSWORD)
+BENCH_PASSWORD = "bench"
+HASH_METODO = "pbkdf2:sha256:1000"  # barato a propósito: el bench mide la caja, no el login
+
+LOTE = 10000
+
+
+def _lotes(filas, tam=LOTE):
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= tam:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _crear_staff(path):
+    conn = sqlite3.connect(path)
+    conn.execute("DROP TABLE IF EXISTS empleados")
+    conn.execute("""
+        CREATE TABLE empleados (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            nombre_completo TEXT,
+            rol TEXT NOT NULL,
+            creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    h = generate_password_hash(BENCH_PASSWORD, HASH_METODO)
+    conn.executemany(
+        "INSERT INTO empleados (username, password_hash, nombre_completo, rol) VALUES (?, ?, ?, ?)",
+        [("bench_admin", h, "Admin Bench", "admin")]
+        + [(f"bench_cajero{i}", h, f"Cajero Bench {i}", "empleado") for i in range(1, 11)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def crear_bd(path):
+    """BD vacía: esquema de database/init_db.sql, WAL y todas las migraciones."""
+    conn = sqlite3.connect(path)
+    with open(INIT_SQL, encoding="utf-8") as f:
+        conn.executescript(f.read())
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+    aplicar_migraciones(path, log=lambda *_: None)
+
+
+def generar(path, productos=5000, sucursales=3, clientes=1000, ventas=20000, citas=2000,
+            semilla=42, staff_path=None, log=print):
+    """Crea `path` desde cero. Regresa un dict con la escala generada."""
+    rnd = random.Random(semilla)
+    inicio = time.perf_counter()
+    for sufijo in ("", "-wal", "-shm"):
+        if os.path.exists(path + sufijo):
+            os.remove(path + sufijo)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    crear_bd(path)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous = OFF")
+    sucursales = SUCURSALES[:max(1, min(sucursales, len(SUCURSALES)))]
+
+    # ---------- productos ----------
+    precios = {}
+
+    def filas_productos():
+        for pid in range(1, productos + 1):
+            marca = rnd.choice(MARCAS)
+            tipo = rnd.choice(TIPOS)
+            nombre = f"{marca} {rnd.choice(PALABRAS)} {rnd.choice(PALABRAS)} {pid}"
+            precio = round(rnd.uniform(199, 59999), 0)
+            precios[pid] = precio
+            yield (
+                pid, nombre, marca, tipo, precio,
+                " ".join(rnd.choice(DESCRIPCION) for _ in range(12)),
+                f"750{pid:010d}",
+                1 if rnd.random() < 0.95 else 0,
+            )
+
+    for lote in _lotes(filas_productos()):
+        conn.executemany("""
+            INSERT INTO productos (id, nombre, marca, tipo, precio, descripcion, codigo_barras, disponible)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, lote)
+    log(f"  productos: {productos:,}")
+
+    # ---------- inventario ----------
+    filas = ((pid, suc, rnd.choice((0, 1, 2, 3, 5, 8, 13, 20, 40, 80)))
+             for pid in range(1, productos + 1) for suc in sucursales)
+    for lote in _lotes(filas):
+        conn.executemany("INSERT INTO inventario (producto_id, sucursal, stock) VALUES (?, ?, ?)", lote)
+    log(f"  inventario: {productos * len(sucursales):,} ({len(sucursales)} sucursales)")
+
+    # ---------- clientes ----------
+    conn.executemany(
+        "INSERT INTO usuarios (id, nombre_usuario, correo, contraseña, rol) VALUES (?, ?, ?, 'x', 'cliente')",
+        [(i, f"Cliente {i}", f"cliente{i}@bench.local") for i in range(1, clientes + 1)],
+    )
+    log(f"  clientes: {clientes:,}")
+
+    # ---------- ventas (últimos 90 días; los triggers llenan resumen_*) ----------
+    ahora = datetime.utcnow().replace(microsecond=0)
+    detalle_id = 0
+
+    def filas_ventas():
+        for vid in range(1, ventas + 1):
+            fecha = ahora - timedelta(seconds=rnd.randint(0, 90 * 24 * 3600))
+            lineas = [(rnd.randint(1, productos), rnd.randint(1, 3)) for _ in range(rnd.randint(1, 4))]
+            yield vid, fecha, lineas
+
+    for lote in _lotes(filas_ventas(), 2000):
+        cabeceras, detalles = [], []
+        for vid, fecha, lineas in lote:
+            total = sum(precios[p] * c for p, c in lineas)
+            empleado = rnd.choice((None, None, rnd.randint(2, 11)))
+            cabeceras.append((vid, rnd.randint(0, clientes), empleado, total,
+                              "mostrador" if empleado else "en_linea", fecha.strftime("%Y-%m-%d %H:%M:%S")))
+            for p, c in lineas:
+                detalle_id += 1
+                detalles.append((detalle_id, vid, p, c, precios[p]))
+        conn.executemany("""
+            INSERT INTO ventas (id, usuario_id, empleado_id, total, metodo_pago, creado_en)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, cabeceras)
+        conn.executemany("""
+            INSERT INTO detalle_venta (id, venta_id, producto_id, cantidad, precio)
+            VALUES (?, ?, ?, ?, ?)
+        """, detalles)
+    log(f"  ventas: {ventas:,} ({detalle_id:,} renglones)")
+
+    # ---------- citas (de hace 30 días a 30 días adelante) ----------
+    cita_productos = []
+    filas_citas = []
+    for cid in range(1, citas + 1):
+        fecha = ahora + timedelta(minutes=30 * rnd.randint(-30 * 24, 30 * 24))
+        filas_citas.append((cid, rnd.randint(1, clientes), rnd.choice((None, rnd.randint(2, 11))),
+                            fecha.strftime("%Y-%m-%d %H:%M:%S"), rnd.choice(ESTADOS_CITA)))
+        for _ in range(rnd.randint(1, 2)):
+            cita_productos.append((cid, rnd.randint(1, productos)))
+    conn.executemany("""
+        INSERT INTO citas (id, usuario_id, empleado_id, fecha_hora, estado) VALUES (?, ?, ?, ?, ?)
+    """, filas_citas)
+    conn.executemany("INSERT INTO cita_productos (cita_id, producto_id) VALUES (?, ?)", cita_productos)
+    log(f"  citas: {citas:,}")
+
+    conn.commit()
+    conn.execute("PRAGMA optimize")
+    conn.close()
+
+    staff_path = staff_path or os.path.join(os.path.dirname(os.path.abspath(path)), "empleados.db")
+    _crear_staff(staff_path)
+
+    escala = {
+        "productos": productos,
+        "sucursales": len(sucursales),
+        "clientes": clientes,
+        "ventas": ventas,
+        "citas": citas,
+        "semilla": semilla,
+    }
+    log(f"✔ {path} en {time.perf_counter() - inicio:.1f}s")
+    return escala
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--salida", default=os.path.join("bench", "tmp", "gadget.db"))
+    parser.add_argument("--staff", default=None, help="Por defecto, empleados.db junto a --salida.")
+    parser.add_argument("--productos", type=int, default=50000)
+    parser.add_argument("--sucursales", type=int, default=3)
+    parser.add_argument("--clientes", type=int, default=5000)
+    parser.add_argument("--ventas", type=int, default=50000)
+    parser.add_argument("--citas", type=int, default=5000)
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    generar(args.salida, args.productos, args.sucursales, args.clientes, args.ventas, args.citas,
+            args.semilla, args.staff)
+
+
+if __name__ == "__main__":
+    main()
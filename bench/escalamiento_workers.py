@@ -0,0 +1,161 @@
+"""Throughput y p95 contra número de workers de gunicorn (gunicorn.conf.py).
+
+Levanta el servidor de producción sobre la BD sintética con 1, 2, 4, ...
+workers y corre la misma mezcla de carga_http.py contra cada uno. La
+línea base es el servidor con hilos de werkzeug (un proceso), que es lo
+que había antes de `python run.py` con gunicorn.
+
+Uso:
+    python bench/escalamiento_workers.py --productos 20000 --usuarios 32 --duracion 15
+    python bench/escalamiento_workers.py --workers 1,2,4,8 --salida bench/tmp/escalamiento.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import carga_http  # noqa: E402
+import datos_sinteticos  # noqa: E402
+
+from app import arranque  # noqa: E402
+
+RAIZ = carga_http.RAIZ
+BENCH = os.path.dirname(os.path.abspath(__file__))
+
+
+def crear_app():
+    """Fábrica que gunicorn carga como "escalamiento_workers:crear_app()"."""
+    from app import create_app
+
+    return create_app(carga_http.config_bench(os.environ["BENCH_DB"]))
+
+
+def _esperar_servidor(base, proceso):
+    for _ in range(300):
+        if proceso.poll() is not None:
+            raise SystemExit(f"El servidor salió con código {proceso.returncode}")
+        try:
+            urllib.request.urlopen(base + "/", timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    proceso.kill()
+    raise SystemExit("El servidor de pruebas no levantó")
+
+
+def _comando(workers, hilos, puerto, pidfile):
+    if workers is None:
+        return [sys.executable, os.path.join(BENCH, "carga_http.py"), "--servir", os.environ["BENCH_DB"],
+                "--puerto", str(puerto)]
+    return arranque._comando_gunicorn() + [
+        "-c", os.path.join(RAIZ, "gunicorn.conf.py"),
+        "--pythonpath", BENCH,
+        "-b", f"127.0.0.1:{puerto}",
+        "-w", str(workers),
+        "--threads", str(hilos),
+        "-k", "gthread" if hilos > 1 else "sync",
+        "--pid", pidfile,
+        "escalamiento_workers:crear_app()",
+    ]
+
+
+def medir(workers, hilos, escala, args):
+    """Una corrida; workers=None es la línea base con hilos de werkzeug."""
+    puerto = carga_http._puerto_libre()
+    pidfile = os.path.join(os.path.dirname(os.path.abspath(args.db)), f"gunicorn-bench-{puerto}.pid")
+    servidor = subprocess.Popen(
+        _comando(workers, hilos, puerto, pidfile),
+        cwd=RAIZ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{puerto}"
+    try:
+        _esperar_servidor(base, servidor)
+        resultado = carga_http.correr(lambda: carga_http.ClienteHTTP(base), escala,
+                                      args.usuarios, args.duracion, args.semilla)
+    finally:
+        servidor.terminate()
+        servidor.wait(timeout=60)
+    return {
+        "servidor": "werkzeug (hilos)" if workers is None else f"gunicorn {workers}w x {hilos}h",
+        "workers": workers,
+        "hilos": hilos,
+        "total": resultado["total"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=os.path.join(RAIZ, "bench", "tmp", "gadget.db"))
+    parser.add_argument("--regenerar", action="store_true", help="Volver a generar la BD aunque exista.")
+    parser.add_argument("--productos", type=int, default=20000)
+    parser.add_argument("--ventas", type=int, default=20000)
+    parser.add_argument("--workers", default=None,
+                        help="Lista separada por comas (por defecto 1, 2, 4, ... hasta 2x CPUs).")
+    parser.add_argument("--hilos", type=int, default=1, help="Hilos por worker (gthread si > 1).")
+    parser.add_argument("--usuarios", type=int, default=32, help="Usuarios virtuales concurrentes.")
+    parser.add_argument("--duracion", type=float, default=15.0, help="Segundos medidos por corrida.")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--salida", help="Archivo JSON de resultados.")
+    args = parser.parse_args()
+
+    if not arranque.gunicorn_disponible():
+        raise SystemExit("gunicorn no está instalado (pip install -r requirements.txt; no corre en Windows)")
+
+    escala_path = args.db + ".escala.json"
+    if args.regenerar or not os.path.exists(args.db) or not os.path.exists(escala_path):
+        print(f"Generando datos sintéticos en {args.db} ...", file=sys.stderr)
+        escala = datos_sinteticos.generar(
+            args.db, args.productos, clientes=max(100, args.productos // 10), ventas=args.ventas,
+            semilla=args.semilla, log=lambda m: print(m, file=sys.stderr),
+        )
+        with open(escala_path, "w") as f:
+            json.dump(escala, f)
+    else:
+        with open(escala_path) as f:
+            escala = json.load(f)
+    os.environ["BENCH_DB"] = os.path.abspath(args.db)
+
+    if args.workers:
+        lista = [int(w) for w in args.workers.split(",")]
+    else:
+        lista, w = [], 1
+        while w <= 2 * arranque.cpus():
+            lista.append(w)
+            w *= 2
+
+    corridas = []
+    for workers in [None] + lista:
+        print(f"{'werkzeug' if workers is None else f'{workers} workers'}: "
+              f"{args.usuarios} usuarios, {args.duracion}s ...", file=sys.stderr)
+        corridas.append(medir(workers, args.hilos, escala, args))
+
+    base_rps = corridas[0]["total"]["rps"] or 1
+    print(f"\n{'servidor':28} {'rps':>8} {'x base':>7} {'p50 ms':>8} {'p95 ms':>8} {'errores':>8}")
+    for c in corridas:
+        t = c["total"]
+        print(f"{c['servidor']:28} {t['rps']:>8} {t['rps'] / base_rps:>7.2f} "
+              f"{t['p50_ms']:>8} {t['p95_ms']:>8} {t['errores']:>8}")
+
+    if args.salida:
+        os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({
+                "commit": carga_http._commit(),
+                "fecha": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "cpus": arranque.cpus(),
+                "escala": escala,
+                "corridas": corridas,
+            }, f, indent=2, ensure_ascii=False)
+        print(f"✔ Resultados en {args.salida}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""Comprueba el proxy de imágenes remotas contra un CDN falso local.
+
+Levanta un http.server que sirve una imagen con ETag y cuenta cuántas
+veces le piden cada cosa, y verifica:
+  - N hilos pidiendo la misma imagen fría -> una sola descarga;
+  - pasado el TTL se revalida con If-None-Match y el CDN contesta 304;
+  - si el CDN se cae se sigue sirviendo la copia en disco;
+  - el LRU en disco no pasa de max_bytes (y desaloja lo menos usado);
+  - sin PROXY_IMAGENES_PERMITIR_PRIVADAS no se conecta a loopback/red
+    interna ni sigue redirecciones fuera de http(s).
+
+Uso:
+    python bench/proxy_imagenes.py --hilos 32
+"""
+import argparse
+import hashlib
+import http.server
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.imagenes import Image  # noqa: E402
+from app.proxy_imagenes import (  # noqa: E402
+    CacheDisco, DestinoNoPermitido, ImagenRemotaNoDisponible, ProxyImagenes, direccion_publica, firmar, verificar, _b64,
+)
+
+
+def imagen_de_prueba(ancho=800, alto=600):
+    if Image is None:
+        return b"\xff\xd8\xff" + os.urandom(40_000)  # "JPEG" de relleno, sin Pillow no se redimensiona
+    buf = io.BytesIO()
+    Image.new("RGB", (ancho, alto), (200, 80, 30)).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+class CdnFalso(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ManejadorCdn)
+        self.cuerpo = imagen_de_prueba()
+        self.etag = '"' + hashlib.md5(self.cuerpo).hexdigest() + '"'
+        self.lock = threading.Lock()
+        self.cuenta = {"200": 0, "304": 0, "500": 0}
+        self.caido = False
+        self.demora = 0.2  # para que los hilos se encimen en la primera descarga
+
+    def contar(self, clave):
+        with self.lock:
+            self.cuenta[clave] += 1
+
+    def url(self, ruta):
+        return f"http://127.0.0.1:{self.server_address[1]}{ruta}"
+
+
+class ManejadorCdn(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cdn = self.server
+        if self.path.startswith("/redir-ftp"):
+            self.send_response(302)
+            self.send_header("Location", "ftp://127.0.0.1/img.jpg")
+            self.end_headers()
+            return
+        time.sleep(cdn.demora)
+        if cdn.caido:
+            cdn.contar("500")
+            self.send_error(500)
+            return
+        if self.headers.get("If-None-Match") == cdn.etag:
+            cdn.contar("304")
+            self.send_response(304)
+            self.send_header("ETag", cdn.etag)
+            self.end_headers()
+            return
+        cdn.contar("200")
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(cdn.cuerpo)))
+        self.send_header("ETag", cdn.etag)
+        self.end_headers()
+        self.wfile.write(cdn.cuerpo)
+
+
+def verificar_condicion(nombre, ok, detalle=""):
+    print(f"  [{'OK' if ok else 'FALLA'}] {nombre}{(' - ' + detalle) if detalle else ''}")
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--hilos", type=int, default=32)
+    args = ap.parse_args()
+
+    cdn = CdnFalso()
+    threading.Thread(target=cdn.serve_forever, daemon=True).start()
+    todo_ok = True
+
+    with tempfile.TemporaryDirectory() as tmp:
+        proxy = ProxyImagenes(CacheDisco(tmp, 50 * 1024 * 1024), ttl=0.5, timeout=5.0, anchos=(160, 320),
+                              permitir_privadas=True)  # el CDN falso está en 127.0.0.1
+        url = cdn.url("/img/gadget.jpg")
+
+        print("firma:")
+        f = firmar(url, "secreto")
+        todo_ok &= verificar_condicion("URL firmada se acepta", verificar(f, _b64(url), "secreto") == url)
+        todo_ok &= verificar_condicion("firma alterada se rechaza", verificar("0" * 20, _b64(url), "secreto") is None)
+
+        print(f"single-flight ({args.hilos} hilos, cache frío):")
+        barrera = threading.Barrier(args.hilos)
+        errores = []
+
+        def pedir():
+            barrera.wait()
+            try:
+                proxy.original(url)
+            except Exception as e:  # noqa: BLE001
+                errores.append(e)
+
+        hilos = [threading.Thread(target=pedir) for _ in range(args.hilos)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        todo_ok &= verificar_condicion("una sola descarga al CDN", cdn.cuenta["200"] == 1 and not errores,
+                                       f"200={cdn.cuenta['200']} compartidas={proxy.compartidas} errores={len(errores)}")
+
+        antes = dict(cdn.cuenta)
+        proxy.original(url)
+        todo_ok &= verificar_condicion("dentro del TTL no se toca el CDN", cdn.cuenta == antes)
+
+        if Image is not None:
+            meta, _ = proxy.variante(url, 320, webp=True)
+            todo_ok &= verificar_condicion("variante 320w en WebP", meta["tipo"] == "image/webp",
+                                           f"{meta['bytes']} bytes vs {len(cdn.cuerpo)} del original")
+
+        print("revalidación:")
+        time.sleep(0.6)
+        meta, _ = proxy.original(url)
+        todo_ok &= verificar_condicion("pasado el TTL -> 304 sin volver a bajar",
+                                       cdn.cuenta["304"] == 1 and cdn.cuenta["200"] == 1, str(cdn.cuenta))
+
+        print("CDN caído:")
+        cdn.caido = True
+        time.sleep(0.6)
+        try:
+            _, ruta = proxy.original(url)
+            with open(ruta, "rb") as fh:
+                vieja = fh.read() == cdn.cuerpo
+        except ImagenRemotaNoDisponible:
+            vieja = False
+        todo_ok &= verificar_condicion("se sirve la copia vieja", vieja, f"viejas_servidas={proxy.viejas_servidas}")
+        try:
+            proxy.original(cdn.url("/img/nunca-vista.jpg"))
+            sin_copia = False
+        except ImagenRemotaNoDisponible:
+            sin_copia = True
+        todo_ok &= verificar_condicion("sin copia previa -> ImagenRemotaNoDisponible", sin_copia)
+        cdn.caido = False
+
+    print("LRU en disco:")
+    cdn.demora = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        limite = len(cdn.cuerpo) * 5 + 1
+        proxy = ProxyImagenes(CacheDisco(tmp, limite), ttl=3600, permitir_privadas=True)
+        for i in range(12):
+            proxy.original(cdn.url(f"/img/{i}.jpg"))
+            time.sleep(0.01)  # mtimes distintos
+        proxy.original(cdn.url("/img/11.jpg"))
+        total = proxy.cache._tamano_total()
+        todo_ok &= verificar_condicion("el disco no pasa de max_bytes", total <= limite,
+                                       f"{total} <= {limite}, desalojos={proxy.cache.desalojos}")
+        descargas = proxy.descargas
+        proxy.original(cdn.url("/img/11.jpg"))
+        proxy.original(cdn.url("/img/0.jpg"))
+        todo_ok &= verificar_condicion("lo reciente sigue, lo viejo se desalojó", proxy.descargas == descargas + 1)
+
+    print("solo direcciones públicas:")
+    privadas = ("127.0.0.1", "10.1.2.3", "192.168.0.10", "169.254.169.254", "100.64.0.1", "::1",
+                "::ffff:127.0.0.1", "fe80::1%eth0", "fd00::1", "0.0.0.0", "224.0.0.1")
+    todo_ok &= verificar_condicion("loopback, privadas, link-local y CGNAT no son públicas",
+                                   not any(direccion_publica(ip) for ip in privadas))
+    todo_ok &= verificar_condicion("8.8.8.8 y 2606:4700:4700::1111 sí",
+                                   direccion_publica("8.8.8.8") and direccion_publica("2606:4700:4700::1111"))
+    with tempfile.TemporaryDirectory() as tmp:
+        proxy = ProxyImagenes(CacheDisco(tmp, 1024 * 1024), ttl=3600)
+        antes = dict(cdn.cuenta)
+        for nombre, url in (("127.0.0.1", cdn.url("/img/ssrf.jpg")),
+                            ("localhost", cdn.url("/img/ssrf.jpg").replace("127.0.0.1", "localhost"))):
+            try:
+                proxy.original(url)
+                rechazada = False
+            except DestinoNoPermitido:
+                rechazada = True
+            todo_ok &= verificar_condicion(f"{nombre} se rechaza sin mandar el request",
+                                           rechazada and cdn.cuenta == antes, str(cdn.cuenta))
+        proxy = ProxyImagenes(CacheDisco(tmp, 1024 * 1024), ttl=3600, permitir_privadas=True)
+        try:
+            proxy.original(cdn.url("/redir-ftp"))
+            rechazada = False
+        except DestinoNoPermitido:
+            rechazada = True
+        todo_ok &= verificar_condicion("redirección a ftp:// se rechaza", rechazada)
+
+    cdn.shutdown()
+    print("\nTodo bien." if todo_ok else "\nHubo fallas.")
+    sys.exit(0 if todo_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""El login solo rehashea cuando el método configurado cambió de verdad.
+
+Werkzeug guarda el prefijo con los parámetros explícitos ("scrypt:32768:8:1",
+"pbkdf2:sha256:600000"); AUTH_HASH_METODO puede venir sin ellos ("scrypt",
+"pbkdf2:sha256"). Verifica que requiere_rehash() compare ambos lados
+normalizados y que, con un método sin parámetros, varios logins seguidos
+escriban el hash nuevo una sola vez.
+
+Uso:
+    python bench/rehash_auth.py
+    python bench/rehash_auth.py --logins 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+import carga_http  # noqa: E402
+import datos_sinteticos  # noqa: E402
+
+from app.auth import ServicioAuth  # noqa: E402
+
+# (método configurado, método con el que se generó el hash guardado, ¿rehash?)
+CASOS = [
+    ("scrypt", "scrypt", False),
+    ("scrypt", "scrypt:32768:8:1", False),
+    ("scrypt:32768:8:1", "scrypt", False),
+    ("scrypt:16384:8:1", "scrypt", True),
+    ("pbkdf2:sha256", "pbkdf2:sha256", False),
+    ("pbkdf2", "pbkdf2:sha256", False),
+    ("pbkdf2:sha256:1000", "pbkdf2:sha256:1000", False),
+    ("pbkdf2:sha256", "pbkdf2:sha256:1000", True),
+    ("scrypt", "pbkdf2:sha256:1000", True),
+]
+
+
+def casos():
+    fallas = 0
+    for configurado, guardado, esperado in CASOS:
+        servicio = ServicioAuth(configurado, None, None)
+        obtenido = servicio.requiere_rehash(generate_password_hash("x", guardado))
+        ok = obtenido == esperado
+        fallas += 0 if ok else 1
+        print(f"{'OK   ' if ok else 'FALLA'} AUTH_HASH_METODO={configurado!r:22} guardado con {guardado!r:22} "
+              f"rehash={obtenido}")
+    return fallas
+
+
+def logins(metodo, veces):
+    """Staff sintético con pbkdf2:sha256:1000 y la app configurada con `metodo`."""
+    from app import create_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        staff = os.path.join(tmp, "empleados.db")
+        datos_sinteticos._crear_staff(staff)
+        app = create_app({**carga_http.config_bench(os.path.join(tmp, "gadget.db")), "AUTH_HASH_METODO": metodo})
+        cliente = app.test_client()
+        for _ in range(veces):
+            cliente.post("/admin/login", data={"usuario": "bench_admin",
+                                               "contraseña": datos_sinteticos.BENCH_PASSWORD})
+        rehashes = app.extensions["auth"].rehashes
+        for pool in app.extensions["sqlite_pools"].values():
+            pool.cerrar()
+    ok = rehashes == 1
+    print(f"{'OK   ' if ok else 'FALLA'} {veces} logins con AUTH_HASH_METODO={metodo!r}: {rehashes} rehash(es)")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=3)
+    args = parser.parse_args()
+
+    fallas = casos()
+    fallas += logins("scrypt", args.logins)
+    fallas += logins("pbkdf2:sha256", args.logins)
+    if fallas:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,159 @@
 import os
+import secrets
+import time
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
+
+def secreto_local(directorio, nombre):
+    """Secreto aleatorio de esta instalación (<directorio>/.secreto-<nombre>, fuera de git).
+
+    Se crea la primera vez y después se reutiliza: los reinicios y todos
+    los workers firman con el mismo. Para fijarlo, usar la variable de
+    entorno correspondiente.
+    """
+    ruta = os.path.join(directorio, f".secreto-{nombre}")
+    os.makedirs(directorio, exist_ok=True)
+    try:
+        fd = os.open(ruta, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        for _ in range(100):
+            with open(ruta, encoding="ascii") as f:
+                valor = f.read().strip()
+            if valor:
+                return valor
+            time.sleep(0.01)  # otro proceso lo acaba de crear y lo está escribiendo
+        raise RuntimeError(f"{ruta} está vacío; bórralo para generar otro")
+    valor = secrets.token_hex(32)
+    with os.fdopen(fd, "w", encoding="ascii") as f:
+        f.write(valor)
+    return valor
+
+
 class Config:
-    SECRET_KEY = "claveadmin"
+    # firma la sesión y los cursores de /productos; None = secreto_local() en database/
+    SECRET_KEY = os.getenv("SECRET_KEY")
 
     DATABASE = os.path.join(BASE_DIR, "database", "gadget.db")
+    STAFF_DATABASE = os.path.join(BASE_DIR, "database", "empleados.db")
+
+    # Pool de conexiones SQLite (ver app/db.py)
+    DB_POOL_SIZE = 8               # mínimo; se sube a SERVIDOR_HILOS si hay más hilos por worker
+    DB_POOL_TIMEOUT = 5.0
+    DB_POOL_RETRY_AFTER = 1        # segundos en el Retry-After del 503 cuando el pool se agota
+    DB_BUSY_TIMEOUT_MS = 5000
+    DB_MMAP_SIZE = 64 * 1024 * 1024
+    DB_CACHE_SIZE_KB = 16 * 1024
+
+    # Cache del catálogo en memoria (ver app/catalogo.py)
+    CATALOGO_CACHE_MAX = 256
+    CATALOGO_SUGERENCIAS_MAX = 128   # LRU propio: cada tecla del autocompletado es una clave
+    CATALOGO_CACHE_TTL = 300.0
+    CATALOGO_VERSION_TTL = 2.0
+
+    # Listado /productos (ver app/paginacion.py)
+    PRODUCTOS_POR_PAGINA = 24
+    PRODUCTOS_STREAMING = False
+
+    # Dashboard de admin (ver app/resumenes.py)
+    DASHBOARD_CACHE_TTL = 15.0
+    STOCK_BAJO_UMBRAL = 5
+
+    # Login del staff (ver app/auth.py)
+    AUTH_HASH_METODO = os.getenv("AUTH_HASH_METODO", "scrypt:32768:8:1")
+    AUTH_HASH_HILOS = 2
+    AUTH_HASH_COLA = 16
+    AUTH_HASH_TIMEOUT = 10.0
+    AUTH_INTENTOS_MAX = 5
+    AUTH_INTENTOS_VENTANA = 300.0
+
+    # Métricas Prometheus en /metrics (ver app/metricas.py)
+    METRICAS_HABILITADAS = True
+    # compartido entre workers: cada proceso vuelca ahí y /metrics suma todos (None = solo este proceso)
+    METRICAS_DIR = os.getenv("METRICAS_DIR") or os.path.join(BASE_DIR, "database", "metricas")
+    METRICAS_VOLCADO_S = 5.0
+    # con token, /metrics pide "Authorization: Bearer <token>"; sin él, solo
+    # desde la misma máquina (sin proxy de por medio), staff o en modo debug
+    METRICAS_TOKEN = os.getenv("METRICAS_TOKEN")
+    METRICAS_BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    METRICAS_BUCKETS_BYTES = (512, 2048, 8192, 32768, 131072, 524288, 2097152)
+
+    # Perfilador de SQL por request (ver app/perfilador.py)
+    PERFILADOR_HABILITADO = os.getenv("PERFILADOR") == "1"
+    PERFILADOR_LENTA_MS = 100.0
+    PERFILADOR_REPETIDAS = 5       # misma consulta N veces en un request = sospecha de N+1
+    PERFILADOR_MAX_REGISTROS = 1000
+    PERFILADOR_HEADER = True       # X-Consultas + Server-Timing
+    PERFILADOR_PANEL = False       # panel HTML también sin app.debug
+
+    # Miniaturas de productos (ver app/imagenes.py; requiere Pillow)
+    IMAGENES_HABILITADAS = True
+    IMAGENES_DIR = "img/v"                      # dentro de app/static
+    IMAGENES_ANCHOS = (160, 320, 640)
+    IMAGENES_FORMATOS = ("webp", "jpeg")        # agregar "avif" si el Pillow instalado lo soporta
+    IMAGENES_CALIDAD = 80
+    IMAGENES_MAX_BYTES = 10 * 1024 * 1024
+    # tope del cuerpo de cualquier request (Flask responde 413): una imagen + campos del formulario
+    MAX_CONTENT_LENGTH = IMAGENES_MAX_BYTES + 1024 * 1024
+
+    # Proxy de imágenes remotas con cache en disco (ver app/proxy_imagenes.py)
+    PROXY_IMAGENES_HABILITADO = True
+    PROXY_IMAGENES_SECRETO = os.getenv("PROXY_IMAGENES_SECRETO")  # None = secreto_local() en database/
+    PROXY_IMAGENES_PERMITIR_PRIVADAS = False     # True solo para probar contra un CDN en la red local
+    PROXY_IMAGENES_DIR = os.path.join(BASE_DIR, "database", "cache_imagenes")
+    PROXY_IMAGENES_MAX_BYTES = 256 * 1024 * 1024
+    PROXY_IMAGENES_TTL = 24 * 3600.0             # después se revalida con ETag/Last-Modified
+    PROXY_IMAGENES_TIMEOUT = 5.0
+    PROXY_IMAGENES_MAX_AGE = 7 * 24 * 3600       # Cache-Control hacia el navegador
+
+    # Estáticos con huella y precomprimidos (ver app/estaticos.py; flask compilar-estaticos)
+    ESTATICOS_HUELLA = True
+    ESTATICOS_DIR = "dist"                                   # dentro de app/static
+    ESTATICOS_PATRONES = ("css/*", "js/*", "img/logos/*")
+    ESTATICOS_COMPRIMIR = (".css", ".js", ".json", ".svg", ".ico", ".txt")
+    ESTATICOS_MAX_AGE = 365 * 24 * 3600
+    ESTATICOS_BUILDS_CONSERVAR = 3                           # builds cuyos archivos quedan en dist/...
+    ESTATICOS_CONSERVAR_S = 7 * 24 * 3600                    # ...y los más viejos, hasta esta edad
+
+    # GET condicional (ETag/Last-Modified) en páginas públicas (ver app/condicional.py)
+    CONDICIONAL_HABILITADO = True
+
+    # Cache de fragmentos renderizados (ver app/fragmentos.py)
+    FRAGMENTOS_HABILITADOS = True
+    FRAGMENTOS_MAX_BYTES = 8 * 1024 * 1024        # LRU en memoria, por worker
+    FRAGMENTOS_DIR = os.getenv("FRAGMENTOS_DIR")   # segundo nivel en disco compartido; None = solo memoria
+    FRAGMENTOS_DISCO_MAX_BYTES = 64 * 1024 * 1024
+
+    # Agenda de citas para probar productos (ver app/agenda.py)
+    CITAS_SUCURSALES = ("Centro", "Polanco", "Satélite")
+    CITAS_ZONA_HORARIA = "America/Mexico_City"
+    CITAS_DURACION_MIN = 60
+    CITAS_INTERVALO_MIN = 60          # cada cuánto empieza un horario
+    CITAS_ANTICIPACION_MIN = 60       # no se agenda para dentro de menos de esto
+    CITAS_DIAS_MAX = 30
+    CITAS_MAX_PRODUCTOS = 3
+    CITAS_ROLES = ("empleado", "cajero", "gerente")   # quién atiende si no hay turnos en horarios_empleado
+    # lunes=0 ... domingo=6, hora local (mismo horario que muestra citas.html)
+    CITAS_HORARIO_TIENDA = {
+        0: ("10:00", "20:00"), 1: ("10:00", "20:00"), 2: ("10:00", "20:00"),
+        3: ("10:00", "20:00"), 4: ("10:00", "20:00"),
+        5: ("10:00", "18:00"), 6: ("11:00", "17:00"),
+    }
+    CITAS_CACHE_MAX = 256             # días (sucursal, fecha) en memoria
+    CITAS_CACHE_S = 30                # Cache-Control del JSON de disponibilidad
+
+    # Inventario por sucursal (ver app/inventario.py)
+    INVENTARIO_SUCURSALES = CITAS_SUCURSALES
+    INVENTARIO_SUCURSAL_ALTA = "Centro"   # a dónde entra el stock inicial de un producto nuevo
+
+    # Servidor de producción (ver gunicorn.conf.py y app/arranque.py)
+    SERVIDOR_BIND = os.getenv("SERVIDOR_BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+    SERVIDOR_WORKERS = int(os.getenv("WEB_CONCURRENCY", "0"))   # 0 = uno por CPU disponible
+    SERVIDOR_HILOS = int(os.getenv("SERVIDOR_HILOS", "1"))       # >1: workers gthread
+    SERVIDOR_MAX_REQUESTS = 2000          # cada worker se recicla tras esto para contener la memoria
+    SERVIDOR_MAX_REQUESTS_JITTER = 200    # ... +/- esto, para que no se reinicien todos a la vez
+    SERVIDOR_TIMEOUT = 30
+    SERVIDOR_GRACEFUL_TIMEOUT = 30        # lo que tiene un worker que se retira para terminar lo que atiende
+    SERVIDOR_KEEPALIVE = 5
+    SERVIDOR_PIDFILE = os.getenv("SERVIDOR_PIDFILE", os.path.join(BASE_DIR, "database", "gunicorn.pid"))
+    SERVIDOR_CALENTAR = True              # snapshot del catálogo + PRAGMA optimize en el maestro
@@ -1,9 +1,10 @@
 import os
 import sqlite3
 import random
+import sys
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-DB_PATH = os.path.join(BASE_DIR, "gadget.db")
+sys.path.insert(0, os.path.dirname(BASE_DIR))  # para importar app/ desde database/
 
 
 productos = [
@@ -263,46 +264,40 @@ productos = [
   
 
 def main():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
+    # El catálogo se sincroniza (solo cambia lo que cambió, sin DELETE) y el
+    # inventario solo se inventa para pares producto/sucursal que no existan:
+    # correr el seed otra vez ya no borra existencias ni ventas.
+    from app import create_app
+    from app.sincronizacion import sincronizar
 
-    cur.execute("DELETE FROM inventario;")
-    cur.execute("DELETE FROM productos;")
-    # Insertar / actualizar productos
-    for p in productos:
-        
-        cur.execute("""
-            INSERT OR REPLACE INTO productos
-            (id, nombre, marca, tipo, color, almacenamiento, precio,
-             descripcion, url_imagen, disponible)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            p["id"],
-            p["nombre"],
-            p["marca"],
-            p["tipo"],
-            p.get("color"),
-            p.get("almacenamiento"),
-            float(p["precio"]),
-            p["descripcion"],
-            p["url_imagen"],
-            1 if p.get("disponible", True) else 0
-        ))
+    app = create_app()
+    with app.app_context():
+        resumen = sincronizar(app.config["DATABASE"], productos)
+        print(
+            f"Catálogo: +{resumen.total_nuevos} nuevos, ~{resumen.total_actualizados} actualizados, "
+            f"-{resumen.total_bajas} bajas, {resumen.sin_cambio} sin cambio."
+        )
 
-    # Inventario inventado
-    sucursales = ["Centro", "Polanco", "Satélite"]
-    for p in productos:
-        for sucursal in sucursales:
-            stock = random.randint(0, 30)
-            cur.execute("""
-                INSERT INTO inventario (producto_id, sucursal, stock)
-                VALUES (?, ?, ?)
-            """, (p["id"], sucursal, stock))
+        conn = sqlite3.connect(app.config["DATABASE"])
+        cur = conn.cursor()
 
-    conn.commit()
-    conn.close()
-    print("Productos e inventario cargados.")
+        # Inventario inventado (solo lo que falte)
+        sucursales = ["Centro", "Polanco", "Satélite"]
+        existentes = set(cur.execute("SELECT producto_id, sucursal FROM inventario").fetchall())
+        nuevos = [
+            (p["id"], sucursal, random.randint(0, 30))
+            for p in productos
+            for sucursal in sucursales
+            if (p["id"], sucursal) not in existentes
+        ]
+        cur.executemany("""
+            INSERT INTO inventario (producto_id, sucursal, stock)
+            VALUES (?, ?, ?)
+        """, nuevos)
+
+        conn.commit()
+        conn.close()
+    print(f"Inventario: {len(nuevos)} registros nuevos.")
 
 if __name__ == "__main__":
     main() 
@@ -0,0 +1,37 @@
+# =========================================================
+# GUNICORN (producción)
+#   gunicorn -c gunicorn.conf.py        (lo mismo que: python run.py)
+# Los valores salen de config.py (SERVIDOR_*); el trabajo de una sola
+# vez y las recargas están en app/arranque.py.
+# =========================================================
+from app import arranque
+from config import Config
+
+wsgi_app = "run:app"
+preload_app = True  # create_app() una vez en el maestro; los workers heredan por fork
+
+bind = Config.SERVIDOR_BIND
+workers = arranque.num_workers(Config.SERVIDOR_WORKERS)
+threads = Config.SERVIDOR_HILOS
+worker_class = "gthread" if threads > 1 else "sync"
+
+max_requests = Config.SERVIDOR_MAX_REQUESTS
+max_requests_jitter = Config.SERVIDOR_MAX_REQUESTS_JITTER
+timeout = Config.SERVIDOR_TIMEOUT
+graceful_timeout = Config.SERVIDOR_GRACEFUL_TIMEOUT
+keepalive = Config.SERVIDOR_KEEPALIVE
+pidfile = Config.SERVIDOR_PIDFILE
+
+
+def when_ready(server):
+    # antes del primer fork: calentar caches y soltar las conexiones SQLite
+    arranque.preparar_maestro(server.app.wsgi(), log=server.log.info)
+
+
+def on_reload(server):
+    # HUP: con preload el código no cambia, pero los workers nuevos arrancan con caches al día
+    arranque.preparar_maestro(server.app.wsgi(), log=server.log.info)
+
+
+def worker_exit(server, worker):
+    arranque.al_salir_worker(worker.app.wsgi())
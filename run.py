@@ -1,8 +1,12 @@
-from app import create_app
+import sys
 
-# Crea la aplicación usando la fábrica
-app = create_app()
+from app import create_app
 
 if __name__ == '__main__':
-    # Ejecuta el servidor en modo debug
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    # python run.py        -> gunicorn (gunicorn.conf.py) o servidor con hilos si no hay gunicorn
+    # python run.py --dev  -> servidor de desarrollo con debug y reloader
+    from app.arranque import lanzar
+    lanzar(sys.argv[1:])
+else:
+    # gunicorn "run:app", flask --app run.py, WSGI de PythonAnywhere
+    app = create_app()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# raíz del repo (paquete app) y bench/ (escenarios de concurrencia reutilizados por las pruebas)
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "bench"))
@@ -0,0 +1,49 @@
+"""Atomicidad bajo concurrencia: sin sobreventa, sin citas encimadas y
+con el inventario cuadrado. Usa los mismos escenarios que bench/concurrencia_*.py,
+con menos hilos y operaciones para que la corrida sea corta."""
+import pytest
+
+import concurrencia_checkout
+import concurrencia_citas
+import concurrencia_inventario
+
+HILOS = 12
+
+
+@pytest.mark.parametrize("stock, piezas", [
+    ([("Centro", 1), ("Polanco", 0)], 1),                   # última pieza en una sucursal
+    ([("Centro", 1), ("Polanco", 1), ("Satélite", 1)], 2),  # piezas repartidas, compras de 2
+])
+def test_checkout_no_sobrevende(stock, piezas):
+    total = sum(n for _, n in stock)
+    esperados = total // piezas
+
+    r = concurrencia_checkout.ronda(HILOS, stock, piezas)
+
+    assert r["errores"] == []
+    assert r["ganadores"] == r["ventas"] == esperados
+    assert r["rechazados"] == HILOS - esperados
+    assert r["stock_minimo"] >= 0
+    assert r["stock_final"] == total - esperados * piezas
+    assert r["piezas_vendidas"] == r["piezas_descontadas"] == esperados * piezas
+
+
+@pytest.mark.parametrize("empleados", [1, 3])
+def test_citas_no_se_enciman(empleados):
+    r = concurrencia_citas.ronda(HILOS, empleados)
+
+    assert r["errores"] == []
+    assert r["ganadores"] == r["citas"] == empleados
+    assert r["rechazados"] == HILOS - empleados
+    assert r["encimadas"] == 0
+    assert r["libres_10h"] == 0
+
+
+def test_inventario_cuadra_con_traspasos_y_ventas():
+    r = concurrencia_inventario.ronda(8, 40, 20)
+
+    assert r["errores"] == []
+    assert r["distintos"] == 0, "resumen_stock no coincide con la suma por sucursal"
+    assert r["negativos"] == 0
+    assert r["total_ok"], "stock_total != inicial - vendidas"
+    assert r["registro_ok"], "registro_inventario no explica el cambio de stock"